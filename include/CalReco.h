@@ -9,16 +9,23 @@
     the their estimated noise thresholds <br>
     Dead channels are remapped to mirror the channel on the opposing side. 
     Except in the special case of laser runs in July/Aug 2014.  In this case
-    channels are left as is, but the TBRecHit::kMonitor bit is set.  
+    channels are left as is, but the TBRecHit::kMonitor bit is set.  <br>
+    With nThreads>1 blocks of events are read in the main thread, the pulse
+    fits of each block are split in event ranges over nThreads threads, and 
+    the hits are filled in event order.  The output is the same as for 
+    nThreads=1.  Threads need the template fit (PadeChannel::SetTemplateFit),
+    w/ the MINUIT fit the events are reconstructed in the main thread.
 **/
 class CalReco{
  public:
- CalReco(float nSigmaCut=0) : _nSigmaCut(nSigmaCut) {;}
+ CalReco(float nSigmaCut=0, int nThreads=1) : _nSigmaCut(nSigmaCut), _nThreads(nThreads) {;}
+  void SetNThreads(int nThreads) {_nThreads=nThreads;}
   int Process(TTree *rawTree, TTree *recTree);
+  static const int EVENTS_PER_THREAD=50;  ///< events per thread in a block
  private:
   float _nSigmaCut;
+  int _nThreads;
 };
 
 
 #endif
-
@@ -20,31 +20,71 @@ class PadeChannel : public TObject {
   void Reset();
   void Dump() const;
 
+  /// Read only view of the wave form samples, valid as long as the channel
+  struct WformView {
+    const UShort_t *data;  ///< first sample
+    Int_t size;            ///< # of samples
+    UShort_t operator[](Int_t i) const {return data[i];}
+    const UShort_t* begin() const {return data;}
+    const UShort_t* end() const {return data+size;}
+  };
+
   // getters
-  ULong64_t GetTimeStamp() {return _ts;}  ///< C# time in pade channel data
-  UInt_t GetEventNum() {return _eventnum;}
-  UInt_t GetBoardID() {return _board_id;}
-  UInt_t GetChannelNum() {return _ch_number;}
-  UInt_t GetChannelID() {return _board_id*100+_ch_number;}
-  Int_t GetChannelIndex();  ///< index 0--127, following Ledovskoy convention
+  ULong64_t GetTimeStamp() const {return _ts;}  ///< C# time in pade channel data
+  UInt_t GetEventNum() const {return _eventnum;}
+  UInt_t GetBoardID() const {return _board_id;}
+  UInt_t GetChannelNum() const {return _ch_number;}
+  UInt_t GetChannelID() const {return _board_id*100+_ch_number;}
+  Int_t GetChannelIndex() const;  ///< index 0--127, following Ledovskoy convention
   UShort_t* GetWform() {return _wform;}
-  UInt_t GetMax() {return _max;}  ///< NOT PEDESTAL Subtracted!
-  float GetMaxCalib();            ///< PEDESTAL Subtracted!
-  Int_t GetPeak() {return _peak;}
+  const UShort_t* GetWform() const {return _wform;}
+  /// the N_PADE_SAMPLES samples w/o a copy
+  WformView GetWformView() const {WformView v={_wform,N_PADE_SAMPLES}; return v;}
+  UInt_t GetMax() const {return _max;}  ///< NOT PEDESTAL Subtracted!
+  float GetMaxCalib() const;            ///< PEDESTAL Subtracted!
+  Int_t GetPeak() const {return _peak;}
   Int_t __SAMPLES() const {return N_PADE_SAMPLES;}
   Int_t __DATASIZE() const {return N_PADE_DATA;}
-  void GetXYZ(double &x, double &y, double &z);
+  void GetXYZ(double &x, double &y, double &z) const;
   /// Return pedesdal and its sigma.  
   /** This method does the calculation.  The first 10 wave form samples are used.**/
-  void GetPedestal(double &ped, double &stdev);
-  Double_t GetPedestal() {return _ped;}
-  Double_t GetPedSigma() {return _pedsigma;}
-  Double_t GetAmplitude() {return _max-_ped;}
-  void GetHist(TH1F* h);
-  TH1F* MakeHist();
-  Bool_t LaserData(){return _status & kLaser;}
-  static PulseFit FitPulse(PadeChannel *pc);
-  TF1 FitPulseFunc(PadeChannel *pc);
+  void GetPedestal(double &ped, double &stdev) const;
+  /// pedestal and sigma of a wave form, as GetPedestal
+  static void GetPedestal(const UShort_t *wform, double &ped, double &stdev);
+  /// max sample and its position in the signal region, as in Fill
+  static void GetMax(const UShort_t *wform, UInt_t &max, Int_t &peak);
+  Double_t GetPedestal() const {return _ped;}
+  Double_t GetPedSigma() const {return _pedsigma;}
+  Double_t GetAmplitude() const {return _max-_ped;}
+  void GetHist(TH1F* h) const;
+  TH1F* MakeHist() const;
+  Bool_t LaserData() const {return _status & kLaser;}
+  /// Fit of the pulse, FitPulseMinuit or FitPulseTemplate after SetTemplateFit(kTRUE)
+  static PulseFit FitPulse(const PadeChannel *pc);
+  /// Template fit of the pulse, see PulseFitter
+  /** Not thread-safe: result.func is copied from a TF1 per pulse shape, shared by
+      all calls.  In threads use a PulseFitter per thread (see WaveReco).<br>
+      par[0] of result.func is the pedestal of the peak fit (PulseFitter::PeakPedestal).<br>
+      result.status: 0 ok, 4 too few non-zero samples, -1 no fit (no template) **/
+  static PulseFit FitPulseTemplate(const PadeChannel *pc);
+  /// Fit w/ TH1::Fit and MINUIT, the default of FitPulse
+  /** result.status is the status of TH1::Fit **/
+  static PulseFit FitPulseMinuit(const PadeChannel *pc);
+  /// MINUIT fit of a wave form w/ pulse shape (PulseShapeID), result.pedestal and result.noise must be set
+  /** Not thread-safe, TH1::Fit and the TF1s are shared by all calls **/
+  static void FitPulseMinuit(const UShort_t *wform, Int_t nsamples, Int_t shape, PulseFit &result);
+  /// Use the template fit in FitPulse and WaveReco (CalReco), default is MINUIT
+  /** Keep MINUIT for production until validatePulseFit.C agrees on a run of each
+      pulse shape epoch.  Only w/ the template fit CalReco runs the fits in threads. **/
+  static void SetTemplateFit(Bool_t templateFit) {_templateFit=templateFit;}
+  static Bool_t TemplateFit() {return _templateFit;}
+  /// pulse shape (PulseShapeID) of a channel, from the table of epoch x ShapeClass
+  static Int_t PulseShape(ULong64_t ts, Int_t channelIndex, Bool_t laser);
+  /// pulse shape epoch of a time stamp, 0..N_SHAPE_EPOCHS-1 (TBEvent::PULSESHAPE_T1..T4)
+  static Int_t ShapeEpoch(ULong64_t ts);
+  /// ShapeClass of a channel
+  static Int_t ShapeClass(Int_t channelIndex, Bool_t laser);
+  TF1 FitPulseFunc(const PadeChannel *pc);
   int GetPorch(ULong64_t ts=0) const;
   void SetAsLaser();
 
@@ -52,6 +92,16 @@ class PadeChannel : public TObject {
   static const Int_t N_PADE_PORCH=15;     ///< diagnostic info in data payload
   static Int_t N_PADE_SAMPLES;
   static const Int_t PADE_PED_SAMPLES=20;
+  static const Int_t N_SHAPE_EPOCHS=5;    ///< periods w/ different pulse shapes
+
+  /// Channels w/ different pulse shapes
+  enum ShapeClasses {
+    kShapeRegular=0,   ///< beam data
+    kShapeOdd,         ///< beam data, channels 2,3,6,7 of board 3
+    kShapeLaser,       ///< laser data
+    kShapeLaserOdd,    ///< laser data, channels 2,3,6,7 of board 3
+    kNShapeClasses
+  };
 
   /// PadeChannel flags
   enum Flags {
@@ -74,6 +124,8 @@ class PadeChannel : public TObject {
   Float_t       _pedsigma;
   Int_t         _peak;   // sample number for peak
   UShort_t      _status;
+ private:
+  static Bool_t _templateFit;  ///< fit w/ PulseFitter instead of MINUIT
 };
 
 
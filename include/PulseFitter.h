@@ -0,0 +1,102 @@
+#ifndef PULSEFITTER_H
+#define PULSEFITTER_H
+
+#include "PadeChannel.h"
+#include "pulseShapeForFit.h"
+#include <vector>
+
+/// Pulse shape tabulated for constant time lookup
+/** Built from the (x,y) tables in pulseShapeForFit.cc.  The shape is the
+    linear interpolation of the table, as in funcPulseA...  A fine uniform
+    grid maps x to its table segment, evaluation is one lookup and one
+    multiply-add.  Outside the table range the shape is 0.
+**/
+class PulseTemplate {
+ public:
+  PulseTemplate(int shape=kPulseShapeB, int nstep=64);
+  int Shape() const {return _shape;}
+  double Eval(double x) const;
+  void Eval(double x, double &y, double &dydx) const;  ///< value and slope at x
+  /// shared template of a pulse shape, all are built when the library is loaded
+  static const PulseTemplate* Get(int shape);
+ private:
+  int Segment(double x) const;
+
+  int _shape;
+  double _xmin;
+  double _xmax;
+  double _scale;              ///< grid points per sample
+  std::vector<int> _seg;      ///< table segment at _xmin + i/_scale
+  std::vector<double> _x;     ///< table
+  std::vector<double> _y;
+  std::vector<double> _slope; ///< slope of segment i
+};
+
+inline int PulseTemplate::Segment(double x) const{
+  if ( x<_xmin || x>=_xmax ) return -1;
+  int i=_seg[(int)((x-_xmin)*_scale)];
+  while ( x>=_x[i+1] ) i++;
+  return i;
+}
+
+inline double PulseTemplate::Eval(double x) const{
+  int i=Segment(x);
+  if (i<0) return 0;
+  return _y[i]+(x-_x[i])*_slope[i];
+}
+
+inline void PulseTemplate::Eval(double x, double &y, double &dydx) const{
+  int i=Segment(x);
+  if (i<0) {
+    y=0;
+    dydx=0;
+    return;
+  }
+  dydx=_slope[i];
+  y=_y[i]+(x-_x[i])*dydx;
+}
+
+
+/// Fast template fit of a PADE wave form
+/** Fits pedestal + aMax * shape(x - tRise), as PadeChannel::FitPulseMinuit
+    does w/ TH1::Fit(..."BQW"), ie. unit weights for non-zero samples and
+    the same parameter limits and fit ranges.<br>
+    For a fixed tRise the model is linear in pedestal and aMax, these are
+    solved in closed form.  chi2(tRise) is scanned over the tRise range
+    and the minimum refined w/ Newton steps.  Errors are from the
+    covariance matrix of the 3 parameters at the minimum, as MINUIT's
+    parabolic errors.<br>
+    The fitter only keeps the samples of the current fit, use one
+    PulseFitter per thread.
+**/
+class PulseFitter {
+ public:
+  PulseFitter(const PulseTemplate *shape=0) : _shape(shape) {;}
+  void SetShape(const PulseTemplate *shape) {_shape=shape;}
+  const PulseTemplate* GetShape() const {return _shape;}
+  /// Fit as in FitPulse, result.pedestal and result.noise must be set
+  /** Fills all fields but result.func **/
+  int Fit(const UShort_t *wform, int nsamples, PulseFit &result);
+  /// pedestal of the fit in the peak region (par[0] of the TF1)
+  double PeakPedestal() const {return _pedPeak;}
+
+  static const double SCAN_STEP;   ///< tRise step of the chi2 scan
+  static const double NEWTON_STEP; ///< tRise step for the derivatives of chi2
+  static const double TOLERANCE;   ///< convergence of tRise
+  static const int MAX_ITER=20;    ///< Newton iterations
+ private:
+  double Chi2(double t, double &ped, double &amp) const;
+  int Minimize(int first, int last, double tmin, double tmax,
+	       double &ped, double &amp, double &t, double &ampErr, double &tErr,
+	       double &chi2, double &ndof);
+
+  const PulseTemplate *_shape;
+  double _y[PadeChannel::N_PADE_DATA];  ///< samples
+  double _w[PadeChannel::N_PADE_DATA];  ///< 1 for non-zero samples
+  int _first;                           ///< range of current fit
+  int _last;
+  double _sw, _sy, _syy;                ///< sums over the fit range
+  double _pedPeak;
+};
+
+#endif
@@ -65,8 +65,8 @@ class WCChannel : public TObject{
   UChar_t GetTDCNum() const {return _tdcNumber;}
   UChar_t GetWire() const {return _tdcWire;}
   UShort_t GetCount() const {return _tdcCount;}
-  float GetX();
-  float GetY();
+  float GetX() const;
+  float GetY() const;
  private:
   UChar_t       _tdcNumber;			
   UChar_t       _tdcWire;			
@@ -185,14 +185,18 @@ d by WC DAQ **/
 
   void Reset();    // clear data
 
-  // getters (tbd - return (const) references, not copies, where appopriate)
+  // getters, channels are returned by reference, copy them if they must outlive the event
   Int_t NPadeChan() const {return padeChannel.size();}
-  PadeChannel GetPadeChan(const int idx) const {return padeChannel[idx];}
-  PadeChannel GetLastPadeChan() const {return padeChannel.back();}
-  WCChannel GetWCChan(const int idx) {return wc[idx];}
+  const PadeChannel& GetPadeChan(const int idx) const {return padeChannel[idx];}
+  const PadeChannel& GetLastPadeChan() const {return padeChannel.back();}
+  const PadeChannel* GetPadeChanPtr(const int idx) const {return &padeChannel[idx];}
+  const WCChannel& GetWCChan(const int idx) const {return wc[idx];}
   Int_t GetWCHits() const {return wc.size();}
   vector<WCChannel> GetWChitsX(Int_t wc, Int_t *min=0, Int_t* max=0) const;
   vector<WCChannel> GetWChitsY(Int_t wc, Int_t *min=0, Int_t* max=0) const;
+  /// Same as GetWChitsX/Y, hits are filled in a vector kept by the caller (w/o new allocations)
+  void GetWChitsX(Int_t wc, vector<WCChannel> &hits, Int_t *min=0, Int_t* max=0) const;
+  void GetWChitsY(Int_t wc, vector<WCChannel> &hits, Int_t *min=0, Int_t* max=0) const;
   static TBRun GetRunPeriod(ULong64_t padeTime);
   TBRun GetRunPeriod() const;
 
@@ -26,7 +26,7 @@ class TBRecHit : public TObject {
   enum Flags { 
     kGood=0,       ///< channel ok, the energy,time,pedistal measurements are reliable
     kNoFit=1,      ///< the pulse fit is skipped, use simple peak finder only 
-    kPoorFit=2,    ///< energy,time,pedistal approximate (bad shape, large chi2)
+    kPoorFit=2,    ///< energy,time,pedistal approximate (bad shape, large chi2), PulseFit::status>0
     kFaultyHardware=4,  ///< channel is faulty at some hardware level
     kNoisy=8,           ///< the channel is very noisy
     kSaturated=16,      ///< saturated channel
@@ -38,10 +38,17 @@ class TBRecHit : public TObject {
     kUnknown=2<<31      ///< set for weirdness
   };
   /// Constructor
-  TBRecHit(PadeChannel *pc=0, Float_t zsp=0, UInt_t options=0);
+  TBRecHit(const PadeChannel *pc=0, Float_t zsp=0, UInt_t options=0);
   /// Alternate copy constructor: useful for mirroring dead channels 
   TBRecHit(const TBRecHit &hit, UShort_t idx, UInt_t newstatus);
-  void Init(PadeChannel *pc=0,  Float_t zsp=0);
+  void Init(const PadeChannel *pc=0,  Float_t zsp=0);
+  /// Init from sample statistics computed elsewhere (see WaveReco), sets kZSP if below zsp
+  void Set(UShort_t idx, ULong64_t timestamp, UShort_t max, Float_t ped, Float_t sig, Float_t zsp=0);
+  void SetFit(const PulseFit &fit);  ///< copy pulse fit results
+  /// zero suppression test of Init
+  static Bool_t BelowZSP(UShort_t max, Float_t ped, Float_t sig, Float_t zsp){
+    return TMath::Abs(max-ped) / (sig+0.001) < zsp;  // avoid div by 0
+  }
   Int_t ChannelIndex() const {return channelIndex;} ///< Channel indx [0..127]
   Int_t GetChannelID() const;  ///< board_id*100+ch_number
   Int_t GetBoardID() const {return  GetChannelID()/100;} ///< PADE board ID
@@ -58,7 +65,9 @@ class TBRecHit : public TObject {
   void AddStatus(enum TBRecHit::Flags flag) {status|=flag;} ///< Add bit(s) to status flag
   void SetStatus(unsigned flags) {status=flags;}  ///< Set the status flag
   Float_t AMax() const {return aMaxValue;} ///< Amplitude fom pulse fit
+  Float_t AMaxError() const {return aMaxError;} ///< fit error on AMax
   Float_t TRise() const {return tRiseValue;} ///< Starting location of pulse
+  Float_t TRiseError() const {return tRiseError;} ///< fit error on TRise
   Float_t Pedestal() const {return pedestal;}
   Float_t NoiseRMS() const {return noise;} ///< RMS noise of pedestal
   Float_t Chi2() const {return chi2;} ///< chi^2 fit calculated in pulse region
@@ -68,13 +77,13 @@ class TBRecHit : public TObject {
   UInt_t Status() const {return status;}  ///< status word
   void SetOptNoFit() {status&=kNoFit;}  ///< not implemented
   bool IsCalibrated() const {return status&kCalibrated;} 
-  Bool_t GoodPulse(PadeChannel* pc, UShort_t pga, UShort_t lna, ULong_t vga);
+  Bool_t GoodPulse(const PadeChannel* pc, UShort_t pga, UShort_t lna, ULong_t vga);
   Float_t CalFactor() const {return cfactor;} ///< return cailbration factor
   void Calibrate(float *calconstants); ///< apply calibration from array
  ///< calibrate all rechits 
   static void Calibrate(vector<TBRecHit> *rechits, float *calconstants);
  private:
-  void FitPulse(PadeChannel *pc);
+  void FitPulse(const PadeChannel *pc);
 
   UShort_t channelIndex;   ///< channel index, S.L. convention
   UShort_t maxADC;         ///< max value of ADC samples (in expected signal region)
@@ -0,0 +1,74 @@
+#ifndef WAVERECO_H
+#define WAVERECO_H
+
+#include "TBEvent.h"
+#include "TBRecHit.h"
+#include "PulseFitter.h"
+#include <vector>
+
+using std::vector;
+
+/// WaveReco Class : batch reconstruction of PADE wave forms
+/** Works on a matrix of samples, one row per channel, rows are stride
+    samples apart (PadeChannel::N_PADE_DATA for the channels of a TBEvent).
+    The rows can be the channels of one event or of a block of events.<br>
+    Pedestal, noise, max and peak are computed for all rows, then channels
+    over the ZSP threshold are fit as PadeChannel::FitPulse, w/ MINUIT or
+    after PadeChannel::SetTemplateFit(kTRUE) w/ PulseFitter.  The TBRecHits
+    are the same as from TBRecHit::Init(pc,nSigmaCut) for each channel.<br>
+    For python/NumPy: Reconstruct(...) w/ uint16 and int32 arrays, then
+    GetTable(out) w/ a float32 array of nrows x kNColumns, see RecoTable
+    in TBUtils.py.<br>
+    Threads: Load(event) uses the Mapper and must run in the main thread,
+    w/ the template fit Reconstruct() of the loaded rows only touches this
+    WaveReco, use one WaveReco per thread.  The MINUIT fit is not thread-safe.
+**/
+class WaveReco{
+ public:
+  /// columns of GetTable
+  enum Columns {
+    kPedestal=0, kNoise, kMaxADC, kPeak, kAMax, kAMaxError,
+    kTRise, kTRiseError, kChi2, kNdof, kStatus,
+    kNColumns
+  };
+  /// samples per row needed by Reconstruct, PadeChannel::GetMax reads samples 16..40
+  static const int MIN_SAMPLES=41;
+  WaveReco(float nSigmaCut=0) : _nSigmaCut(nSigmaCut) {;}
+  void SetNSigmaCut(float nSigmaCut) {_nSigmaCut=nSigmaCut;}
+  /// Reconstruct all PADE channels of an event, returns # of rows over ZSP
+  int Reconstruct(const TBEvent *event);
+  /// Copy the PADE channels of an event, returns # of rows
+  int Load(const TBEvent *event);
+  /// Reconstruct the rows of the last Load, returns # of rows over ZSP
+  int Reconstruct();
+  /// Reconstruct rows of a sample matrix, w/ the time stamp of the event or block
+  /** Returns -1 w/o reconstructing if nsamples<MIN_SAMPLES or stride<nsamples **/
+  int Reconstruct(const UShort_t *samples, int nrows, int nsamples, int stride,
+		  const Int_t *channelIndex, const Int_t *laser, ULong64_t ts);
+  /// one TBRecHit per row of the last Reconstruct, rows below ZSP have kZSP set
+  const vector<TBRecHit>& Hits() const {return _hits;}
+  Int_t NRows() const {return _hits.size();}
+  Bool_t LaserData(int row) const {return _laser[row];}
+  /// results of the last Reconstruct as a NRows() x kNColumns matrix
+  void GetTable(Float_t *out) const;
+  /// Append the TBRecHits over ZSP of an event, returns # of hits added
+  int Process(const TBEvent *event, vector<TBRecHit> &rechits);
+ private:
+  void Resize(int nrows);
+  int ReconstructRows(const UShort_t *samples, int nrows, int nsamples, int stride);
+
+  float _nSigmaCut;
+  PulseFitter _fitter;
+  PulseFit _fit;
+  vector<UShort_t> _samples;   ///< samples of the event
+  vector<Int_t> _index;        ///< channel index, laser flag, time stamp of each row
+  vector<Int_t> _laser;
+  vector<ULong64_t> _ts;
+  vector<Double_t> _ped;       ///< sample statistics of each row
+  vector<Double_t> _noise;
+  vector<UInt_t> _max;
+  vector<Int_t> _peak;
+  vector<TBRecHit> _hits;
+};
+
+#endif
@@ -12,7 +12,10 @@
    
    status = 0 - normal outcome<br> 
    status = 4 - (about 14% of hits) <br> 
-   Still OK.  Errors on amplitude and time may be unreliable
+   Still OK.  Errors on amplitude and time may be unreliable<br>
+   status = -1 - no fit done<br>
+   For the template fit (PulseFitter) status 4 means too few non-zero samples
+   to fit, see TBRecHit::SetFit for the kPoorFit flag
                 
    aMaxError  - Not needed. It should be 0.5*noise for good pulses <br>
    tRiseError - Not needed. It does not include systematics that are significant <br>
@@ -47,5 +50,17 @@ double funcPulseD(double *x, double *par);
 
 double funcPulseLaserA(double *x, double *par);
 double funcPulseLaserB(double *x, double *par);
+
+/// pulse shapes of the fit functions above
+enum PulseShapeID {
+  kPulseShapeA=0, kPulseShapeB, kPulseShapeC, kPulseShapeD,
+  kLaserShapeA, kLaserShapeB,
+  kNPulseShapes
+};
+typedef double (*PulseShapeFunc)(double *x, double *par);
+/// (x,y) table of a pulse shape, returns the number of points
+int GetPulseShapeTable(int shape, const double *&x, const double *&y);
+/// fit function (funcPulseA...) of a pulse shape
+PulseShapeFunc GetPulseShapeFunc(int shape);
 	
 #endif
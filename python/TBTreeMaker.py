@@ -10,8 +10,9 @@
 # 7/1/2014: BH - read table positions file, if present
 ###############################################################################
 
-import os, re, glob, sys, getopt, commands
+import os, re, sys, getopt, traceback, pickle, struct, json
 import cProfile, pstats, StringIO
+from multiprocessing import Pool
 from ROOT import *
 from string import split
 from array import array
@@ -25,6 +26,20 @@ NMAX = 1000000   # stop after NMAX events
 MASTERID = 112   
 if datetime.now() > datetime(2014, 10, 1): MASTERID=16
 MAXPERSPILL=1000  # do not process more that this many events per spill ( mem overwrite issue )
+# output tree settings, see usage
+#   basket: branch buffer size, compress: (algorithm,level) or None for the ROOT default
+#   autoflush: write the baskets every N spills (0 = ROOT default, flush every ~30 MB)
+#   split: split level of the branches, 0 stores whole TBEvent/TBSpill objects
+TREEOPTS={'basket':64000, 'compress':None, 'autoflush':0, 'split':0}
+COMPRESSION={'ZLIB':1, 'LZMA':2, 'LZ4':4, 'ZSTD':5}   # ROOT compression algorithm codes
+# input read ahead (PrefetchReader), threads: 0 = read in the main thread, >1 decompresses
+# bz2 blocks in parallel, depth: max # of line batches queued ahead of the parser
+PREFETCH={'threads':1, 'depth':8}
+# output files of filler, set by the command line options.  Defined here so filler
+# also runs when TBTreeMaker is imported (eg. by scanFiles.py)
+logToFile=False     # log per file (-l)
+jsonLog=False       # log as JSON lines (--jsonlog)
+statsToFile=False   # summary stats per file (--stats)
 
 ###########################
 
@@ -39,59 +54,294 @@ def usage():
     print "                       Overrides all files given on command line list"
     print "      -f             : Overwrite existing root files"
     print "      -l             : Copy logger messages to [root file basename].log"
+    print "      --jsonlog      : Write logger messages as JSON lines to [root file basename].log.jsonl"
+    print "      --stats        : Write timers and counters to [root file basename].log.stats.json"
     print "      -o DIR         : Output dir, instead of default = location of input file" 
+    print "      -j N           : Convert up to N files in parallel"
+    print "      -s             : Split each file into spill ranges, converted by the -j N workers"
+    print "      --follow       : Follow a PADE file that is still being written (.txt only)"
+    print "                       Spills are added to the tree as they complete, a rerun resumes"
+    print "                       from the last saved spill"
+    print "      --idle=SEC     : w/ --follow, stop after no new data for SEC seconds [600]"
+    print "      -c             : Use binary cache of parsed spills, [PADE_FILE].pcache"
+    print "                       The cache is written if missing or out of date"
+    print "      --basket=BYTES : Basket size of the tree branches [64000]"
+    print "      --compress=ALG[:LEVEL] : Output compression, ALG = ZLIB, LZMA, LZ4 or ZSTD"
+    print "      --autoflush=N  : Write the tree baskets every N spills"
+    print "      --split=N      : Branch split level [0], 99 = fully split, eg. padeChannel._wform"
+    print "                       and wc are stored as separate columns"
+    print "      --prefetch=N[:DEPTH] : Read/decompress the input in N threads ahead of the parser [1:8]"
+    print "                       N>1 decompresses bz2 blocks in parallel, 0 = no read ahead"
+    print "      --manifest=FILE : Skip files marked bad by scanFiles.py, w/ -j convert the largest first"
     print 
     sys.exit()
 
 
 
-def fillTree(tree, eventDict, tbspill):  
+# fill the events of a spill, one at a time, into the tbevent buffer of the tree
+# eventRows holds the rows of the PADE block for each event, block=(headers,samples)
+def fillTree(tree, tbevent, eventRows, block, wcHits, isLaser, logger):  
     ndrop=0
-    if len(eventDict)==0: return
-    nfill=min(len(eventDict),MAXPERSPILL)
-    tree[0].SetBranchAddress("tbspill",AddressOf(tbspill))
+    if len(eventRows)==0: return ndrop
+    headers,samples=block
+    ndata=len(samples)/len(headers)
+    nfill=min(len(eventRows),MAXPERSPILL)
     for ievt in range(nfill):
-        if not ievt in eventDict:
+        if not ievt in eventRows:
             ndrop=ndrop+1
             continue
-        if not eventDict[ievt].NPadeChan()==128: 
+        if not len(eventRows[ievt])==128: 
             ndrop=ndrop+1
             continue      # only fill w/ complete events
-        tree[0].SetBranchAddress("tbevent",AddressOf(eventDict[ievt]))
+        logger.Start("channel fill")
+        tbevent.Reset()
+        if wcHits!=None and ievt in wcHits:
+            for (tdcNum,wire,tdcCount) in wcHits[ievt]:
+                tbevent.AddWCHit(tdcNum,wire,tdcCount)
+        for row in eventRows[ievt]:
+            (pade_ts,pade_transfer_size,pade_board_id,
+             pade_hw_counter,pade_ch_number,padeEvent,nsamples)=headers[row]
+            tbevent.FillPadeChannel(pade_ts, pade_transfer_size, 
+                                    pade_board_id, pade_hw_counter, 
+                                    pade_ch_number, padeEvent, 
+                                    samples[row*ndata:(row+1)*ndata], isLaser)
+            if DEBUG_LEVEL>1: tbevent.GetLastPadeChan().Dump()
+        logger.Stop("channel fill")
+        logger.Start("tree fill")
         tree[0].Fill()
+        logger.Stop("tree fill")
     return ndrop
 
 
 
-def filler(padeDat, NEventLimit=NMAX, forceFlag=False, outDir=""):
+# read a spill header, set the spill data and find the WC data for the spill
+# returns (padeSpill, wcHits), padeSpill is None if the spill is to be skipped
+# wcHits holds the decoded WC spill (see WCIndex.ReadSpill), None if no WC data
+def startSpill(padeline, tbspill, fakeSpillData, runData, logger):
+    (pdgId,momentum,gain,tableX,tableY,angle)=runData
+    tbspill.Reset();
+    logger.Info(padeline)
+
+    if padeline.endswith("time ="):
+        logger.Warn("Spill header error detected: WC time stamp missing")
+
+    padeSpill=ParsePadeSpillHeader(padeline)
+    if not fakeSpillData and padeSpill['status']<0:
+        logger.Warnf("Spill header error detected: Invalid WC time stamp. Status = %s",padeSpill['status'])
+        return (None,None)
+    tbspill.SetSpillData(padeSpill['number'],long(padeSpill['pctime']),
+                         padeSpill['nTrigWC'],long(padeSpill['wcTime']),
+                         pdgId,momentum,tableX,tableY,angle)
+
+    # find associated spill in WC data
+    logger.Start("WC association")
+    wcHits=None
+    wcSpill=wcLookup(padeSpill['wcTime'])
+    logger.Count("WC lookups")
+    if (wcSpill[0]>=0):
+        logger.Info("WC data from file:",wcSpill[1])
+        wcIndex=GetWCIndex()
+        if wcIndex.eventDB:   # check trigger count w/o reading the WC file
+            nTrigWC=wcIndex.eventDB.SpillTriggers(wcSpill[1],wcSpill[0])
+            if nTrigWC!=None and nTrigWC!=padeSpill['nTrigWC']:
+                logger.Warnf("WC trigger count mismatch, PADE: %s WC event DB: %s",
+                             padeSpill['nTrigWC'],nTrigWC)
+        wcHits=wcIndex.ReadSpill(wcSpill[1],wcSpill[0],logger)
+    else:
+        logger.Warn("No corresponding WC data found for spill")
+    logger.Stop("WC association")
+    return (padeSpill,wcHits)
+
+
+# spill header for a PADE card
+def addPadeHeader(padeline, tbspill, gain):
+    (isMaster,boardID,status,trgStatus,
+     events,memReg,trigPtr,pTemp,sTemp) = ParsePadeBoardHeader(padeline)
+    tbspill.AddPade(PadeHeader(isMaster,boardID,status,trgStatus,
+                               events,memReg,trigPtr,pTemp,sTemp,gain))
+
+
+# check the decoded PADE channel data of a spill and fill its events into the tree
+# block=(headers,samples) as returned by ParsePadeBlock
+# returns the updated total event count
+def fillSpill(tree, tbevent, block, lineNumbers, padeSpill, wcHits, 
+              isLaser, nSpills, nEventsTot, logger):
+    logger.Start("checks")
+    nEventsSpill=nEventsTot
+    eventRows={} # rows of the block to write for each event, use event # as key
+    ndata=PadeChannel().__DATASIZE()
+    headers,samples=block
+
+    # porch selection and saturation check, done on sample columns of the block
+    porch=[]
+    for header in headers:
+        if header[0]>=TBEvent.START_PORCH15: porch.append(15)
+        elif header[0]>=TBEvent.END_TBEAM1: porch.append(32)
+        else: porch.append(0)
+    porchSamples={}
+    for p in set(porch): porchSamples[p]=samples[p::ndata]
+
+    lastBoardID=-1
+    lastEvent=-1
+    for row in xrange(len(headers)):
+        (pade_ts,pade_transfer_size,pade_board_id,
+         pade_hw_counter,pade_ch_number,padeEvent,nsamples)=headers[row]
+
+        # new board/event conditions
+        newBoard =  (pade_board_id != lastBoardID)
+        newEvent = (padeEvent!=lastEvent)
+        newMasterEvent = (pade_board_id==MASTERID and newEvent)
+
+        if newBoard: 
+            lastBoardID=pade_board_id
+            lastEvent=-1
+
+        # check for event overflows
+        if padeEvent>MAXPERSPILL:
+            if logger.Warnf("PadeEvent %s Event count overflow in spill, reading 1st %s events",
+                            padeEvent,MAXPERSPILL):
+                if DEBUG_LEVEL>1: logger.Infof("line number %s",lineNumbers[row])
+            break    # skip to next spill
+
+        # check for sequential events
+        if newEvent and (padeEvent-lastEvent)!=1:
+            if logger.Warnf("Nonsequential event #, delta= %s this event %s last event %s "
+                            "Board: %s channel: %s",padeEvent-lastEvent,padeEvent,lastEvent,
+                            pade_board_id,pade_ch_number):
+                if DEBUG_LEVEL>1: logger.Infof("line number %s",lineNumbers[row])
+        lastEvent=padeEvent
+
+        # check packet counter
+        goodPacketCount = (newBoard or newEvent) or (pade_hw_counter-lastPacket)==1
+        if not goodPacketCount:
+            if logger.Warnf("Packet counter increment error, delta= %s Board: %s channel: %s",
+                            pade_hw_counter-lastPacket,pade_board_id,pade_ch_number):
+                if DEBUG_LEVEL>1: logger.Infof("line number %s",lineNumbers[row])
+        lastPacket=pade_hw_counter
+
+        # check ADC samples (to do clear event from here on error)
+        if nsamples != ndata:
+            logger.Warnf("Incorrect number of ADC samples, expected %s found: %s Board: %s",
+                         ndata,nsamples,pade_board_id)
+            continue
+        if porchSamples[porch[row]][row]==0xFFF:
+            logger.Warnf("ADC shows saturation. Board: %s channel: %s line number %s",
+                         pade_board_id,pade_ch_number,lineNumbers[row])
+
+        writeChan=True   # now assume channel is good to write, until proven guilty
+        # new event condition in master
+        if newMasterEvent:
+            nEventsTot=nEventsTot+1
+            if padeEvent%100==0:
+                print "Event in spill",padeSpill['number'],"(",padeEvent,")  / total", nEventsTot
+
+            eventRows[padeEvent]=[]
+
+            # WC hits for this event, decoded w/ the WC spill
+            if wcHits!=None and not padeEvent in wcHits:
+                logger.Warn("No matching spill in WC")
+
+        else: # new event in a slave
+            if not padeEvent in eventRows:
+                logger.Warnf("Event number mismatch. Slave: %s reports event not present in master.",
+                             pade_board_id)
+                writeChan=False
+
+        if writeChan: eventRows[padeEvent].append(row)
+    logger.Stop("checks")
+
+    ndrop=fillTree(tree,tbevent,eventRows,block,wcHits,isLaser,logger)
+    if not ndrop==0: logger.Warnf("%s incomplete events dropped from tree, spill %s",ndrop,nSpills)
+    if TREEOPTS['autoflush']>0 and nSpills%TREEOPTS['autoflush']==0: tree[0].FlushBaskets()
+
+    nEventsSpill=nEventsTot-nEventsSpill
+    logger.Count("spills")
+    logger.Count("events",nEventsSpill)
+    logger.Count("channels",len(headers))
+    seconds=logger.Lap()
+    if nSpills>0: logger.Info("Spill %d: %d events, %d channels in %.2f s (%.1f events/s)" %
+                              (nSpills,nEventsSpill,len(headers),seconds,nEventsSpill/max(seconds,1e-6)))
+    return nEventsTot
+
+
+
+# name of the root file made from a PADE file
+def outputName(padeDat, outDir=""):
+    outFile=padeDat.replace(".bz2","").replace(".txt",".root")
+    if not outDir=="":
+        outFile=outDir+"/"+os.path.basename(outFile)
+    return outFile
+
+# log file (-l/--jsonlog) and --stats file of a conversion, the stats summarize the log
+# and are written next to it
+def logNames(outFile):
+    logFile=outFile.replace(".root",".log")
+    statsFile=logFile+".stats.json"
+    if jsonLog: logFile=logFile+".jsonl"
+    return (logFile,statsFile)
+
+
+# open an output file w/ the compression settings from TREEOPTS
+def openOutput(fileName, mode):
+    fout=TFile(fileName, mode)
+    if TREEOPTS['compress']:
+        (algorithm,level)=TREEOPTS['compress']
+        fout.SetCompressionSettings(100*algorithm+level)
+    return fout
+
+
+# save the tree and record the offset of the next spill header in the checkpoint file
+# used to resume conversions in --follow mode
+def followCheckpoint(fout, tree, checkpoint, state):
+    tree.AutoSave("SaveSelf")
+    fout.Flush()
+    state['entries']=tree.GetEntries()
+    with open(checkpoint+"_tmp", 'w') as f:
+        pickle.dump(state,f)
+    os.rename(checkpoint+"_tmp",checkpoint)
+
+
+# convert one PADE file, returns a summary dictionary (None if the file was skipped)
+# spillRange=(offset,nSpills,fake,index) converts only nSpills spills starting at the
+# (uncompressed) byte offset of a spill header, writing them to partFile (see spillFiller)
+# index is the BZ2BlockIndex of a bz2 file, None for a text file
+# follow=True reads a file that is still being written (see FollowFile), the tree
+# is written to outFile directly and saved after each spill
+# useCache=True replays the spills from the binary cache of the PADE file, if the cache
+# is valid, otherwise the cache is written during the conversion (see PadeCacheWriter)
+def filler(padeDat, NEventLimit=NMAX, forceFlag=False, outDir="", linkLatest=True,
+           spillRange=None, partFile=None, follow=False, idle=600, useCache=False):
 
     logger=Logger(1)  # instantiate a logger, w/ 1 repetition of messages
+    logger.Start("total")
 
     #=======================================================================# 
     #  Declare an element of the event class for our event                  #
     #=======================================================================#
     tbevent = TBEvent()
     tbspill = TBSpill()
-    padeChannel = PadeChannel()
 
     #=======================================================================# 
     #  Declare new file and tree with branches                              #
     #=======================================================================#
-    outFile=padeDat.replace(".bz2","").replace(".txt",".root")
+    outFile=outputName(padeDat,outDir)
+    timeStamp=os.path.basename(outFile).replace("rec_capture_","").replace(".root","")
+    if partFile: outFile=partFile
 
-    if not outDir=="":
-        outFile=outDir+"/"+os.path.basename(outFile)
+    if follow and padeDat.endswith("bz2"):
+        logger.Warn("Cannot follow a bz2 file, converting",padeDat,"as is")
+        follow=False
+    checkpoint=outFile+".follow"    # resume point for --follow mode
+    resume=follow and os.path.isfile(checkpoint) and os.path.isfile(outFile) and not forceFlag
 
-    if  os.path.isfile(outFile) and not forceFlag:
+    if  os.path.isfile(outFile) and not forceFlag and not resume:
         logger.Info(outFile,"is present, skip processing. Use -f flag to override")
         return
 
-    if logToFile:
-        logFile=outFile.replace(".root",".log")
+    logFile,statsFile=logNames(outFile)
+    if logToFile and not partFile:
         logger.Info("Writing logger output to file:",logFile)
-        logger.SetLogFile(logFile)
-
-    timeStamp=os.path.basename(outFile).replace("rec_capture_","").replace(".root","")
+        logger.SetLogFile(logFile,jsonLog)
     
     #tableX,tableY=getTableXY(timeStamp)
     try:
@@ -100,43 +350,127 @@ def filler(padeDat, NEventLimit=NMAX, forceFlag=False, outDir=""):
         logger.Warn("No run data found for",padeDat,"\n Either this run is not logged, or rerun getRunData.py")
         pdgId=0; momentum=0; gain=0; tableX=0; tableY=0; angle=0
     logger.Info("pdgId,momentum,gain,tableX,tableY,angle:",pdgId,momentum,gain,tableX,tableY,angle)
+    runData=(pdgId,momentum,gain,tableX,tableY,angle)
         
-    fout = TFile(outFile+"_tmp", "recreate")   # write to tmp file, rename at successful close
+    state={'offset':0, 'nSpills':0, 'nEvents':0, 'linesread':0, 'fake':False, 'entries':0}
+    if resume:     # continue the tree from the last spill saved in follow mode
+        with open(checkpoint, 'r') as f:
+            state = pickle.load(f)
+        fout = openOutput(outFile, "update")
+        BeamTree = [fout.Get("t1041")]
+        if not BeamTree[0] or BeamTree[0].GetEntries()!=state['entries']:
+            logger.Warn("Checkpoint does not match",outFile,"starting over")
+            fout.Close()
+            resume=False
+            state={'offset':0, 'nSpills':0, 'nEvents':0, 'linesread':0, 'fake':False, 'entries':0}
+        else: 
+            logger.Info("Resume",outFile,"at spill",state['nSpills']+1,"byte",state['offset'])
+            BeamTree[0].SetBranchAddress("tbevent",AddressOf(tbevent))
+            BeamTree[0].SetBranchAddress("tbspill",AddressOf(tbspill))
+    if not resume:
+        tmpFile=outFile+"_tmp"     # write to tmp file, rename at successful close
+        if follow: tmpFile=outFile # readers can follow the output, too
+        fout = openOutput(tmpFile, "recreate")
+
+        BeamTree = [TTree("t1041", "T1041")] # ugly python hack to pass a reference
+        BeamTree[0].Branch("tbevent", "TBEvent", AddressOf(tbevent), TREEOPTS['basket'], TREEOPTS['split'])
+        BeamTree[0].Branch("tbspill", "TBSpill", AddressOf(tbspill), TREEOPTS['basket'], TREEOPTS['split'])
+        if TREEOPTS['autoflush']>0: BeamTree[0].SetAutoFlush(0)   # flushed at spill boundaries
 
     logger.Info("Writing to output file",outFile)
 
-    BeamTree = [TTree("t1041", "T1041")] # ugly python hack to pass a reference
-    BeamTree[0].Branch("tbevent", "TBEvent", AddressOf(tbevent), 64000, 0)
-    BeamTree[0].Branch("tbspill", "TBSpill", AddressOf(tbspill), 64000, 0)
-
 
     if (NEventLimit<NMAX):
         logger.Info("Stop at end of spill after reading at least",NEventLimit,"events")
     fPade=TBOpen(padeDat)                   # open the PADE data file
-
-
-    eventDict={} # dictionary holds event data for a spill, use event # as key
-    padeDict={}  # dictionary holds PADE header data for a spill, use PADE ID as key
-
-    lastBoardID=-1
-    lastEvent=-1
-    nSpills=0
-    nEventsInSpill=0
-    nEventsTot=0
+    maxSpills=-1
+    fakeSpillData=state['fake']
+    if follow:
+        fPade=FollowFile(padeDat,idle)
+        fPade.seek(state['offset'])
+    if spillRange:
+        fPade.close()
+        fPade=TBOpen(padeDat,spillRange[3])   # bz2 files seek w/ the block index
+        fPade.seek(spillRange[0])
+        maxSpills=spillRange[1]
+        fakeSpillData=spillRange[2]
+
+
+    cacheIn=None    # binary cache of the parsed spills
+    cacheOut=None
+    if useCache and not (follow or spillRange):
+        try:
+            cacheIn=PadeCacheReader(padeDat)
+            logger.Info("Reading",len(cacheIn),"spills from cache",cacheIn.cacheFile)
+        except (IOError, OSError, ValueError, EOFError, struct.error, pickle.UnpicklingError) as e:
+            logger.Info("No valid cache for",padeDat,"(",e,") writing",PadeCacheName(padeDat))
+            try: cacheOut=PadeCacheWriter(padeDat)
+            except IOError as e: logger.Warn("Cannot write cache:",e)
+    if PREFETCH['threads']>0 and not (follow or spillRange or cacheIn):
+        fPade.close()
+        fPade=PrefetchReader(padeDat,PREFETCH['threads'],PREFETCH['depth'])
+
+    padeLines=[]    # PADE channel data for a spill, decoded as one block at end of spill
+    lineNumbers=[]
+    spillLine=None  # spill and board headers for the cache
+    spillFake=fakeSpillData
+    boardLines=[]
+    padeSpill=None
+    wcHits=None     # WC hits for the spill, by event number
+    isLaser=(pdgId==-22)
+
+    nSpills=state['nSpills']
+    nEventsTot=state['nEvents']
     skipToNextSpill=False
-    skipToNextBoard=False
-
-    fakeSpillData=False
 
-    writevent=True
+    # "read" times the reads of the cache records and PADE lines
+    # (includes bz2 decompression and splitting of the text)
+    startOffset=fPade.tell()
+
+    # read spills from the cache, w/o parsing the PADE data file
+    linesread=state['linesread'];
+    if cacheIn:
+        spills=cacheIn.Spills()
+        while 1:
+            logger.Start("read")
+            spill=next(spills,None)
+            logger.Stop("read")
+            if spill is None: break
+            if (nEventsTot>=NEventLimit): break
+            if spill['fake'] and not fakeSpillData: logger.Info("Fake spill data")
+            fakeSpillData=spill['fake']
+            padeSpill,wcHits=startSpill(spill['spill'],tbspill,fakeSpillData,runData,logger)
+            nSpills=nSpills+1;
+            for padeline in spill['boards']: addPadeHeader(padeline,tbspill,gain)
+            nEventsTot=fillSpill(BeamTree,tbevent,spill['block'],spill['lines'],padeSpill,wcHits,
+                                 isLaser,nSpills,nEventsTot,logger)
+        linesread=cacheIn.linesread
+        logger.Count("MB from cache",os.path.getsize(cacheIn.cacheFile)/1e6)
+        cacheIn.Close()
+        fPade.close()
+        fPade=None
 
     # read PADE data file
-    linesread=0;
-    while 1:
+    while fPade:
+        logger.Start("read")
         padeline=fPade.readline().rstrip()
+        logger.Stop("read")
         if not padeline: 
-            ndrop=fillTree(BeamTree,eventDict,tbspill)          # end of file
-            if not ndrop==0: logger.Warn(ndrop,"incomplete events dropped from tree, spill",nSpills)
+            if follow and fPade.interrupted: break     # keep last saved spill as resume point
+            logger.Start("parse")
+            block=ParsePadeBlock(padeLines)
+            logger.Stop("parse")
+            if cacheOut and spillLine: 
+                cacheOut.AddSpill(spillLine,boardLines,spillFake,lineNumbers,block)
+            nEventsTot=fillSpill(BeamTree,tbevent,block,lineNumbers,padeSpill,wcHits,
+                                 isLaser,nSpills,nEventsTot,logger)          # end of file
+            if cacheOut: 
+                cacheOut.Close(linesread)
+                cacheOut=None
+            if follow:
+                followCheckpoint(fout,BeamTree[0],checkpoint,
+                                 {'offset':fPade.tell(), 'nSpills':nSpills, 'nEvents':nEventsTot,
+                                  'linesread':linesread, 'fake':fakeSpillData})
             break
         linesread=linesread+1
         ###########################################################
@@ -148,40 +482,30 @@ def filler(padeDat, NEventLimit=NMAX, forceFlag=False, outDir=""):
             continue
 
         if "starting spill" in padeline:   # new spill condition
-            if nSpills>0:
-                ndrop=fillTree(BeamTree,eventDict,tbspill)
-                if not ndrop==0: logger.Warn(ndrop,"incomplete events dropped from tree, spill",nSpills)
-            if (nEventsTot>=NEventLimit): 
+            # flush the last spill, nothing to flush (or checkpoint) for the first header
+            # after a --follow resume or after a spill header error
+            if nSpills>0 and padeSpill is not None and padeLines:
+                logger.Start("parse")
+                block=ParsePadeBlock(padeLines)
+                logger.Stop("parse")
+                if cacheOut: cacheOut.AddSpill(spillLine,boardLines,spillFake,lineNumbers,block)
+                nEventsTot=fillSpill(BeamTree,tbevent,block,lineNumbers,padeSpill,wcHits,
+                                     isLaser,nSpills,nEventsTot,logger)
+                if follow:  # spill is complete, resume from this header after a restart
+                    followCheckpoint(fout,BeamTree[0],checkpoint,
+                                     {'offset':fPade.offset, 'nSpills':nSpills, 'nEvents':nEventsTot,
+                                      'linesread':linesread-1, 'fake':fakeSpillData})
+            if (nEventsTot>=NEventLimit) or nSpills==maxSpills: 
                 break
-            tbspill.Reset();
-            logger.Info(padeline)
-            eventDict={}           # clear dictionary containing events in spill
-            lastBoardID=-1
-            lastEvent=-1
-            newEvent=False
-            skipToNextSpill=False
-            skipToNextBoard=False
-            nEventsInSpill=0
-
-            if padeline.endswith("time ="):
-                logger.Warn("Spill header error detected: WC time stamp missing")
-
-            padeSpill=ParsePadeSpillHeader(padeline)
+            padeLines=[]           # clear channel data for the spill
+            lineNumbers=[]
+            spillLine=padeline
+            spillFake=fakeSpillData
+            boardLines=[]
+            wcHits=None            # release WC data from last spill
+            padeSpill,wcHits=startSpill(padeline,tbspill,fakeSpillData,runData,logger)
             nSpills=nSpills+1;
-            if not fakeSpillData and padeSpill['status']<0:
-                skipToNextSpill=True
-                logger.Warn("Spill header error detected: Invalid WC time stamp. Status = ",padeSpill['status'])
-                continue
-            tbspill.SetSpillData(padeSpill['number'],long(padeSpill['pctime']),
-                                 padeSpill['nTrigWC'],long(padeSpill['wcTime']),
-                                 pdgId,momentum,tableX,tableY,angle)
-
-            # find associated spill in WC data
-            wcSpill=wcLookup(padeSpill['wcTime'])
-            if (wcSpill[0]>=0):
-                logger.Info("WC data from file:",wcSpill[1])
-            else:
-                logger.Warn("No corresponding WC data found for spill")
+            skipToNextSpill=(padeSpill==None)
 
             continue  # finished w/ spill header read next line in PADE file
 
@@ -189,120 +513,31 @@ def filler(padeDat, NEventLimit=NMAX, forceFlag=False, outDir=""):
         if skipToNextSpill: continue      #!!!!!!!!!!!!!!!!!111
 
         if "spill status" in padeline:   # spill header for a PADE card
-            (isMaster,boardID,status,trgStatus,
-             events,memReg,trigPtr,pTemp,sTemp) = ParsePadeBoardHeader(padeline)
-            tbspill.AddPade(PadeHeader(isMaster,boardID,status,trgStatus,
-                                            events,memReg,trigPtr,pTemp,sTemp,gain))
+            addPadeHeader(padeline,tbspill,gain)
+            boardLines.append(padeline)
             continue
 
         ############### Reading spill header information ########## 
         ###########################################################
 
-        # parse PADE channel data
-        (pade_ts,pade_transfer_size,pade_board_id,
-         pade_hw_counter,pade_ch_number,padeEvent,waveform)=ParsePadeData(padeline)
-
-
-        # new board/event conditions
-        newBoard =  (pade_board_id != lastBoardID)
-        newEvent = (padeEvent!=lastEvent)
-        newMasterEvent = (pade_board_id==MASTERID and newEvent)
-
-        if newBoard: 
-            lastBoardID=pade_board_id
-            lastEvent=-1
-            skipToNextBoard=False
-        if skipToNextBoard: continue
-
-        # check for event overflows
-        if padeEvent>MAXPERSPILL:
-            if logger.Warn("PadeEvent",padeEvent,"Event count overflow in spill, reading 1st",
-                        MAXPERSPILL,"events"):
-                if DEBUG_LEVEL>1: logger.Info("line number",linesread)
-            skipToNextSpill=True
-            continue
-
-        # check for sequential events
-        if newEvent and (padeEvent-lastEvent)!=1:
-            if logger.Warn("Nonsequential event #, delta=",padeEvent-lastEvent,
-                        "this event",padeEvent,"last event",lastEvent,
-                        "Board:",pade_board_id,"channel:",pade_ch_number):
-                if DEBUG_LEVEL>1: logger.Info("line number",linesread)
-        lastEvent=padeEvent
-
-        # check packet counter
-        goodPacketCount = (newBoard or newEvent) or (pade_hw_counter-lastPacket)==1
-        if not goodPacketCount:
-            if logger.Warn("Packet counter increment error, delta=",
-                           pade_hw_counter-lastPacket,"Board:",pade_board_id,"channel:",pade_ch_number):
-                if DEBUG_LEVEL>1: logger.Info("line number",linesread)
-        lastPacket=pade_hw_counter
-
-        # fetch ADC samples (to do clear event from here on error)
-        samples=array("i",[0xFFF]*padeChannel.__DATASIZE())
-        nsamples=len(waveform)
-        if nsamples != padeChannel.__DATASIZE():
-            logger.Warn("Incorrect number of ADC samples, expected",
-                        padeChannel.__DATASIZE(),"found:",nsamples,"Board:", pade_board_id)
-            continue
-        else:
-            if pade_ts>=TBEvent().START_PORCH15: porch=15
-            elif pade_ts>=TBEvent().END_TBEAM1: porch=32
-            else: porch=0
-            isSaturated = "FFF" in waveform[porch]
-            if (isSaturated):
-                logger.Warn("ADC shows saturation. Board:",
-                            pade_board_id,"channel:",pade_ch_number,"line number",linesread)
-            for i in range(nsamples): 
-                samples[i]=int(waveform[i],16)
-
-        writeChan=True   # now assume channel is good to write, until proven guilty
-        # new event condition in master
-        if newMasterEvent:
-            nEventsTot=nEventsTot+1
-            nEventsInSpill=nEventsInSpill+1
-            if padeEvent%100==0:
-                print "Event in spill",padeSpill['number'],"(",padeEvent,")  / total", nEventsTot
-
-            eventDict[padeEvent]=TBEvent()
-
-            # search for WC spill info
-            if wcSpill[0]>=0:
-                fWC = TBOpen(wcSpill[1])
-                fWC.seek(int(wcSpill[0]))
-                # advance file pointer and return location of event 
-                wcStart=findWCEvent(fWC,padeEvent)  
-                if wcStart>0:         # matching event found in WC data
-                    fWC.seek(wcStart)
-                    etime=fWC.readline()            # discard ETIME line
-                    while 1:
-                        wcline=fWC.readline()
-                        if not wcline : break   # EOF 
-                        wcline=wcline.split()
-                        if len(wcline)<2: logger.Warn("Error in line from WC file:",wcline)
-                        if "Module" in wcline: tdcNum=int(wcline[1])
-                        elif "Channel" in wcline:
-                            wire=int(wcline[1])
-                            tdcCount=int(wcline[2])
-                            eventDict[padeEvent].AddWCHit(tdcNum,wire,tdcCount)
-                        else: break
-                else:
-                    logger.Warn("No matching spill in WC")
-                fWC.close()
-
-        else: # new event in a slave
-            if not padeEvent in eventDict:
-                logger.Warn("Event number mismatch. Slave:",
-                            pade_board_id,"reports event not present in master.")
-                writeChan=False
-
-        if writeChan:
-            isLaser=(pdgId==-22)
-            eventDict[padeEvent].FillPadeChannel(pade_ts, pade_transfer_size, 
-                                                 pade_board_id, pade_hw_counter, 
-                                                 pade_ch_number, padeEvent, samples, isLaser)
-            if DEBUG_LEVEL>1: eventDict[padeEvent].GetLastPadeChan().Dump()
-
+        # PADE channel data, parsed w/ the rest of the spill
+        padeLines.append(padeline)
+        lineNumbers.append(linesread)
+
+
+    if cacheOut: cacheOut.Abort()   # file was not read to the end
+    if isinstance(fPade,PrefetchReader):   # time waiting for the input is not counted as "read"
+        prefetch=fPade.Stats()
+        fPade.close()
+        logger.AddTime("input stall",prefetch['stall'])
+        logger.AddTime("read",-prefetch['stall'])
+        logger.Count("input batches",prefetch['batches'])
+        logger.Infof("Read ahead: %d batches, queue depth %.1f (max %d), stalled %.2f s",
+                     prefetch['batches'],prefetch['depth'],prefetch['maxDepth'],prefetch['stall'])
+    logger.Count("lines",linesread-state['linesread'])
+    if fPade and padeDat.endswith("bz2"): logger.Count("MB decompressed",(fPade.tell()-startOffset)/1e6)
+    elif fPade: logger.Count("MB read",(fPade.tell()-startOffset)/1e6)
+    CloseWCIndex()   # WC files and event DB of the spill lookups
 
     #=======================================================================# 
     #  Write tree and file to disk                                          #
@@ -313,25 +548,156 @@ def filler(padeDat, NEventLimit=NMAX, forceFlag=False, outDir=""):
     BeamTree[0].Print()
     eventsInTree=BeamTree[0].GetEntries()
     print "writing file:",outFile
+    logger.Start("write")
     BeamTree[0].Write()
     fout.Close()
-    commands.getoutput("mv -f "+outFile+"_tmp "+outFile)
+    if not follow: AtomicRename(outFile+"_tmp",outFile)
+    logger.Stop("write")
 
     # for convinence when working interactively
-    print commands.getoutput(ccat('ln -sf',outFile,' latest.root'))
+    if linkLatest: UpdateSymlink(outFile,"latest.root")
 
     print
     logger.Info("Summary: nSpills processed= ",nSpills," Total Events Processed= ",nEventsTot)
-    logger.Info("Fraction of events kept:",float(eventsInTree)/nEventsTot*100)
+    if nEventsTot>0: logger.Info("Fraction of events kept:",float(eventsInTree)/nEventsTot*100)
 
+    logger.Stop("total")
     logger.Summary()
     if fakeSpillData: logger.Info("Fake spill data")
+    summary={'padeDat':padeDat, 'outFile':outFile, 'nSpills':nSpills, 'nEvents':nEventsTot,
+             'eventsInTree':eventsInTree, 'warnings':logger.warnings}
+    if statsToFile and not partFile:
+        logger.WriteStats(statsFile,**summary)
+
+    summary['timers']=logger.timers
+    summary['counters']=logger.counters
+    return summary
+
+
+# process pool job, one per PADE file or spill range, args are passed to filler
+# each job runs in a fresh worker process (own ROOT state and logger)
+def fillerJob(args):
+    try:
+        return filler(linkLatest=False, **args)
+    except (Exception, SystemExit):
+        print "Conversion failed for",args['padeDat']
+        traceback.print_exc()
+        return None
+
+
+# convert a single PADE file w/ nJobs workers, each filling a range of spills
+# spill header offsets are found in a pre-pass, the partial trees are merged in spill order
+def spillFiller(padeDat, nJobs, forceFlag=False, outDir="", linkLatest=True):
+    outFile=outputName(padeDat,outDir)
+    if  os.path.isfile(outFile) and not forceFlag:
+        print outFile,"is present, skip processing. Use -f flag to override"
+        return
+
+    offsets,fake,index=IndexPadeSpills(padeDat)   # also indexes the bz2 blocks
+    print "Found",len(offsets),"spills in",padeDat
+    if len(offsets)==0:
+        return filler(padeDat,NMAX,forceFlag,outDir,linkLatest)
+
+    nParts=min(len(offsets),4*nJobs)   # a few ranges per worker to balance the load
+    jobs=[]
+    for i in range(nParts):
+        first=i*len(offsets)/nParts
+        last=(i+1)*len(offsets)/nParts
+        partFile=outFile+"_part%03d" % i
+        spillRange=(offsets[first],last-first,fake>=0 and fake<offsets[first],index)
+        jobs.append({'padeDat':padeDat, 'forceFlag':True, 'outDir':outDir,
+                     'spillRange':spillRange, 'partFile':partFile})
+
+    pool=Pool(nJobs,maxtasksperchild=1)
+    summaries=pool.map(fillerJob,jobs)
+    pool.close()
+    pool.join()
+
+    merged=None
+    if not None in summaries:
+        print "Merging",nParts,"partial trees into",outFile
+        chain=TChain("t1041")
+        for job in jobs: chain.Add(job['partFile'])
+        fmerge=openOutput(outFile+"_tmp","recreate")
+        nmerged=chain.Merge(fmerge,TREEOPTS['basket'],"fast keep")
+        fmerge.Close()
+        if nmerged>0:
+            AtomicRename(outFile+"_tmp",outFile)
+            merged={'padeDat':padeDat, 'outFile':outFile, 'warnings':{}}
+            for key in ('nSpills','nEvents','eventsInTree'):
+                merged[key]=sum([summary[key] for summary in summaries])
+            for summary in summaries:
+                for msg in summary['warnings']:
+                    merged['warnings'][msg]=merged['warnings'].get(msg,0)+summary['warnings'][msg]
+    for job in jobs:
+        if os.path.isfile(job['partFile']): os.remove(job['partFile'])
+    if not merged:
+        print "Conversion failed for",padeDat
+        return None
+
+    if linkLatest: UpdateSymlink(outFile,"latest.root")
+    logFile,statsFile=logNames(outFile)
+    if not logToFile: logFile=None
+    if not statsToFile: statsFile=None
+    merged['timers']={}
+    merged['counters']={}
+    for summary in summaries:
+        for stage in summary['timers']: 
+            merged['timers'][stage]=merged['timers'].get(stage,0)+summary['timers'][stage]
+        for counter in summary['counters']:
+            merged['counters'][counter]=merged['counters'].get(counter,0)+summary['counters'][counter]
+    jobSummary([merged],logFile,statsFile)
+    return merged
+
+
+# apply the manifest written by scanFiles.py: files marked bad are skipped,
+# largestFirst orders the files by size (balances the parallel jobs)
+def applyManifest(fileList, manifestFile, largestFirst=False):
+    with open(manifestFile,"r") as f: scans=json.load(f)['files']
+    files=[]
+    for padeDat in fileList:
+        scan=scans.get(os.path.abspath(padeDat),{})
+        if scan.get('status')=='bad':
+            print "Skipping",padeDat,"marked bad in",manifestFile,":",", ".join(sorted(scan['errors']))
+            continue
+        if scan.get('maxEvents',0)>MAXPERSPILL:
+            print "Warning:",padeDat,"has spills w/",scan['maxEvents'],"events, only",MAXPERSPILL,"are read"
+        files.append(padeDat)
+    if largestFirst: files.sort(key=lambda f: -scans.get(os.path.abspath(f),{}).get('size',0))
+    return files
+
+
+# merge the summaries returned by the parallel jobs
+# timers are summed over the jobs, ie. rates are per worker
+def jobSummary(summaries, logFile=None, statsFile=None):
+    logger=Logger(0)
+    if logFile: logger.SetLogFile(logFile,jsonLog)
+    nSpills=0
+    nEvents=0
+    eventsInTree=0
+    for summary in summaries:
+        nSpills=nSpills+summary['nSpills']
+        nEvents=nEvents+summary['nEvents']
+        eventsInTree=eventsInTree+summary['eventsInTree']
+        logger.Merge(summary['warnings'])
+        logger.MergeStats(summary['timers'],summary['counters'])
+        print "%-60s spills: %5d events: %8d kept: %8d" % (os.path.basename(summary['outFile']),
+                                                          summary['nSpills'],summary['nEvents'],
+                                                          summary['eventsInTree'])
+    logger.Info("Summary: files converted= ",len(summaries)," nSpills processed= ",nSpills,
+                " Total Events Processed= ",nEvents)
+    if nEvents>0: logger.Info("Fraction of events kept:",float(eventsInTree)/nEvents*100)
+    logger.Summary()
+    if statsFile: 
+        logger.WriteStats(statsFile,files=[summary['outFile'] for summary in summaries],
+                          nSpills=nSpills,nEvents=nEvents,eventsInTree=eventsInTree)
 
 
 
 if __name__ == '__main__': 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "n:d:r:o:flpv")
+        opts, args = getopt.getopt(sys.argv[1:], "n:d:r:o:j:scflpv", ["follow","idle=","basket=","compress=","autoflush=","split=","stats","jsonlog",
+                                                                     "prefetch=","manifest="])
     except getopt.GetoptError as err: usage()
 
     NEventLimit=NMAX
@@ -340,9 +706,14 @@ if __name__ == '__main__':
     recurse=False
     forceFlag=False
     prof=False
-    logToFile=False
     verbose=false
     outDir=""
+    nJobs=1
+    splitSpills=False
+    follow=False
+    idle=600
+    useCache=False
+    manifestFile=None
     for o, a in opts:
         if o == "-n": NEventLimit=int(a)
         elif o == "-d":
@@ -352,9 +723,31 @@ if __name__ == '__main__':
             recurse=True
         elif o == "-f": forceFlag=True
         elif o == "-l": logToFile=True
+        elif o == "--stats": statsToFile=True
+        elif o == "--jsonlog": 
+            logToFile=True
+            jsonLog=True
         elif o == "-p": prof=True
         elif o == "-o": outDir=a
         elif o == "-v": verbose=true
+        elif o == "-j": nJobs=int(a)
+        elif o == "-s": splitSpills=True
+        elif o == "--follow": follow=True
+        elif o == "--idle": idle=float(a)
+        elif o == "-c": useCache=True
+        elif o == "--basket": TREEOPTS['basket']=int(a)
+        elif o == "--autoflush": TREEOPTS['autoflush']=int(a)
+        elif o == "--split": TREEOPTS['split']=int(a)
+        elif o == "--compress":
+            algorithm=a.split(":")[0].upper()
+            if not algorithm in COMPRESSION: usage()
+            level=4
+            if ":" in a: level=int(a.split(":")[1])
+            TREEOPTS['compress']=(COMPRESSION[algorithm],level)
+        elif o == "--manifest": manifestFile=a
+        elif o == "--prefetch":
+            PREFETCH['threads']=int(a.split(":")[0])
+            if ":" in a: PREFETCH['depth']=int(a.split(":")[1])
 
 
     if inputDir=="":
@@ -362,11 +755,11 @@ if __name__ == '__main__':
         else: usage()
     elif not recurse:
         if not os.path.isdir(inputDir): usage()
-        fileList.extend( glob.glob(inputDir+'/rec_capture_*.txt*') )
+        fileList.extend( FindFiles(inputDir,"rec_capture_*.txt*") )
     elif recurse:
-        cmd=ccat('find',inputDir,'-name "rec_capture_*.txt*"')
-        fileList.extend( commands.getoutput(cmd).split() )
+        fileList.extend( FindFiles(inputDir,"rec_capture_*.txt*",recurse=True) )
     else: usage()
+    if manifestFile: fileList=applyManifest(fileList,manifestFile,nJobs>1)
 
     print "Processing",len(fileList),"files"
 
@@ -379,13 +772,52 @@ if __name__ == '__main__':
         pr = cProfile.Profile()
         pr.enable()
 
+    if follow and (nJobs>1 or splitSpills):
+        print "--follow converts files one at a time, ignoring -j/-s"
+        nJobs=1
+        splitSpills=False
+
+    if splitSpills and NEventLimit<NMAX:
+        print "-n is not supported w/ spill parallel conversion, processing files serially"
+        splitSpills=False
+
+    if splitSpills and nJobs<2:
+        print "-s needs -j N w/ N>1 parallel jobs, processing files serially"
+        splitSpills=False
+
+    if nJobs>1 and splitSpills:
+        padeFiles=[f for f in fileList if f.endswith(".bz2") or f.endswith(".txt")]
+        for padeDat in padeFiles:
+            print "="*60
+            print "Processing File ===>",padeDat,"w/",nJobs,"parallel jobs"
+            print "="*60
+            spillFiller(padeDat,nJobs,forceFlag,outDir)
+        fileList=[]
+
+    if nJobs>1:
+        padeFiles=[f for f in fileList if f.endswith(".bz2") or f.endswith(".txt")]
+        print "Converting",len(padeFiles),"files w/",nJobs,"parallel jobs"
+        # outputs are written to *_tmp and renamed at close, so parallel jobs are safe
+        pool=Pool(nJobs,maxtasksperchild=1)
+        jobs=[{'padeDat':padeDat, 'NEventLimit':NEventLimit, 'forceFlag':forceFlag, 'outDir':outDir,
+               'useCache':useCache} for padeDat in padeFiles]
+        summaries=[summary for summary in pool.imap(fillerJob,jobs) if summary]
+        pool.close()
+        pool.join()
+        print "="*60
+        jobSummary(summaries)
+        if len(summaries)>0:  # for convinence when working interactively
+            newest=max([summary['outFile'] for summary in summaries],key=os.path.basename)
+            UpdateSymlink(newest,"latest.root")
+        fileList=[]
+
     count=1
     for padeDat in fileList:
         if not (padeDat.endswith(".bz2") or padeDat.endswith(".txt")): continue
         print "="*60
         print "Processing File ===>",padeDat,count,"/",len(fileList)
         print "="*60
-        filler(padeDat,NEventLimit,forceFlag,outDir)
+        filler(padeDat,NEventLimit,forceFlag,outDir,follow=follow,idle=idle,useCache=useCache)
         count=count+1
         print "="*60
         print "Finished File ===>",padeDat
@@ -1,8 +1,20 @@
 # Created 4/12/2014 B.Hirosky: Initial release
 
-import sys, os, bz2, inspect, re, time, collections, StringIO, pickle
+import sys, os, bz2, inspect, re, time, collections, StringIO, pickle, zlib, struct, mmap, json
+import errno, shutil, fnmatch, threading, Queue
 from commands import getoutput,getstatusoutput
+from binascii import unhexlify, hexlify
+from bisect import bisect_left, bisect_right
 from ROOT import *
+from array import array
+try: import sqlite3
+except ImportError: sqlite3=None
+try: import numpy
+except ImportError: numpy=None
+try: from os import scandir
+except ImportError:
+    try: from scandir import scandir
+    except ImportError: scandir=None
 
 def hit_continue(msg='Hit any key to continue'):
     print
@@ -39,6 +51,12 @@ def LoadLibs(tblib,*libs):
 # Instantiate as logger=Logger(num=1) 
 # Print information messages and up to num (default=1) occurances of each warning
 # The Summary method provides statistics on all warnings
+# Warnf/Infof take a message template and args, eg. logger.Warnf("Bad board %s",board)
+# Warnf counts by template and formats the message only if it is printed, use it for
+# warnings that can repeat for many channels or events
+# SetLogFile copies the printed messages to a (buffered) file, as text or JSON lines
+# Stage timers (Start/Stop) and counters (Count) are reported in the Summary, w/ rates
+# relative to the "total" timer, and can be saved as JSON w/ WriteStats
 
 class Logger():
     def __init__(self,max=1):
@@ -47,28 +65,87 @@ class Logger():
         self.COL_OFF='\033[0m'
         self.max=max
         self.logfile=""
+        self.jsonLines=False
         self.stdout=sys.stdout
+        self.timers=collections.OrderedDict()    # stage: seconds
+        self.counters=collections.OrderedDict()  # counter: count
+        self.started={}
+        self.lap=time.time()
         print "Init logger, max print count =",max
-    def SetLogFile(self,logfile):
+    def SetLogFile(self,logfile,jsonLines=False):
         self.logfile=logfile
-        self.stdout = open(self.logfile, 'w') # output socket
+        self.jsonLines=jsonLines
+        self.stdout = open(self.logfile, 'w', 1<<16) # output socket, buffered
+    def Write(self,level,msg,template=None,args=(),count=1):   # copy a message to the log file
+        if self.logfile=="": return
+        if self.jsonLines:
+            record={'time':time.time(), 'level':level, 'msg':msg.strip()}
+            if template!=None: 
+                record.update({'template':template, 'args':[str(a) for a in args], 'count':count})
+            self.stdout.write(json.dumps(record)+"\n")
+        else: self.stdout.write(msg)
     def Info(self,*arg):
         msg="Info: "+ccat(*arg)+"\n"
         sys.stdout.write(msg)   
-        if (self.logfile !=""): self.stdout.write("Info: "+msg+"\n")   
+        self.Write("info",msg)
+    def Infof(self,template,*args):
+        msg="Info: "+(template % args)+"\n"
+        sys.stdout.write(msg)   
+        self.Write("info",msg,template,args)
     def Warn(self,*arg):
         msg="Warning: "+ccat(*arg)+"\n"
         if msg in self.warnings: self.warnings[msg]=self.warnings[msg]+1
         else: self.warnings[msg]=1
         if self.warnings[msg]<=self.max: 
             sys.stdout.write(self.RED+msg+self.COL_OFF)
-            if (self.logfile !=""): self.stdout.write(msg)
+            self.Write("warning",msg)
             return True   # message printed
         return False      # message just logged
+    def Warnf(self,template,*args):
+        key="Warning: "+template+"\n"
+        count=self.warnings.get(key,0)+1
+        self.warnings[key]=count
+        if count<=self.max: 
+            msg="Warning: "+(template % args)+"\n"
+            sys.stdout.write(self.RED+msg+self.COL_OFF)
+            self.Write("warning",msg,template,args,count)
+            return True   # message printed
+        return False      # message just counted
+    def Merge(self,warnings):   # add warning counts from another logger
+        for msg in warnings:
+            if msg in self.warnings: self.warnings[msg]=self.warnings[msg]+warnings[msg]
+            else: self.warnings[msg]=warnings[msg]
+    def MergeStats(self,timers,counters):   # add timers and counters from another logger
+        for stage in timers: self.AddTime(stage,timers[stage])
+        for counter in counters: self.Count(counter,counters[counter])
+    def Start(self,stage):
+        self.started[stage]=time.time()
+    def Stop(self,stage):
+        self.AddTime(stage,time.time()-self.started.pop(stage))
+    def AddTime(self,stage,seconds):
+        self.timers[stage]=self.timers.get(stage,0)+seconds
+    def Count(self,counter,n=1):
+        self.counters[counter]=self.counters.get(counter,0)+n
+    def Lap(self):   # seconds since the last call
+        now=time.time()
+        seconds=now-self.lap
+        self.lap=now
+        return seconds
+    def Rates(self):
+        total=self.timers.get("total",0)
+        if total<=0: return {}
+        return dict([(counter,self.counters[counter]/total) for counter in self.counters])
+    def WriteStats(self,filename,**info):   # JSON file w/ timers, counters, rates and info
+        stats=dict(info)
+        stats.update({'timers':self.timers, 'counters':self.counters, 'rates':self.Rates(),
+                      'warnings':sum(self.warnings.values())})
+        with open(filename,"w") as f:
+            json.dump(stats,f,indent=1)
     def Fatal(self,*arg):
         msg="**FATAL**: "+ccat(*arg)+"\n"
         sys.stdout.write(self.RED+msg+self.COL_OFF)
-        if (self.logfile !=""): self.stdout.write(msg)
+        self.Write("fatal",msg)
+        if (self.logfile !=""): self.stdout.flush()
         sys.exit(1)
     def Summary(self):
         output = StringIO.StringIO()
@@ -84,8 +161,28 @@ class Logger():
         print >>output,"="*40
         print >>output," WARNING Summary (end)"
         print >>output,"="*40  
+        if len(self.timers)>0 or len(self.counters)>0:
+            print >>output
+            print >>output," TIMING Summary"
+            print >>output,"="*40
+            total=self.timers.get("total",0)
+            for stage in self.timers:
+                if total>0: print >>output,"%-20s %10.2f s (%5.1f%%)" % (stage,self.timers[stage],
+                                                                        100*self.timers[stage]/total)
+                else: print >>output,"%-20s %10.2f s" % (stage,self.timers[stage])
+            rates=self.Rates()
+            for counter in self.counters:
+                if counter in rates: print >>output,"%-20s %10.1f (%10.1f /s)" % (counter,
+                                                        self.counters[counter],rates[counter])
+                else: print >>output,"%-20s %10.1f" % (counter,self.counters[counter])
+            print >>output,"="*40
         print output.getvalue()
-        if (self.logfile !=""): self.stdout.write(output.getvalue())
+        if (self.logfile !="" and self.jsonLines):
+            self.stdout.write(json.dumps({'time':time.time(), 'level':'summary', 
+                                          'warnings':self.warnings, 'timers':self.timers,
+                                          'counters':self.counters})+"\n")
+        elif (self.logfile !=""): self.stdout.write(output.getvalue())
+        if (self.logfile !=""): self.stdout.flush()
         output.close()
 
 # hack to pass immutable data types "by reference" (under consideration)
@@ -96,24 +193,752 @@ class pyref():
         return self.data[0]
 
 
-def TBOpen(fin):
-    if fin.endswith("bz2"): return bz2.BZ2File(fin,"r")
+##############################
+# file operations, in process replacements for the mv/ln/find/mkdir/rm shell-outs
+##############################
+# rename src to dst, replacing dst.  The rename is atomic if both are on the same
+# file system, otherwise the file is copied next to dst and then renamed
+def AtomicRename(src, dst):
+    try:
+        os.rename(src,dst)
+    except OSError as e:
+        if e.errno!=errno.EXDEV: raise
+        tmp=dst+"_tmp%d" % os.getpid()
+        shutil.copy2(src,tmp)
+        os.rename(tmp,dst)
+        os.remove(src)
+
+# point link at target (as "ln -sf target link", w/o a window where link is missing)
+def UpdateSymlink(target, link):
+    tmp=link+"_tmp%d" % os.getpid()
+    if os.path.lexists(tmp): os.remove(tmp)
+    os.symlink(target,tmp)
+    os.rename(tmp,link)
+
+# create a directory and its parents, no error if it exists (as "mkdir -p")
+def MakeDirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno!=errno.EEXIST or not os.path.isdir(path): raise
+
+# remove a file or directory tree, no error if it is missing (as "rm -rf")
+def RemoveTree(path):
+    if os.path.isdir(path) and not os.path.islink(path): shutil.rmtree(path)
+    elif os.path.lexists(path): os.remove(path)
+
+# files in top matching a shell pattern, eg. "rec_capture_*.txt*", sorted by path
+# recurse=True also searches the subdirectories (as "find top -name pattern")
+# uses scandir (os.scandir or the scandir module) if available, the file types come
+# w/ the directory entries so no stat is needed per entry
+def FindFiles(top, pattern, recurse=False):
+    found=[]
+    dirs=[top]
+    while dirs:
+        path=dirs.pop()
+        try:
+            if scandir:
+                for entry in scandir(path):
+                    if entry.is_dir(follow_symlinks=False):
+                        if recurse: dirs.append(entry.path)
+                    elif fnmatch.fnmatch(entry.name,pattern): found.append(entry.path)
+            else:
+                for name in os.listdir(path):
+                    entry=os.path.join(path,name)
+                    if os.path.isdir(entry) and not os.path.islink(entry):
+                        if recurse: dirs.append(entry)
+                    elif fnmatch.fnmatch(name,pattern): found.append(entry)
+        except OSError: continue  # unreadable or vanished directory
+    return sorted(found)
+
+
+##############################
+# seekable bz2 files
+##############################
+# A bz2 file is a sequence of independently compressed blocks, each starting w/ a 48 bit
+# magic number at an arbitrary bit offset (not byte aligned).  The block index maps the
+# bit range of each block to its offset in the uncompressed data.  A block is decompressed
+# on its own by copying its bits into a new single block stream (header + block + end of
+# stream marker w/ the block crc as stream crc), so random access costs one block.
+# The index is cached in [FILE].bzidx (pickled), checked against the file fingerprint.
+BZ2_BLOCK_MAGIC=0x314159265359
+BZ2_EOS_MAGIC=0x177245385090
+
+def BZ2IndexName(bz2File):
+    return bz2File+".bzidx"
+
+# bit offsets of a 48 bit magic number in data (a string or mmap)
+def FindBitPattern(data, magic):
+    found=[]
+    for shift in range(8):
+        window=magic<<(8-shift)     # 56 bit window starting at a byte boundary
+        mask=((1<<48)-1)<<(8-shift)
+        wbytes=unhexlify("%014x" % window)
+        if shift==0: key,lead=wbytes[:6],0   # 6 bytes aligned
+        else: key,lead=wbytes[1:6],1         # the 5 bytes fully covered by the pattern
+        i=data.find(key)
+        while i>=0:
+            start=i-lead
+            if start>=0 and start+7<=len(data):   # always followed by a 32 bit crc
+                if int(hexlify(data[start:start+7]),16)&mask==window: found.append(8*start+shift)
+            i=data.find(key,i+1)
+    return sorted(found)
+
+# nbits of data starting at bit offset start, as a long
+def BitSlice(data, start, nbits):
+    first=start>>3
+    last=(start+nbits+7)>>3
+    value=int(hexlify(data[first:last]),16)
+    return (value>>(8*(last-first)-(start-8*first)-nbits))&((1<<nbits)-1)
+
+# decompress the block w/ bits [start,end) of data
+def BZ2Block(data, start, end):
+    nbits=end-start
+    crc=BitSlice(data,start+48,32)
+    value=(((BitSlice(data,start,nbits)<<48)|BZ2_EOS_MAGIC)<<32)|crc
+    pad=(-(nbits+80))%8
+    nbytes=(nbits+80+pad)/8
+    return bz2.decompress("BZh9"+unhexlify("%0*x" % (2*nbytes,value<<pad)))
+
+# candidate block boundaries (bit offsets of the block and end of stream magic numbers)
+# returns (sorted list of boundaries, set of block starts)
+def BZ2Bounds(data):
+    starts=FindBitPattern(data,BZ2_BLOCK_MAGIC)
+    return (sorted(starts+FindBitPattern(data,BZ2_EOS_MAGIC)),set(starts))
+
+# decompress the block starting at boundary i, returns (index of its end boundary, text)
+# a magic number may also appear by chance in the compressed data: a block that does
+# not decompress is extended to the next boundary, up to tries times
+def BZ2ReadBlock(data, bounds, i, filename="", tries=None):
+    j=i+1
+    while j<len(bounds) and (tries==None or j-i<=tries):
+        try:
+            return (j,BZ2Block(data,bounds[i],bounds[j]))
+        except (IOError, ValueError, EOFError): j=j+1
+    raise IOError("Bad bz2 block at bit %d in %s" % (bounds[i],filename))
+
+# index of the blocks of a bz2 file, [(start bit, end bit, uncompressed offset)]
+# and the uncompressed size.  The index is read from the cache file if it is up to date,
+# else it is built (one pass decompressing each block) and cached if possible.
+# build=False leaves an index that is not cached incomplete, it is then built by Scan
+# while the file is read (see BZ2SeekFile), w/o decompressing the file twice
+class BZ2BlockIndex():
+    def __init__(self,filename,cache=True,build=True):
+        self.filename=filename
+        self.blocks=[]
+        self.size=0
+        self.complete=False
+        self.cache=cache
+        self.fingerprint=FileFingerprint(filename)
+        try:
+            with open(BZ2IndexName(filename),"rb") as f: index=pickle.load(f)
+            if index['fingerprint']==self.fingerprint:
+                self.blocks=index['blocks']
+                self.size=index['size']
+                self.complete=True
+                return
+        except (IOError, OSError, EOFError, KeyError, ValueError, pickle.UnpicklingError): pass
+        if build: self.Build()
+    def Scan(self):   # generator, decompresses the blocks in file order, adding them to the index
+        if self.complete: return
+        with open(self.filename,"rb") as f:
+            if os.fstat(f.fileno()).st_size>0:
+                data=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+                try:
+                    (bounds,starts)=BZ2Bounds(data)
+                    i=0
+                    while i<len(bounds):
+                        if not bounds[i] in starts:
+                            i=i+1
+                            continue
+                        (j,text)=BZ2ReadBlock(data,bounds,i,self.filename)
+                        self.blocks.append((bounds[i],bounds[j],self.size))
+                        self.size=self.size+len(text)
+                        i=j
+                        yield text
+                finally: data.close()
+        self.complete=True
+        self.Save()
+    def Build(self):
+        for text in self.Scan(): pass
+    def Save(self):
+        if not self.cache: return
+        tmp=BZ2IndexName(self.filename)+"_tmp%d" % os.getpid()
+        try:
+            with open(tmp,"wb") as f:
+                pickle.dump({'fingerprint':self.fingerprint, 'blocks':self.blocks, 'size':self.size},f,2)
+            AtomicRename(tmp,BZ2IndexName(self.filename))
+        except (IOError, OSError): # eg. read only data area, the index is kept in memory
+            if os.path.exists(tmp): os.remove(tmp)
+    def __len__(self):
+        return len(self.blocks)
+
+# Read only bz2 file w/ random access, a drop-in for bz2.BZ2File in TBOpen
+# Reading starts as a plain stream (no index needed for sequential reading), the block
+# index is loaded at the first seek to another position.  Then each seek costs
+# at most one block decompression, instead of decompressing from the start of the file.
+# Given an index (BZ2BlockIndex) the file is read in block mode from the start, an
+# incomplete index is completed as the blocks are read
+# Both modes read all bz2 streams of a multi-stream file (eg. from pbzip2), unlike
+# the python 2 bz2.BZ2File, which stops at the end of the first stream
+BZ2_CHUNK=1<<20   # compressed bytes per read in stream mode
+class BZ2SeekFile():
+    def __init__(self,filename,index=None):
+        self.name=filename
+        self.index=None    # block mode
+        self.scan=None     # blocks not in the index yet
+        self.data=None
+        self.offsets=[]
+        self.pos=0
+        self.block=-1
+        self.text=""       # decompressed block (block mode) or piece of text (stream mode)
+        self.start=0       # offset of text in stream mode
+        self.closed=False
+        if index is not None: self.Open(index)
+        else:              # stream mode
+            self.f=open(filename,"rb")
+            self.dec=None      # decompressor of the current stream
+            self.pending=""    # compressed data not decompressed yet
+    def Open(self,index):
+        self.index=index
+        self.offsets=[b[2] for b in index.blocks]
+        if not index.complete: self.scan=index.Scan()
+        self.fd=open(self.name,"rb")
+        if os.fstat(self.fd.fileno()).st_size>0:
+            self.data=mmap.mmap(self.fd.fileno(),0,access=mmap.ACCESS_READ)
+    def Index(self):   # switch to block mode
+        if self.index is not None: return
+        self.f.close()
+        self.text=""
+        self.block=-1
+        self.Open(BZ2BlockIndex(self.name))
+    def Decompress(self):   # next piece of text in stream mode, "" at the end of the file
+        while 1:
+            data=self.pending
+            self.pending=""
+            if len(data)<4: data=data+self.f.read(BZ2_CHUNK)
+            if not data: return ""
+            if self.dec is None:
+                if not data.startswith("BZh"): return ""   # no further stream
+                self.dec=bz2.BZ2Decompressor()
+            try: text=self.dec.decompress(data)
+            except EOFError:   # the stream ended w/ the last piece of data
+                self.dec=None
+                self.pending=data
+                continue
+            if self.dec.unused_data:   # end of the stream, the rest is the next stream
+                self.pending=self.dec.unused_data
+                self.dec=None
+            if text: return text
+    def Fill(self,pos):   # index the blocks up to pos, returns False if pos is past the end
+        while self.scan and pos>=self.index.size:
+            try: self.text=self.scan.next()
+            except StopIteration:
+                self.scan=None
+                break
+            self.offsets.append(self.index.blocks[-1][2])
+            self.block=len(self.offsets)-1
+        return pos<self.index.size
+    def Load(self):   # decompress the block containing pos, returns its text offset
+        k=max(0,bisect_right(self.offsets,self.pos)-1)
+        if k!=self.block:
+            (start,end,offset)=self.index.blocks[k]
+            self.text=BZ2Block(self.data,start,end)
+            self.block=k
+        return self.pos-self.index.blocks[k][2]
+    def Current(self):   # offset of pos in text, -1 at the end of the file
+        if self.index is not None:
+            if not self.Fill(self.pos): return -1
+            return self.Load()
+        while self.pos>=self.start+len(self.text):
+            text=self.Decompress()
+            if not text: return -1
+            self.start=self.start+len(self.text)
+            self.text=text
+        return self.pos-self.start
+    def seek(self,offset,whence=0):
+        if self.index is None:
+            if whence==0 and offset==self.pos: return
+            self.Index()
+        if whence==1: offset=self.pos+offset
+        elif whence==2:
+            self.Fill(sys.maxint)
+            offset=self.index.size+offset
+        if offset<0: raise IOError("Invalid seek offset %d in %s" % (offset,self.name))
+        self.pos=offset
+    def tell(self):
+        return self.pos
+    def read(self,size=-1):
+        if size<0: size=sys.maxint
+        chunks=[]
+        while size>0:
+            i=self.Current()
+            if i<0: break
+            chunk=self.text[i:i+size]
+            chunks.append(chunk)
+            self.pos=self.pos+len(chunk)
+            size=size-len(chunk)
+        return "".join(chunks)
+    def readline(self):
+        chunks=[]
+        while 1:
+            i=self.Current()
+            if i<0: break
+            end=self.text.find("\n",i)
+            if end>=0: chunk=self.text[i:end+1]
+            else: chunk=self.text[i:]
+            chunks.append(chunk)
+            self.pos=self.pos+len(chunk)
+            if end>=0: break
+        return "".join(chunks)
+    def __iter__(self):
+        return self
+    def next(self):
+        line=self.readline()
+        if not line: raise StopIteration
+        return line
+    def close(self):
+        if self.closed: return
+        if self.index is not None:
+            if self.scan: self.scan.close()
+            if self.data: self.data.close()
+            self.fd.close()
+        else: self.f.close()
+        self.closed=True
+    def __enter__(self):
+        return self
+    def __exit__(self,*exc):
+        self.close()
+
+
+# open a PADE or WC file, bz2 files are read w/ BZ2SeekFile, in block mode if index is given
+def TBOpen(fin, index=None):
+    if fin.endswith("bz2"): return BZ2SeekFile(fin,index)
     else: return open(fin,"r")
 
+# split text into lines at "\n" (as readline, splitlines also splits at "\r" etc.)
+def SplitLines(text):
+    lines=text.split("\n")
+    last=lines.pop()
+    lines=[line+"\n" for line in lines]
+    if last: lines.append(last)
+    return lines
+
+# Read ahead of the parser: threads read and decompress the input into a bounded queue
+# of line batches, while the caller parses the lines returned by readline
+# w/ threads>1 the blocks of a bz2 file are decompressed in parallel (bz2 releases the GIL)
+# and queued in file order, else one thread reads the file as a stream (TBOpen).  Both
+# read all streams of a multi-stream bz2 file
+# Only sequential reading is supported (readline, tell, iteration)
+# Stats gives the # of batches, the time readline waited for a batch (stall) and the
+# # of batches ready in the queue when a batch was taken (depth)
+class PrefetchReader():
+    def __init__(self,filename,threads=1,depth=8,chunksize=1<<20):
+        self.name=filename
+        self.chunksize=chunksize
+        self.queue=Queue.Queue(depth)   # line batches, None at end of file, or an exception
+        self.stop=threading.Event()
+        self.lines=[]
+        self.iline=0      # next line in lines
+        self.pos=0
+        self.eof=False
+        self.batches=0
+        self.stall=0.
+        self.depthSum=0
+        self.maxDepth=0
+        self.data=None
+        self.threads=[]
+        if filename.endswith("bz2") and threads>1:
+            self.fd=open(filename,"rb")
+            if os.fstat(self.fd.fileno()).st_size>0:
+                self.data=mmap.mmap(self.fd.fileno(),0,access=mmap.ACCESS_READ)
+                (self.bounds,self.starts)=BZ2Bounds(self.data)
+            if not self.data or not self.starts:   # empty or not a bz2 file, read as a stream
+                if self.data: self.data.close()
+                self.data=None
+                self.fd.close()
+        if self.data:
+            self.order=[i for i in range(len(self.bounds)) if self.bounds[i] in self.starts]
+            self.tasks=Queue.Queue()       # boundary index of each block, in file order
+            for i in self.order: self.tasks.put(i)
+            self.slots=threading.Semaphore(depth)  # blocks decompressed ahead of the queue
+            self.done=threading.Condition()
+            self.results={}     # boundary index : (end boundary index, text or exception)
+            self.skipped=set()  # false block starts, inside another block
+            self.threads=[threading.Thread(target=self.ReadBlocks) for n in range(threads)]
+            self.threads.append(threading.Thread(target=self.Collect))
+        else: self.threads=[threading.Thread(target=self.ReadStream)]
+        for thread in self.threads:
+            thread.daemon=True
+            thread.start()
+
+    def Put(self,item):   # queue a batch, returns False if the reader was closed
+        while not self.stop.is_set():
+            try:
+                self.queue.put(item,True,0.1)
+                return True
+            except Queue.Full: pass
+        return False
+
+    def ReadStream(self):
+        try:
+            f=TBOpen(self.name)
+            while not self.stop.is_set():
+                chunk=f.read(self.chunksize)
+                if not chunk: break
+                chunk=chunk+f.readline()   # end batch on a line boundary
+                if not self.Put(SplitLines(chunk)): break
+            f.close()
+            self.Put(None)
+        except Exception as e: self.Put(e)
+
+    def ReadBlocks(self):   # worker, decompresses the next block in file order
+        while not self.stop.is_set():
+            self.slots.acquire()
+            try: i=self.tasks.get_nowait()
+            except Queue.Empty:
+                self.slots.release()
+                return
+            try: result=BZ2ReadBlock(self.data,self.bounds,i,self.name,3)
+            except Exception as e: result=(None,e)
+            with self.done:
+                if i in self.skipped:
+                    self.skipped.discard(i)
+                    self.slots.release()
+                else:
+                    self.results[i]=result
+                    self.done.notifyAll()
+
+    def Collect(self):   # queues the decompressed blocks in file order, as line batches
+        i=self.order[0]
+        carry=""   # partial line at the end of the last block
+        while not self.stop.is_set():
+            with self.done:
+                while not i in self.results and not self.stop.is_set(): self.done.wait(0.1)
+                if self.stop.is_set(): return
+                (end,text)=self.results.pop(i)
+                if isinstance(text,Exception): end=i+1
+                for k in range(i+1,end):    # false block starts in this block
+                    if not self.bounds[k] in self.starts: continue
+                    if k in self.results:
+                        del self.results[k]
+                        self.slots.release()
+                    else: self.skipped.add(k)
+            self.slots.release()
+            if isinstance(text,Exception):
+                self.Put(text)
+                return
+            lines=SplitLines(carry+text)
+            carry=""
+            if not lines[-1].endswith("\n"): carry=lines.pop()
+            if lines and not self.Put(lines): return
+            k=bisect_left(self.order,end)
+            if k==len(self.order): break
+            i=self.order[k]
+        if carry: self.Put([carry])
+        self.Put(None)
+
+    def readline(self):   # as file.readline, but lines are split at "\n" only
+        while self.iline>=len(self.lines):
+            if self.eof: return ""
+            depth=self.queue.qsize()
+            self.depthSum=self.depthSum+depth
+            self.maxDepth=max(self.maxDepth,depth)
+            start=time.time()
+            batch=self.queue.get()
+            if depth==0: self.stall=self.stall+time.time()-start
+            if isinstance(batch,Exception): raise batch
+            if batch==None:
+                self.eof=True
+                return ""
+            self.batches=self.batches+1
+            self.lines=batch
+            self.iline=0
+        line=self.lines[self.iline]
+        self.iline=self.iline+1
+        self.pos=self.pos+len(line)
+        return line
+    def tell(self):
+        return self.pos
+    def __iter__(self):
+        return self
+    def next(self):
+        line=self.readline()
+        if not line: raise StopIteration
+        return line
+    def Stats(self):
+        return {'batches':self.batches, 'stall':self.stall, 'maxDepth':self.maxDepth,
+                'depth':float(self.depthSum)/max(1,self.batches+self.eof)}
+    def close(self):
+        self.stop.set()
+        if self.data:
+            for thread in self.threads: self.slots.release()  # wake waiting workers
+        for thread in self.threads: thread.join()
+        if self.data:
+            self.data.close()
+            self.fd.close()
+            self.data=None
+
+# find the byte offsets of the spill headers in a PADE file
+# bz2 files are read once in block mode, building their block index on the way, so
+# spills can be read w/ TBOpen(padeDat,index) and a seek to their (uncompressed) offset
+# returns (list of spill header offsets, offset of 1st "fake" line or -1,
+#          BZ2BlockIndex or None for a text file)
+def IndexPadeSpills(padeDat, chunksize=1<<24):
+    index=None
+    if padeDat.endswith("bz2"): index=BZ2BlockIndex(padeDat,build=False)
+    fin=TBOpen(padeDat,index)
+    offsets=[]
+    fake=-1
+    pos=0
+    while 1:
+        chunk=fin.read(chunksize)
+        if not chunk: break
+        chunk=chunk+fin.readline()   # end chunk on a line boundary
+        if fake<0 and "fake" in chunk: fake=pos+chunk.find("fake")
+        i=chunk.find("starting spill")
+        while i>=0:
+            start=chunk.rfind("\n",0,i)+1
+            end=chunk.find("\n",i)
+            if end<0: end=len(chunk)
+            if not "fake" in chunk[start:end]: offsets.append(pos+start)  # as in filler
+            i=chunk.find("starting spill",end)
+        pos=pos+len(chunk)
+    fin.close()
+    return (offsets,fake,index)
+
+# Read a file that is still being written, eg. a PADE file during data taking
+# readline only returns complete lines, waiting for the writer as needed.  It returns ""
+# (end of file) once the file has not grown for idle seconds, or on a keyboard interrupt
+class FollowFile():
+    def __init__(self,filename,idle=600,poll=1.0):
+        self.f=open(filename,"r")
+        self.idle=idle
+        self.poll=poll
+        self.offset=0            # start of the last line returned
+        self.eof=False
+        self.interrupted=False
+    def readline(self):
+        waited=0
+        while not self.eof:
+            pos=self.f.tell()
+            line=self.f.readline()
+            if line.endswith("\n"):
+                self.offset=pos
+                return line
+            self.f.seek(pos)     # partial line, wait for the rest
+            if waited>=self.idle:
+                self.eof=True
+                break
+            try: time.sleep(self.poll)
+            except KeyboardInterrupt:
+                self.eof=True
+                self.interrupted=True
+                return ""
+            waited=waited+self.poll
+        self.offset=self.f.tell()
+        return self.f.readline()  # unterminated last line, if any
+    def seek(self,pos):
+        self.f.seek(pos)
+        self.offset=pos
+    def tell(self):
+        return self.f.tell()
+    def close(self):
+        self.f.close()
+
 ##############################
 # data file parsers
 ##############################
-def ParsePadeData(padeline):
-    padeline=padeline.split()
-    pade_ts=long(padeline[0])
-    pade_transfer_size=int(padeline[1],16)<<8+int(padeline[2],16)
-    pade_board_id=int(padeline[3],16)
-    pade_hw_counter=int(padeline[4]+padeline[5]+padeline[6],16)
-    pade_ch_number=int(padeline[7],16)
-    eventNumber = int(padeline[8]+padeline[9],16)
-    waveform=(padeline[10:])
-    return (pade_ts,pade_transfer_size,pade_board_id,
-            pade_hw_counter,pade_ch_number,eventNumber,waveform)
+# decode a list of PADE channel lines (eg a full spill)
+# returns a list of header tuples, one per line
+#   (pade_ts,pade_transfer_size,pade_board_id,pade_hw_counter,pade_ch_number,eventNumber,nsamples)
+# and an array("i") w/ ndata samples per line, line i is at [i*ndata:(i+1)*ndata]
+# lines w/ the wrong number of samples keep their header, but their samples are set to 0xFFF
+def ParsePadeBlock(padelines, ndata=120):
+    headers=[]
+    words=[]
+    badline=["FFF"]*ndata
+    for padeline in padelines:
+        padeline=padeline.split()
+        nsamples=len(padeline)-10
+        headers.append((long(padeline[0]),
+                        int(padeline[1],16)<<8+int(padeline[2],16),
+                        int(padeline[3],16),
+                        int(padeline[4]+padeline[5]+padeline[6],16),
+                        int(padeline[7],16),
+                        int(padeline[8]+padeline[9],16),
+                        nsamples))
+        if nsamples==ndata: words.extend(padeline[10:])
+        else: words.extend(badline)
+    return headers,DecodeADC(words)
+
+# convert a list of 3 digit hex ADC words to an array("i")
+# each word is padded to 4 digits, so the whole block is decoded in one unhexlify call
+# a block w/ any word that is not 3 digits long (eg. a corrupt line) uses the slow path
+def DecodeADC(words):
+    if set(map(len,words))==set([3]):
+        hexwords="0"+"0".join(words)
+        try:
+            adc=array("H",unhexlify(hexwords))
+            if sys.byteorder=="little": adc.byteswap()
+            return array("i",adc)
+        except TypeError: pass   # not a hex word, use the slow path below
+    return array("i",map(int,words,[16]*len(words)))
+
+# Binary cache of the parsed spills of a PADE file, [PADE_FILE].pcache
+# Repeated conversions of the same file replay the spills from the cache, skipping
+# the text read, bz2 decompression and hex decoding
+# File layout:
+#   per spill : pickled spill record (spill/board header lines, fake flag, line numbers,
+#               channel headers from ParsePadeBlock), followed by the ADC samples
+#   directory : pickled dict w/ spill locations, record checksums and PADE file fingerprint
+#   trailer   : directory offset, directory crc32, format version, magic
+# A cache is rejected if the trailer, the directory checksum, the checksum of any spill
+# record (w/ its samples) or the fingerprint of the PADE file (size, mtime, crc32 of its
+# first and last 64 kB) do not match.  All records are checked when the cache is opened,
+# so a damaged cache falls back to the PADE file before any spill is replayed
+PADECACHE_MAGIC="T1041PC\n"
+PADECACHE_VERSION=2
+PADECACHE_TRAILER="<QIi8s"
+
+def PadeCacheName(padeDat):
+    return re.sub(r"\.bz2$","",padeDat)+".pcache"
+
+def FileFingerprint(filename, nbytes=1<<16):
+    size=os.path.getsize(filename)
+    with open(filename,"rb") as f:
+        crc=zlib.crc32(f.read(nbytes))
+        f.seek(max(0,size-nbytes))
+        crc=zlib.crc32(f.read(nbytes),crc)
+    return (size,os.path.getmtime(filename),crc&0xffffffff)
+
+# written to [PADE_FILE].pcache_tmp, renamed on Close, the tmp file is removed on Abort
+class PadeCacheWriter():
+    def __init__(self,padeDat):
+        self.cacheFile=PadeCacheName(padeDat)
+        self.source=FileFingerprint(padeDat)
+        self.f=open(self.cacheFile+"_tmp","wb")
+        self.spills=[]     # (record offset, record size, sample typecode, nsamples, crc32)
+    def AddSpill(self,spillLine,boardLines,fake,lineNumbers,block):
+        headers,samples=block
+        record=pickle.dumps({'spill':spillLine, 'boards':boardLines, 'fake':fake,
+                             'lines':array("i",lineNumbers), 'headers':headers},2)
+        try: adc=array("H",samples)            # 12 bit ADC samples
+        except OverflowError: adc=array("i",samples)
+        data=adc.tostring()
+        self.spills.append((self.f.tell(),len(record),adc.typecode,
+                            len(adc),zlib.crc32(data,zlib.crc32(record))&0xffffffff))
+        self.f.write(record)
+        self.f.write(data)
+    def Close(self,linesread):
+        directory=pickle.dumps({'source':self.source, 'byteorder':sys.byteorder,
+                                'linesread':linesread, 'spills':self.spills},2)
+        offset=self.f.tell()
+        self.f.write(directory)
+        self.f.write(struct.pack(PADECACHE_TRAILER,offset,zlib.crc32(directory)&0xffffffff,
+                                 PADECACHE_VERSION,PADECACHE_MAGIC))
+        self.f.close()
+        os.rename(self.cacheFile+"_tmp",self.cacheFile)
+    def Abort(self):
+        self.f.close()
+        os.remove(self.cacheFile+"_tmp")
+
+# raises IOError or ValueError if the cache is missing, damaged or out of date
+class PadeCacheReader():
+    def __init__(self,padeDat):
+        self.cacheFile=PadeCacheName(padeDat)
+        self.f=open(self.cacheFile,"rb")
+        self.mm=None
+        try: self.Open(padeDat)
+        except:
+            self.Close()
+            raise
+    def Open(self,padeDat):
+        size=os.fstat(self.f.fileno()).st_size
+        tsize=struct.calcsize(PADECACHE_TRAILER)
+        if size<tsize: raise ValueError("truncated cache file")
+        self.f.seek(size-tsize)
+        offset,crc,version,magic=struct.unpack(PADECACHE_TRAILER,self.f.read(tsize))
+        if magic!=PADECACHE_MAGIC or version!=PADECACHE_VERSION or offset>size-tsize:
+            raise ValueError("unknown cache format")
+        self.f.seek(offset)
+        directory=self.f.read(size-tsize-offset)
+        if zlib.crc32(directory)&0xffffffff!=crc: raise ValueError("bad cache directory")
+        directory=pickle.loads(directory)
+        if directory['source']!=FileFingerprint(padeDat): raise ValueError("cache is out of date")
+        self.swap=(directory['byteorder']!=sys.byteorder)
+        self.linesread=directory['linesread']
+        self.spills=directory['spills']
+        self.mm=mmap.mmap(self.f.fileno(),0,access=mmap.ACCESS_READ)
+        for i in xrange(len(self.spills)):
+            offset,rsize,typecode,nsamples,crc=self.spills[i]
+            end=offset+rsize+nsamples*array(typecode).itemsize
+            if end>size-tsize or zlib.crc32(self.mm[offset:end])&0xffffffff!=crc:
+                raise ValueError("bad cache record for spill %d"%i)
+    def __len__(self):
+        return len(self.spills)
+    # spill record w/ the decoded block, 'block'=(headers,samples) as from ParsePadeBlock
+    def Spill(self,i):
+        offset,rsize,typecode,nsamples,crc=self.spills[i]
+        spill=pickle.loads(self.mm[offset:offset+rsize])
+        adc=array(typecode)
+        adc.fromstring(self.mm[offset+rsize:offset+rsize+nsamples*adc.itemsize])
+        if self.swap: adc.byteswap()
+        spill['block']=(spill['headers'],array("i",adc))
+        return spill
+    def Spills(self):
+        for i in xrange(len(self.spills)): yield self.Spill(i)
+    def Close(self):
+        if self.mm: self.mm.close()
+        self.f.close()
+
+# Fast replacement for time.mktime(time.strptime(date+" "+hms, format)) for the fixed
+# date/time layouts in the PADE and WC files, order gives the order of the date fields:
+#   "dmy" : %d-%m-%y (WC SDATE),  "ymd" : %Y/%m/%d (PADE WC time),  "mdy" : %m/%d/%Y (PADE PC time)
+# The local time of midnight is cached for each date string (LRU), the time of day is
+# added as h*3600+m*60+s.  Days w/ a DST change fall back to a full mktime
+class LRUCache():
+    def __init__(self,maxsize=64):
+        self.maxsize=maxsize
+        self.data=collections.OrderedDict()
+        self.last=(None,None)   # repeated lookups of the same key skip the reordering
+    def get(self,key):
+        if key==self.last[0]: return self.last[1]
+        if not key in self.data: return None
+        value=self.data.pop(key)
+        self.data[key]=value    # most recently used
+        self.last=(key,value)
+        return value
+    def put(self,key,value):
+        if len(self.data)>=self.maxsize: self.data.popitem(last=False)
+        self.data[key]=value
+        self.last=(key,value)
+    def clear(self):
+        self.data.clear()
+        self.last=(None,None)
+
+dateCache=LRUCache(64)
+def FastMktime(date, hms, order="dmy"):
+    if not date or not hms: raise ValueError("missing date or time")
+    day=dateCache.get((date,order))
+    if day==None:
+        fields=[int(field) for field in re.split("[-/]",date)]
+        if len(fields)!=3: raise ValueError("bad date: "+date)
+        if order=="dmy": (d,m,y)=fields
+        elif order=="ymd": (y,m,d)=fields
+        else: (m,d,y)=fields
+        if y<69: y=y+2000      # 2 digit years as in strptime %y
+        elif y<100: y=y+1900
+        if m<1 or m>12 or d<1 or d>31: raise ValueError("bad date: "+date)
+        midnight=time.mktime((y,m,d,0,0,0,0,0,-1))
+        regular=(time.mktime((y,m,d+1,0,0,0,0,0,-1))-midnight==86400)
+        day=(midnight,regular,y,m,d)
+        dateCache.put((date,order),day)
+    if len(hms)==8 and hms[2]==":" and hms[5]==":": (h,mi,sec)=(int(hms[0:2]),int(hms[3:5]),int(hms[6:8]))
+    else: (h,mi,sec)=[int(field) for field in hms.split(":")]
+    if h>23 or mi>59 or sec>61 or h<0 or mi<0 or sec<0: raise ValueError("bad time: "+hms)
+    if day[1]: return day[0]+h*3600+mi*60+sec
+    return time.mktime((day[2],day[3],day[4],h,mi,sec,0,0,-1))   # DST change on this day
 
 def ParsePadeSpillHeader(padeline):
     spill = { 'number':0, 'pctime':0, 'nTrigWC':0, 'wcTime':0, 'status':0 }
@@ -131,16 +956,16 @@ def ParsePadeSpillHeader(padeline):
         return spill
 
     spill['number']=int(padeline[4])
-    pcTime=padeline[7]+" "+padeline[8]+" "+padeline[9]
-    spill['pcTime']=time.mktime(time.strptime(pcTime, "%m/%d/%Y %H:%M:%S %p"))
+    # "%m/%d/%Y %H:%M:%S %p", as in strptime the AM/PM field is ignored w/ %H
+    spill['pcTime']=FastMktime(padeline[7],padeline[8],"mdy")
     try:
         spill['nTrigWC']=wcTiggers=int(padeline[14],16)
     except:
         spill['nTrigWC']=wcTiggers=0
     # check for fake run or # WC time stamp missing
     if haveWCtime: 
-        wcTime=padeline[17]+" 20"+padeline[18]  # fix format to 4-digit year
-        spill['wcTime']=time.mktime(time.strptime(wcTime, "%H:%M:%S %Y/%m/%d"))
+        # "%H:%M:%S %Y/%m/%d" w/ 2-digit year
+        spill['wcTime']=FastMktime("20"+padeline[18],padeline[17],"ymd")
     else:
         spill['wcTime']=0
     return spill
@@ -160,147 +985,212 @@ def ParsePadeBoardHeader(padeline):
     return (master,boardID,status,trgStatus,events,memReg,trigPtr,pTemp,sTemp)
 
 
-def readWCevent(fWC):
-    endOfEvent=0
-    nhits=0
-    while 1:
-        wcline=fWC.readline()
-        if not wcline: break
-        if "SPILL" in wcline: continue
-        wcline=wcline.split()
-        if not foundWC and "EVENT" in wcline[0]:  # found new event
-            trigWCrun=wcline[1]   
-            trigWCspill=wcline[2] 
-            foundWC=true
-            continue
-        elif "EVENT" in wcline[0]: 
-            fWC.seek(endOfEvent)
-            break
-        if "Module" in wcline[0]: 
-            tdcNum=int(wcline[1])
-            endOfEvent=fWC.tell()
-        if "Channel" in wcline[0]: 
-            wire=int(wcline[1])
-            tdcCount=int(wcline[2])
-            eventDict[eventNumber].AddWCHit(tdcNum,wire,tdcCount) #!
-            endOfEvent=fWC.tell()
-            if DEBUG_LEVEL>1: event.GetWCChan(nhits).Dump()
-            nhits=nhits+1
-
-def getWCspills(fWC):    
-    endOfEvent=0
-    fWC.seek(loc)
-    while 1:
-        wcline=fWC.readline()
-        if not wcline: return -1
-        if "SPILL" in wcline: continue
-        wcline=wcline.split()
-        if not foundWC and "EVENT" in wcline[0]:  # found new event
-            trigWCrun=wcline[1]   
-            trigWCspill=wcline[2] 
-            foundWC=true
-            continue
-        elif "EVENT" in wcline[0]: 
-            fWC.seek(endOfEvent)
-            break
-        if "Module" in wcline[0]: 
-            tdcNum=int(wcline[1])
-            endOfEvent=fWC.tell()
-        if "Channel" in wcline[0]: 
-            wire=int(wcline[1])
-            tdcCount=int(wcline[2])
-            eventDict[eventNumber].AddWCHit(tdcNum,wire,tdcCount) #!
-            endOfEvent=fWC.tell()
-            if DEBUG_LEVEL>1: event.GetWCChan(nhits).Dump()
-            nhits=nhits+1
+# In memory index of the WC spill DB (wcdb.txt)
+# The DB is read once into arrays sorted by spill time, lookups use a binary search.
+# WC files are kept open, bz2 files are read w/ the block index (BZ2SeekFile), so
+# seeking to a spill decompresses a single block
+class WCIndex():
+    def __init__(self,filename="wcdb.txt"):
+        self.filename=filename
+        self.times=[]     # spill time from WC controller
+        self.files=[]     # WC data file
+        self.offsets=[]   # byte offset of SPILL line
+        self.handles={}   # open WC files
+        self.eventDB=OpenWCEventDB(filename)
+        spills=[]
+        try:
+            for line in open(filename,"r"):
+                split = re.split(' +', line.strip())
+                if len(split)<5: continue
+                spills.append((float(split[0]),split[3],int(split[4])))
+        except IOError as e:
+            print "Failed to open file %s due to %s" % (filename, e)
+        spills.sort()
+        for (sTime,wcFile,offset) in spills:
+            self.times.append(sTime)
+            self.files.append(wcFile)
+            self.offsets.append(offset)
 
+    # match WC spills w/in PAST bound seconds of WC timestamp read by PADE
+    # returns (byte offset, filename) of 1st matching spill or (-1, None)
+    def Lookup(self,tgttime,bound=45):
+        i=bisect_left(self.times,tgttime-bound)
+        if i<len(self.times) and self.times[i]<=tgttime:   # fuzzy time match
+            return (self.offsets[i],self.files[i])
+        return (-1,None)
 
-# WC Database lookup
-# match WC spills w/in PAST 45 seconds of WC timestamp read by PADE
-def wcLookup(tgttime, bound=45, filename="wcdb.txt"):
-    print "tgttime",tgttime
-    lookval=int(tgttime)/100   # seek matches w/in 100 second time range
-    try:
-        stat,spills=getstatusoutput("look "+str(lookval)+" "+filename)   # binary search of file
-        if (int(stat)!=0) or len(spills)==0: 
-            return (-1, None)                # no lines match
-        spills=spills.split("\n") 
-        for spill in spills:   # search spills <100 seconds from time in PADE spill header 
-            print spill
-            split = re.split(' +', spill.strip())
-            sTime = float(split[0]) # spill time from WC controller
-            diff = tgttime-sTime    # PADE read time - WC DAQ read time
-            print "diff",diff
-            if diff<0:        # Moved past the spill in the db file
-                print "miss!"
-                return (-1, None)
-            if diff <= bound:   # fuzzy time match
-                return( int(split[4]),split[3] )  # byte offset and filename
+    # decode all events in a WC spill
+    # returns {PADE event number : [(tdcNum,wire,tdcCount),...]}
+    def ReadSpill(self,wcFile,spillOffset,logger=None):
+        hits={}
+        fd=self.Open(wcFile)
+        fd.seek(spillOffset)
+        wcline=fd.readline()  # remove 1st line constaining SPILL number
+        event=None
+        while 1:
+            wcline=fd.readline()
+            if not wcline or "SPILL" in wcline: break
+            if "EVENT" in wcline:
+                event=int(wcline.split()[2])-1  # WC/PADE events start at 1/0
+                hits[event]=[]
+                etime=fd.readline()            # discard ETIME line
+                continue
+            if event==None: continue   # spill header lines
+            wcline=wcline.split()
+            if len(wcline)<2 and logger: logger.Warn("Error in line from WC file:",wcline)
+            if "Module" in wcline: tdcNum=int(wcline[1])
+            elif "Channel" in wcline:
+                hits[event].append((tdcNum,int(wcline[1]),int(wcline[2])))
+            else: event=None   # end of hits for this event
+        return hits
 
-    except IOError as e:
-        print "Failed to open file %s due to %s" % (filename, e)
+    def Open(self,wcFile):
+        if not wcFile in self.handles: self.handles[wcFile]=TBOpen(wcFile)
+        return self.handles[wcFile]
 
-    return (-1,None)
+    # close the WC files and the event DB, the spill index is kept (see GetWCIndex)
+    def Close(self):
+        for wcFile in self.handles: self.handles[wcFile].close()
+        self.handles={}
+        if self.eventDB: self.eventDB.Close()
+        self.eventDB=None
 
 
-# WC Database lookup [old version]
-# match WC spills w/in 15 seconds of timestamp given by PADE
-def wcLookup_(tgttime, bound=15, filename="wcdb.txt"):
-    lookval=long(tgttime)/1000   # seek matches w/in 1000 second time range
-    try:
-        stat,spills=getstatusoutput("look "+str(lookval)+" "+filename)   # binary search of file
-        if (int(stat)!=0) or len(spills)==0: 
-            return (-1, None)                # no lines match
-        spills=spills.split("\n") 
-        for spill in spills:   # search spills <100 seconds from time in PADE spill header 
-            split = re.split(' +', spill.strip())
-            sTime = float(split[0])
-            diff = sTime-tgttime
-            if abs(diff) <= bound:   # fuzzy time match
-                return( int(split[4]),split[3] )  # byte offset and filename
-            elif (diff>bound):       # Moved past the spill in the db file
-                return (-1, None)
+# Event level index of the WC data, a SQLite DB written by wcdbGenerator w/ the spill DB
+#   files  : WC file paths
+#   spills : spill time, byte offset of the SPILL line and # of events for each spill
+#   events : WC event number (starts at 1), offset of the line following the EVENT
+#            record and # of hits for each event
+# The converter only uses the trigger count of a spill (SpillTriggers), it decodes whole
+# WC spills (WCIndex.ReadSpill).  The event offsets are an index for external tools
+def WCEventDBName(dbfile="wcdb.txt"):
+    return re.sub(r"\.txt$","",dbfile)+"_events.sqlite"
 
-    except IOError as e:
-        print "Failed to open file %s due to %s" % (filename, e)
+# None if the event DB does not exist (or sqlite3 is not available)
+def OpenWCEventDB(dbfile="wcdb.txt"):
+    if not sqlite3 or not os.path.isfile(WCEventDBName(dbfile)): return None
+    try: return WCEventDB(dbfile)
+    except sqlite3.Error as e:
+        print "Failed to open WC event DB for %s due to %s" % (dbfile, e)
+        return None
 
-    return (-1,None)
+class WCEventDB():
+    def __init__(self,dbfile="wcdb.txt"):
+        self.filename=WCEventDBName(dbfile)
+        self.db=sqlite3.connect(self.filename)
+        self.db.text_factory=str
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE);
+            CREATE TABLE IF NOT EXISTS spills (id INTEGER PRIMARY KEY, file INTEGER, 
+                offset INTEGER, unixtime REAL, nevents INTEGER);
+            CREATE UNIQUE INDEX IF NOT EXISTS spill_offset ON spills (file, offset);
+            CREATE INDEX IF NOT EXISTS spill_time ON spills (unixtime);
+            CREATE TABLE IF NOT EXISTS events (spill INTEGER, event INTEGER, 
+                offset INTEGER, nhits INTEGER, PRIMARY KEY (spill, event));""")
+        self.spillIds={}   # (WC file, spill offset) : spill id
 
-# WC Database lookup [older version]
-# match WC spills w/in 15 seconds of timestamp given by PADE
-def wcLookup__(tgttime, bound=15, filename="wcdb.txt"):
-    tgttime=float(tgttime)
-    try:
-        handle = open(filename, 'r')        
-        withinBound = []
-        for line in handle:                       # todo: replace with binary search!
-            split = re.split(' +', line.strip())
-            sTime = float(split[0])
-            diff = sTime-tgttime
-
-            if abs(diff) <= bound:   # fuzzy time match
-                return( int(split[4]),split[3] )  # byte offset and filename
-            elif (diff>bound):       # Moved past the spill in the db file
-                return (-1, None)
+    def Files(self):
+        return set([row[0] for row in self.db.execute("SELECT path FROM files")])
 
-    except IOError as e:
-        print "Failed to open file %s due to %s" % (filename, e)
+    # remove all spills and events of a WC file
+    def Remove(self,wcFile):
+        self.db.execute("DELETE FROM events WHERE spill IN (SELECT spills.id FROM spills, files "
+                        "WHERE spills.file=files.id AND files.path=?)",(wcFile,))
+        self.db.execute("DELETE FROM spills WHERE file IN (SELECT id FROM files WHERE path=?)",
+                        (wcFile,))
+        self.db.execute("DELETE FROM files WHERE path=?",(wcFile,))
+        self.spillIds={}
+
+    # add a WC file, spills=[(unixtime, spill offset, [(WC event, offset, nhits),...]),...]
+    def Add(self,wcFile,spills):
+        fileId=self.db.execute("INSERT INTO files (path) VALUES (?)",(wcFile,)).lastrowid
+        for (unixtime,spillOffset,events) in spills:
+            spillId=self.db.execute("INSERT INTO spills (file, offset, unixtime, nevents) "
+                                    "VALUES (?,?,?,?)",
+                                    (fileId,spillOffset,unixtime,len(events))).lastrowid
+            self.db.executemany("INSERT OR REPLACE INTO events VALUES (?,?,?,?)",
+                                [(spillId,event,offset,nhits) for (event,offset,nhits) in events])
+
+    def Commit(self):
+        self.db.commit()
+
+    def Close(self):
+        self.db.close()
+
+    def SpillId(self,wcFile,spillOffset):
+        key=(wcFile,spillOffset)
+        if not key in self.spillIds:
+            row=self.db.execute("SELECT spills.id FROM spills, files WHERE spills.file=files.id "
+                                "AND files.path=? AND spills.offset=?",key).fetchone()
+            if row: self.spillIds[key]=row[0]
+            else: return None
+        return self.spillIds[key]
+
+    # number of WC events (triggers) in a spill, None if the spill is not indexed
+    def SpillTriggers(self,wcFile,spillOffset):
+        spillId=self.SpillId(wcFile,spillOffset)
+        if spillId==None: return None
+        return self.db.execute("SELECT nevents FROM spills WHERE id=?",(spillId,)).fetchone()[0]
+
+
+# one WCIndex per DB file, reloaded if the DB file changes
+# the WC files and event DB of a closed index are reopened on use
+wcIndexCache={}
+def GetWCIndex(filename="wcdb.txt"):
+    try: mtime=os.path.getmtime(filename)
+    except OSError: mtime=0
+    if filename in wcIndexCache and wcIndexCache[filename][0]!=mtime:
+        wcIndexCache[filename][1].Close()
+        del wcIndexCache[filename]
+    if not filename in wcIndexCache:
+        wcIndexCache[filename]=(mtime,WCIndex(filename))
+    wcIndex=wcIndexCache[filename][1]
+    if not wcIndex.eventDB: wcIndex.eventDB=OpenWCEventDB(filename)
+    return wcIndex
 
-    return (-1,None)
+# close the files held by the cached WC indexes, eg. at the end of a conversion
+def CloseWCIndex():
+    for (mtime,wcIndex) in wcIndexCache.values(): wcIndex.Close()
 
 
+# WC Database lookup
+# match WC spills w/in PAST 45 seconds of WC timestamp read by PADE
+def wcLookup(tgttime, bound=45, filename="wcdb.txt"):
+    return GetWCIndex(filename).Lookup(tgttime,bound)
 
 
-# find matching WC event number
-def findWCEvent(fd,tgtevent):
-    wcline=fd.readline()  # remove 1st line constaining SPILL number
-    while(1):
-        wcline=fd.readline()
-        if not wcline or "SPILL" in wcline: return -1
-        if "EVENT" in wcline:
-            thisevent=int(wcline.split()[2])
-            if thisevent-1==tgtevent: return fd.tell()  # WC/PADE events start at 1/0
-            elif thisevent-1>tgtevent: return -1  # past the event number
+# Batch reconstruction of PADE wave forms w/ WaveReco (libTB.so must be loaded)
+# Returns a float32 array, one row per channel, columns WaveReco.kPedestal ... kStatus
+# Rows below the nSigmaCut ZSP threshold have TBRecHit.kZSP set in the kStatus column
+# RecoTable(event) reconstructs the PADE channels of a TBEvent, RecoTable(samples,
+# channelIndex,laser,timeStamp) the rows of a (nrows,nsamples) sample array, eg. the
+# channels of a block of events, w/ at least WaveReco.MIN_SAMPLES samples per row
+# Needs numpy, w/o numpy use WaveReco.Reconstruct(event) and WaveReco.Hits()
+def RecoTable(data, channelIndex=None, laser=None, timeStamp=0, nSigmaCut=0, reco=None):
+    if numpy is None: raise ImportError("RecoTable needs numpy, use WaveReco.Hits() instead")
+    if reco is None: reco=WaveReco(nSigmaCut)
+    if channelIndex is None: reco.Reconstruct(data)   # TBEvent
+    else:
+        samples=numpy.ascontiguousarray(data,dtype=numpy.uint16)
+        nrows,nsamples=samples.shape
+        if nsamples<WaveReco.MIN_SAMPLES:
+            raise ValueError("RecoTable needs at least %d samples per row, got %d" %
+                             (WaveReco.MIN_SAMPLES,nsamples))
+        channelIndex=numpy.ascontiguousarray(channelIndex,dtype=numpy.int32)
+        laser=numpy.ascontiguousarray(laser,dtype=numpy.int32)
+        reco.Reconstruct(samples,nrows,nsamples,nsamples,channelIndex,laser,long(timeStamp))
+    table=numpy.zeros((reco.NRows(),WaveReco.kNColumns),dtype=numpy.float32)
+    if reco.NRows()>0: reco.GetTable(table)
+    return table
+
+# samples of a PadeChannel w/o a copy, as a NumPy uint16 array if numpy is available
+# (else the PyROOT buffer), only valid as long as the event holding the channel
+def WformView(pade, nsamples=None):
+    if nsamples is None: nsamples=PadeChannel.N_PADE_SAMPLES
+    wform=pade.GetWform()
+    if numpy is None: return wform
+    wform.SetSize(nsamples)
+    return numpy.frombuffer(wform,dtype=numpy.uint16,count=nsamples)
 
 
 def getTableXY(timeStamp):
@@ -321,80 +1211,239 @@ def getTableXY(timeStamp):
         print "Failed to open file %s due to %s" % (posFile, e)
     return (x,y)
 
-def getRunData(timeStamp):
-    with open('runlist.dat', 'r') as f:
-        runlist = pickle.load(f)
-    print "search for",timeStamp
+# decode a spreadsheet row of the run list (as in runlist.dat) into typed run data
+# returns (pid,momentum,gain,tableX,tableY,angle)
+def parseRunRow(run):
+    particle=run[3]
+    try: 
+        vga=int(run[4],16)
+    except: 
+        vga=0
 
-    for run in runlist:  # could move to a binary search
-        if run[0]==timeStamp:
-            print run
-            particle=run[3]
-            try: 
-                vga=int(run[4],16)
-            except: 
-                vga=0
-
-            momentum=run[5].replace("GeV","")
-            try: momentum=float(momentum)
-            except: momentum=0
-
-            # table location
-            try: 
-                tableX=float(run[18])
-            except: 
-                tableX=-999.
-            try: 
-                tableY=float(run[19])
-            except: 
-                tableY=-999.
-            # beam type
-            pid=0
-            if "elec" in particle: 
-                pid=11
-            elif "posi" in particle: 
-                pid=-11
-            elif "muo" in particle: 
-                pid=12
-            elif "pion" in particle: 
-                pid=211
-            elif "prot" in particle: 
-                pid=2212
-            elif "las" in particle:  
-                pid=-22
-
-            # gain setting
-            pga_lna=run[6]
-            gain=6 # default is Mid_High  = 0110 binary
-            if "Low_" in pga_lna: gain=gain-4
-            #elif "Mid_" in pga_lna: gain=gain
-            elif "High_" in pga_lna: gain=gain+4
-            elif "VHigh_" in pga_lna: gain=gain+8
-            if "_Low" in pga_lna: gain=gain-2
-            elif "_Mid" in pga_lna: gain=gain-1
-            #elif "_High" in pga_lna: gain=gain
-
-            gain=gain+vga<<4
+    momentum=run[5].replace("GeV","")
+    try: momentum=float(momentum)
+    except: momentum=0
 
-            try:
-                angle=float(run[20])
-            except:
-                angle=0
-            return (pid,momentum,gain,tableX,tableY,angle)
-    return []
+    # table location
+    try: 
+        tableX=float(run[18])
+    except: 
+        tableX=-999.
+    try: 
+        tableY=float(run[19])
+    except: 
+        tableY=-999.
+    # beam type
+    pid=0
+    if "elec" in particle: 
+        pid=11
+    elif "posi" in particle: 
+        pid=-11
+    elif "muo" in particle: 
+        pid=12
+    elif "pion" in particle: 
+        pid=211
+    elif "prot" in particle: 
+        pid=2212
+    elif "las" in particle:  
+        pid=-22
+
+    # gain setting
+    pga_lna=run[6]
+    gain=6 # default is Mid_High  = 0110 binary
+    if "Low_" in pga_lna: gain=gain-4
+    #elif "Mid_" in pga_lna: gain=gain
+    elif "High_" in pga_lna: gain=gain+4
+    elif "VHigh_" in pga_lna: gain=gain+8
+    if "_Low" in pga_lna: gain=gain-2
+    elif "_Mid" in pga_lna: gain=gain-1
+    #elif "_High" in pga_lna: gain=gain
+
+    gain=gain+vga<<4
+
+    try:
+        angle=float(run[20])
+    except:
+        angle=0
+    return (pid,momentum,gain,tableX,tableY,angle)
+
+
+# Run list w/ the decoded run data, indexed by time stamp (SQLite)
+# Rows are decoded once, when the run list is stored.  The spreadsheet rows are kept
+# (pickled) in their original order for dumpRunDat and lastRunDat
+# runlist.sqlite is made from runlist.dat if it is missing or older than runlist.dat
+# w/o sqlite3 the rows of runlist.dat are scanned instead (RunList)
+RUNDB="runlist.sqlite"
+RUNLIST="runlist.dat"
+
+class RunDB():
+    def __init__(self,filename=RUNDB):
+        self.filename=filename
+        self.db=sqlite3.connect(filename)
+        self.db.text_factory=str
+        self.db.execute("""CREATE TABLE IF NOT EXISTS runs (timestamp TEXT PRIMARY KEY, seq INTEGER, 
+                           pid INTEGER, momentum REAL, gain INTEGER, tableX REAL, tableY REAL,
+                           angle REAL, fields TEXT)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS run_seq ON runs (seq)")
+
+    # replace the run list, runlist holds the rows as written to runlist.dat
+    def Store(self,runlist):
+        self.db.execute("DELETE FROM runs")
+        self.Insert(runlist,0)
+        self.db.commit()
+
+    # add rows, the first row for a time stamp is kept
+    def Insert(self,runlist,seq):
+        for run in runlist:
+            try: runData=parseRunRow(run)
+            except (IndexError, AttributeError): runData=(None,)*6   # incomplete row
+            self.db.execute("INSERT OR IGNORE INTO runs VALUES (?,?,?,?,?,?,?,?,?)",
+                            (run[0],seq)+runData+(sqlite3.Binary(pickle.dumps(run,2)),))
+            seq=seq+1
+        return seq
+
+    # add new runs and update changed ones, returns the lists of (added, changed) rows
+    # runs not in runlist are kept, new runs are added after the known ones
+    def Merge(self,runlist):
+        added=[]
+        changed=[]
+        seen=set()     # the first row for a time stamp is used
+        seq=self.db.execute("SELECT COALESCE(MAX(seq),-1)+1 FROM runs").fetchone()[0]
+        for run in runlist:
+            if run[0] in seen: continue
+            seen.add(run[0])
+            old=self.Row(run[0])
+            if old==None:
+                seq=self.Insert([run],seq)
+                added.append(run)
+            elif old!=run:
+                try: runData=parseRunRow(run)
+                except (IndexError, AttributeError): runData=(None,)*6
+                self.db.execute("UPDATE runs SET pid=?, momentum=?, gain=?, tableX=?, tableY=?, "
+                                "angle=?, fields=? WHERE timestamp=?",
+                                runData+(sqlite3.Binary(pickle.dumps(run,2)),run[0]))
+                changed.append(run)
+        self.db.commit()
+        return (added,changed)
+
+    # (pid,momentum,gain,tableX,tableY,angle), None if the run is not in the list
+    def Get(self,timeStamp):
+        run=self.db.execute("SELECT pid, momentum, gain, tableX, tableY, angle FROM runs "
+                            "WHERE timestamp=?",(timeStamp,)).fetchone()
+        if not run or run[0]==None: return None
+        return run
+
+    # spreadsheet row of a run, None if the run is not in the list
+    def Row(self,timeStamp):
+        row=self.db.execute("SELECT fields FROM runs WHERE timestamp=?",(timeStamp,)).fetchone()
+        if row: return pickle.loads(str(row[0]))
+        return None
+
+    def Rows(self):
+        for (fields,) in self.db.execute("SELECT fields FROM runs ORDER BY seq"):
+            yield pickle.loads(str(fields))
+
+    def Last(self):
+        row=self.db.execute("SELECT fields FROM runs ORDER BY seq DESC LIMIT 1").fetchone()
+        if row: return pickle.loads(str(row[0]))
+        return None
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+
+    def Close(self):
+        self.db.close()
+
+# RunDB interface for runlist.dat, used if sqlite3 is not available
+# the rows are decoded on lookup, changes are kept in memory (runlist.dat is
+# written by getRunData.py)
+class RunList():
+    def __init__(self,filename=RUNLIST):
+        self.filename=filename
+        with open(filename, 'r') as f: self.runs=pickle.load(f)
+
+    def Merge(self,runlist):
+        added=[]
+        changed=[]
+        seen=set()
+        for run in runlist:
+            if run[0] in seen: continue
+            seen.add(run[0])
+            old=self.Row(run[0])
+            if old==None:
+                self.runs.append(run)
+                added.append(run)
+            elif old!=run:
+                self.runs[self.runs.index(old)]=run
+                changed.append(run)
+        return (added,changed)
+
+    def Get(self,timeStamp):
+        run=self.Row(timeStamp)
+        if not run: return None
+        try: return parseRunRow(run)
+        except (IndexError, AttributeError): return None   # incomplete row
+
+    def Row(self,timeStamp):
+        for run in self.runs:
+            if run[0]==timeStamp: return run
+        return None
+
+    def Rows(self):
+        return iter(self.runs)
+
+    def Last(self):
+        if self.runs: return self.runs[-1]
+        return None
+
+    def __len__(self):
+        return len(self.runs)
+
+    def Close(self):
+        pass
+
+# write a new run DB, the DB is made in a tmp file and renamed (safe w/ parallel jobs)
+def MakeRunDB(runlist, filename=RUNDB):
+    if not sqlite3: return   # runlist.dat is used directly
+    tmpFile=filename+"_tmp%d" % os.getpid()
+    rundb=RunDB(tmpFile)
+    rundb.Store(runlist)
+    rundb.Close()
+    os.rename(tmpFile,filename)
+
+# open the run DB, (re)made from runlist.dat if needed, None if there is no run list
+def OpenRunDB(filename=RUNDB, runlist=RUNLIST):
+    if not sqlite3:
+        if os.path.isfile(runlist): return RunList(runlist)
+        return None
+    if os.path.isfile(runlist) and (not os.path.isfile(filename) or 
+                                    os.path.getmtime(filename)<os.path.getmtime(runlist)):
+        with open(runlist, 'r') as f:
+            MakeRunDB(pickle.load(f),filename)
+    if os.path.isfile(filename): return RunDB(filename)
+    return None
+
+def getRunData(timeStamp):
+    rundb=OpenRunDB()
+    print "search for",timeStamp
+    if not rundb: return []
+    run=rundb.Get(timeStamp)
+    rundb.Close()
+    if not run: return []
+    print run
+    return run
 
 def lastRunDat():
-    if not os.path.isfile('runlist.dat') : return "00000000_000000"
-    with open('runlist.dat', 'r') as f:
-        runlist = pickle.load(f)
-    runs=len(runlist)
-    last=runlist[runs-1][2].replace(".txt","").replace("rec_capture_","")
-    return last
+    rundb=OpenRunDB()
+    if not rundb: return "00000000_000000"
+    last=rundb.Last()
+    rundb.Close()
+    if not last: return "00000000_000000"
+    return last[2].replace(".txt","").replace("rec_capture_","")
 
 
 def dumpRunDat():
-    with open('runlist.dat', 'r') as f:
-        runlist = pickle.load(f)
-    runs=len(runlist)
-    for a in range(len(runlist)):
-        print runlist[a]
+    rundb=OpenRunDB()
+    if not rundb: return
+    for run in rundb.Rows(): print run
+    rundb.Close()
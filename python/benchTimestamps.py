@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# Micro-benchmark of the spill time stamp parsing, time.strptime+mktime vs. FastMktime
+# Time stamps of a full season (1 spill/minute) are converted in each file layout
+# Usage: python benchTimestamps.py [-d days] [-s start date YYYY/MM/DD]
+
+import sys, getopt, time
+from TBUtils import *
+
+def usage():
+    print
+    print "Usage: python benchTimestamps.py [OPTION]"
+    print "      -d days        : Length of the season [120]"
+    print "      -s YYYY/MM/DD  : First day of the season [2014/07/01]"
+    print
+    sys.exit()
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], "d:s:")
+except getopt.GetoptError as err: usage()
+
+days=120
+start="2014/07/01"
+for o, a in opts:
+    if o == "-d": days=int(a)
+    elif o == "-s": start=a
+
+t0=time.mktime(time.strptime(start,"%Y/%m/%d"))
+stamps=[time.localtime(t0+60*i) for i in xrange(days*24*60)]
+
+# layout: (strptime format, date string, time string, FastMktime order)
+layouts=[("WC SDATE/STIME", "%d-%m-%y %H:%M:%S", "%d-%m-%y", "%H:%M:%S", "dmy"),
+         ("PADE WC time",   "%Y/%m/%d %H:%M:%S", "%Y/%m/%d", "%H:%M:%S", "ymd"),
+         ("PADE PC time",   "%m/%d/%Y %H:%M:%S", "%m/%d/%Y", "%H:%M:%S", "mdy")]
+
+print "Converting",len(stamps),"time stamps per layout"
+print "%-16s %14s %14s %8s %10s" % ("layout","strptime[us]","FastMktime[us]","speedup","mismatch")
+for (name,fullFormat,dateFormat,hmsFormat,order) in layouts:
+    strings=[(time.strftime(dateFormat,t),time.strftime(hmsFormat,t)) for t in stamps]
+
+    begin=time.time()
+    slow=[time.mktime(time.strptime(date+" "+hms,fullFormat)) for (date,hms) in strings]
+    tslow=time.time()-begin
+
+    dateCache.clear()
+    begin=time.time()
+    fast=[FastMktime(date,hms,order) for (date,hms) in strings]
+    tfast=time.time()-begin
+
+    mismatch=sum([a!=b for (a,b) in zip(slow,fast)])
+    print "%-16s %14.2f %14.2f %8.1f %10d" % (name,tslow/len(strings)*1e6,tfast/len(strings)*1e6,
+                                              tslow/max(tfast,1e-9),mismatch)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# Compare t1041 output settings (split level, compression) on a reference run
+# Each setting is converted w/ TBTreeMaker, then a few column sets are read back
+# Usage: python benchTreeIO.py [OPTION] PADE_FILE
+
+import sys, os, getopt, time, commands
+from ROOT import *
+from TBUtils import *
+
+# name, TBTreeMaker options
+SETTINGS=[("split0_zlib1",  "--split=0 --compress=ZLIB:1"),
+          ("split99_zlib1", "--split=99 --compress=ZLIB:1"),
+          ("split99_lz4",   "--split=99 --compress=LZ4:4"),
+          ("split99_zstd",  "--split=99 --compress=ZSTD:5"),
+          ("split99_lzma",  "--split=99 --compress=LZMA:5")]
+
+# column sets read back, branch patterns for split and unsplit trees
+COLUMNS=[("all",      ["*"],                          ["*"]),
+         ("waveform", ["padeChannel","padeChannel._wform*"], ["tbevent*"]),
+         ("wc",       ["wc","wc.*"],                  ["tbevent*"])]
+
+def usage():
+    print
+    print "Usage: python benchTreeIO.py [OPTION] PADE_FILE"
+    print "      -n max_events  : Maximum (requested) number of events to convert"
+    print "      -o DIR         : Work dir for the output files [benchTreeIO]"
+    print "      -k             : Keep the output files"
+    print
+    sys.exit()
+
+
+# read the enabled branches of all entries, returns (seconds, bytes read)
+def readColumns(fileName, patterns):
+    tf=TFile(fileName)
+    tree=tf.Get("t1041")
+    tree.SetBranchStatus("*",0)
+    for pattern in patterns: tree.SetBranchStatus(pattern,1)
+    nbytes=0
+    start=time.time()
+    for i in xrange(tree.GetEntries()): nbytes=nbytes+tree.GetEntry(i)
+    seconds=time.time()-start
+    tf.Close()
+    return (seconds,nbytes)
+
+
+# read a bz2 PADE file sequentially, plain stream vs block mode building the block index
+# (as IndexPadeSpills), returns [(name, seconds)]
+def readBZ2(padeDat):
+    reads=[]
+    start=time.time()
+    bz2.BZ2File(padeDat).read()
+    reads.append(("BZ2File",time.time()-start))
+    start=time.time()
+    with BZ2SeekFile(padeDat,BZ2BlockIndex(padeDat,cache=False,build=False)) as f: f.read()
+    reads.append(("BZ2SeekFile+index",time.time()-start))
+    start=time.time()
+    (bounds,starts)=BZ2Bounds(open(padeDat,"rb").read())
+    reads.append(("bit search",time.time()-start))
+    return reads
+
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], "n:o:k")
+except getopt.GetoptError as err: usage()
+
+nMax=""
+workDir="benchTreeIO"
+keep=False
+for o, a in opts:
+    if o == "-n": nMax="-n "+a
+    elif o == "-o": workDir=a
+    elif o == "-k": keep=True
+if len(args)!=1: usage()
+padeDat=args[0]
+
+LoadLibs("TBLIB","libTB.so")
+treeMaker=os.path.join(os.path.dirname(os.path.abspath(__file__)),"TBTreeMaker.py")
+rootName=os.path.basename(padeDat).replace(".bz2","").replace(".txt",".root")
+
+results=[]
+for (name,options) in SETTINGS:
+    outDir=os.path.join(workDir,name)
+    MakeDirs(outDir)
+    print "Converting",padeDat,"w/",options
+    start=time.time()
+    status,output=commands.getstatusoutput(ccat("python",treeMaker,"-f",nMax,options,
+                                                "-o",outDir,padeDat))
+    wtime=time.time()-start
+    outFile=os.path.join(outDir,rootName)
+    if status!=0 or not os.path.isfile(outFile):
+        print output
+        print "Conversion failed for",name
+        continue
+    tf=TFile(outFile)
+    nevents=tf.Get("t1041").GetEntries()
+    tf.Close()
+    split=not "--split=0" in options
+    reads=[]
+    for (column,splitPatterns,patterns) in COLUMNS:
+        if split: reads.append(readColumns(outFile,splitPatterns))
+        else: reads.append(readColumns(outFile,patterns))
+    results.append((name,os.path.getsize(outFile),nevents,wtime,reads))
+    if not keep: os.remove(outFile)
+
+print
+print "%-14s %10s %8s %12s" % ("setting","size[MB]","events","write[ev/s]"),
+for column in COLUMNS: print "%16s" % ("read "+column[0]+"[ev/s]"),
+print
+for (name,size,nevents,wtime,reads) in results:
+    print "%-14s %10.1f %8d %12.1f" % (name,size/1e6,nevents,nevents/max(wtime,1e-6)),
+    for (seconds,nbytes) in reads: print "%16.1f" % (nevents/max(seconds,1e-6)),
+    print
+print
+print "write rate includes parsing the PADE file, the read rates decompress the given columns only"
+
+if padeDat.endswith("bz2"):
+    print "bz2 input read [s]:",
+    for (name,seconds) in readBZ2(padeDat): print "%s %.2f " % (name,seconds),
+    print
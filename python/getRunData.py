@@ -1,18 +1,37 @@
 from HTMLParser import HTMLParser
-from subprocess import check_output
-import pickle
+from subprocess import Popen, PIPE
+import sys, os, getopt, csv, pickle
+from TBUtils import OpenRunDB, MakeRunDB, RUNLIST
+
+URLS=["https://docs.google.com/spreadsheet/pub?key=0Aq95c3AaXt2IdExOcktfbk9kRkNybHdqQV9DQTZQVkE",
+      #"https://docs.google.com/spreadsheets/d/1HmfBRe2Vj7VFDh_M3P0cLHvQZthRwuvhQe2EeM6mxCI/pubhtml",
+      "https://docs.google.com/spreadsheets/d/13naVWmsm7bUAGMlrelABaI6fuXtzOvg5Gh36bIpKwpk/pubhtml"]
+
+def usage():
+    print
+    print "Usage: python getRunData.py [OPTION] [SNAPSHOT] ..."
+    print "      Update the run list from the testbeam spreadsheets, or from local"
+    print "      snapshots of the spreadsheets (.html/.htm as published, or .csv)"
+    print "      -s DIR         : Save the fetched spreadsheets in DIR, for use as snapshots"
+    print "      -n             : Show changes only, do not update the run list"
+    print "      -v             : Print the added and changed rows"
+    print
+    sys.exit()
 
 
 # create a subclass and override the handler methods
+# rows are collected as the HTML is fed, one list of cells per <tr>
 class MyHTMLParser(HTMLParser):
     def __init__(self):
         HTMLParser.__init__(self)
         self.data=[]
+        self.rows=[]
         self.tdopen=False
         self.havedata=False
     def handle_starttag(self, tag, attrs):
         #print "Encountered a start tag:", tag
-        if tag=="tr": 
+        if tag=="tr":
+            self.endRow()
             self.tdopen=False
             self.data=[]
         if tag=="td":  # enter <td> w/o previous </td>
@@ -30,49 +49,132 @@ class MyHTMLParser(HTMLParser):
             self.tdopen=False # if multipe tags in cell, use first one only
             self.havedata=True
         #print "Encountered some data  :", data
-    def getData(self):
-        return self.data
+    def endRow(self):
+        if len(self.data)>0: self.rows.append(self.data)
+        self.data=[]
+    def getRows(self):   # rows completed so far
+        rows=self.rows
+        self.rows=[]
+        return rows
+    def close(self):
+        HTMLParser.close(self)
+        self.endRow()
 
 
-# fetch testbeam spreadsheets in HTML formatreturn one line per row
-def fetchData():
-    URL1="https://docs.google.com/spreadsheet/pub?key=0Aq95c3AaXt2IdExOcktfbk9kRkNybHdqQV9DQTZQVkE"
-    #URL1="https://docs.google.com/spreadsheets/d/1HmfBRe2Vj7VFDh_M3P0cLHvQZthRwuvhQe2EeM6mxCI/pubhtml"
-    URL2="https://docs.google.com/spreadsheets/d/13naVWmsm7bUAGMlrelABaI6fuXtzOvg5Gh36bIpKwpk/pubhtml"
-    cmd='curl "'+URL1+'" "'+URL2+'" | sed s_\<tr_\\\\n\<tr_g | grep rec_cap'
-    rundata=check_output(cmd,shell=True)
-    return rundata.split("\n")
+# run list entry for a spreadsheet row: [timeStamp]+cells, None if not a PADE run
+def runEntry(fields):
+    if len(fields)<2 or not "rec_capture" in "".join(fields): return None
+    padeDat=fields[1]
+    timeStamp=padeDat.replace("rec_capture_","").replace(".txt","")
+    return [timeStamp]+fields
 
 
-# instantiate the parser
-parser = MyHTMLParser()
+# parse a HTML stream in chunks, returns the run list entries
+def parseHTML(stream, save=None, chunksize=1<<16):
+    parser=MyHTMLParser()
+    runlist=[]
+    while 1:
+        chunk=stream.read(chunksize)
+        if not chunk: break
+        if save: save.write(chunk)
+        parser.feed(chunk)
+        runlist.extend(filter(None,map(runEntry,parser.getRows())))
+    parser.close()
+    runlist.extend(filter(None,map(runEntry,parser.getRows())))
+    return runlist
 
-rundata=fetchData()
 
-runlist=[]
+# CSV export of a spreadsheet, cells as in the HTML parser ("." cells are skipped)
+def parseCSV(stream):
+    runlist=[]
+    for row in csv.reader(stream):
+        fields=[]
+        for cell in row:
+            cell=cell.strip()
+            if cell==".": continue
+            if cell=="": cell="na"
+            fields.append(cell)
+        run=runEntry(fields)
+        if run: runlist.append(run)
+    return runlist
 
-#for line in open("test.dat"):
-for line in rundata:
-#    print line
-    parser.feed(line)
-    fields=parser.getData()
-#    print fields
-    if not "rec_capture" in line: continue
-    padeDat=fields[1]
-    timeStamp=padeDat.replace("rec_capture_","").replace(".txt","")
-    fields.insert(0,timeStamp)
-    runlist.append(fields)
-#    print fields
-     
-# update the local runlist file
-with open('runlist.dat', 'w') as f:    
-    pickle.dump(runlist,f)
 
-print 'runlist.dat has been updated',len(runlist),"runs"
+# fetch testbeam spreadsheets in HTML format, returns the run list entries
+def fetchData(saveDir=None):
+    runlist=[]
+    for i in range(len(URLS)):
+        save=None
+        if saveDir: save=open(os.path.join(saveDir,"runlist_%d.html" % i),"w")
+        curl=Popen(["curl","-s","-f",URLS[i]],stdout=PIPE)
+        runlist.extend(parseHTML(curl.stdout,save))
+        if save: save.close()
+        if curl.wait()!=0:
+            print "Failed to fetch",URLS[i]
+            print "Run list not updated, use local snapshots of the spreadsheets when offline"
+            sys.exit(1)
+    return runlist
+
+
+def readSnapshot(snapshot):
+    with open(snapshot,"r") as f:
+        if snapshot.endswith(".csv"): return parseCSV(f)
+        return parseHTML(f)
+
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], "s:nvh")
+except getopt.GetoptError as err: usage()
+
+saveDir=None
+dryRun=False
+verbose=False
+for o, a in opts:
+    if o == "-s": saveDir=a
+    elif o == "-n": dryRun=True
+    elif o == "-v": verbose=True
+    elif o == "-h": usage()
+
+if len(args)>0:
+    runlist=[]
+    for snapshot in args:
+        runs=readSnapshot(snapshot)
+        print "Read",len(runs),"runs from",snapshot
+        runlist.extend(runs)
+else: runlist=fetchData(saveDir)
+
+# merge new and changed runs into the run list
+rundb=OpenRunDB()
+known={}
+if rundb: known=dict([(run[0],run) for run in rundb.Rows()])
+seen={}   # the first row for a time stamp is used
+for run in runlist:
+    if not run[0] in seen: seen[run[0]]=run
+added=[run for run in runlist if not run[0] in known and seen[run[0]] is run]
+changed=[run for run in runlist if run[0] in known and seen[run[0]] is run and known[run[0]]!=run]
+missing=len(set(known)-set(seen))
 
-#print runlist
+print "Run list changes:",len(added),"added,",len(changed),"changed,",
+print len(seen)-len(added)-len(changed),"unchanged,",missing,"not in the spreadsheets (kept)"
+if verbose:
+    for run in added: print "+",run
+    for run in changed:
+        print "-",known[run[0]]
+        print "+",run
 
-#with open('runlist.dat', 'r') as f:
-#    runlist = pickle.load(f)
+if dryRun or len(added)+len(changed)==0:
+    if rundb: rundb.Close()
+    sys.exit()
 
+# update the local runlist file, then the indexed run data used by the converters
+merged=[]
+if rundb: merged=[seen.get(run[0],run) for run in rundb.Rows()]
+merged.extend(added)
+with open(RUNLIST+"_tmp", 'w') as f:
+    pickle.dump(merged,f)
+os.rename(RUNLIST+"_tmp",RUNLIST)
+if rundb:
+    rundb.Merge(runlist)
+    rundb.Close()
+else: MakeRunDB(merged)
 
+print RUNLIST,'has been updated',len(merged),"runs"
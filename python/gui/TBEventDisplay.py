@@ -775,8 +775,7 @@ class TBEventDisplay:
         page = self.noteBook.pages[pageNumber]
         self.debug("begin:displayEvent - %s" % page.name)
         if self.shutterOpen:
-            if not os.path.exists("pdfs_"+self.filename[self.filename.rfind('/')+1:-5]):
-                os.system('mkdir pdfs_'+self.filename[self.filename.rfind('/')+1:-5])
+            MakeDirs('pdfs_'+self.filename[self.filename.rfind('/')+1:-5])
 
             if '3D' in page.name:
                 pdfname = 'pdfs_'+self.filename[self.filename.rfind('/')+1:-5]+\
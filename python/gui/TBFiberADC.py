@@ -55,26 +55,39 @@ def MakePlots(object, c1, event, rechits, util):
                 if pid2==pid:
                     chyes = ch
                     break
+            wform = WformView(pade)
+            pedestal = pade.GetPedestal()
             for iwf in range(0,60):
-                number = pade.GetWform()[iwf] - pade.GetPedestal()
+                number = wform[iwf] - pedestal
                 hMapADCvsFiber.Fill(pid,number)
             chi2= min(999,rechits[rh].Chi2())
             ndof = rechits[rh].Ndof()
             hMapCHI2vsFiber.Fill(pid,chi2/ndof)
 
     if util.FADC_showAllHits:
-        hit = TBRecHit()
         nSigmaCut=1
+        try: reco = object.reco
+        except:
+            object.reco = WaveReco(nSigmaCut)
+            reco = object.reco
+        # all channels at once, (status, chi2, ndof) of each channel
+        if numpy:
+            table = RecoTable(event, reco=reco)
+            fits = [(int(row[WaveReco.kStatus]), row[WaveReco.kChi2], row[WaveReco.kNdof]) for row in table]
+        else:
+            reco.Reconstruct(event)
+            fits = [(hit.Status(), hit.Chi2(), hit.Ndof()) for hit in reco.Hits()]
         for ch in range(0,Nch):
             pade = event.GetPadeChan(ch)
             pid = pade.GetChannelIndex()
-            hit.Init(pade, nSigmaCut)
-            if not (hit.Status() and TBRecHit.kZSP):
+            status, chi2, ndof = fits[ch]
+            if not (status and TBRecHit.kZSP):
+                wform = WformView(pade)
+                pedestal = pade.GetPedestal()
                 for iwf in range(0,60):
-                    number = pade.GetWform()[iwf] - pade.GetPedestal()
+                    number = wform[iwf] - pedestal
                     hMapADCvsFiber.Fill(pid,number)
-                chi2= min(999,hit.Chi2())
-                ndof = hit.Ndof()
+                chi2= min(999,chi2)
                 if (ndof!=0):
                     hMapCHI2vsFiber.Fill(pid,1.0*chi2/ndof)
         
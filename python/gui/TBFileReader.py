@@ -9,6 +9,7 @@ from ROOT import *
 from time import ctime, sleep
 from string import lower, replace, strip, split, joinfields, find
 from array import array
+from TBUtils import WformView
 #------------------------------------------------------------------------------
 NTDC = 16
 gSystem.Load("libTB.so")
@@ -92,9 +93,8 @@ class TBFileReader:
         for ii in xrange(nchannels):
             channel  = self.e.GetPadeChan(ii)
             pedestal = channel.GetPedestal()
-            wform    = channel.GetWform()
-            for jj in xrange(nsamples):
-                y = wform[jj] - pedestal
-                if y > ymax: ymax = y
+            wform    = WformView(channel, nsamples)
+            y = max(wform[jj] for jj in xrange(nsamples)) - pedestal
+            if y > ymax: ymax = y
         return ymax
 #------------------------------------------------------------------------------
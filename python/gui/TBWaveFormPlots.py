@@ -9,6 +9,7 @@ from ROOT import *
 from string import lower, replace, strip, split, joinfields, find
 from array import array
 from gui.histutil import mkhist1, mkhist2
+from TBUtils import WformView
 #------------------------------------------------------------------------------
 # Draw pedistal subtracted wave forms
 #------------------------------------------------------------------------------
@@ -78,7 +79,7 @@ class TracePlot:
             if not str(board) in boardwalk:
                 continue
             pedestal = channel.GetPedestal()
-            wform    = channel.GetWform()
+            wform    = WformView(channel, nsamples)
             yoffset  = offset - step * ii
             for jj in xrange(nsamples):
                 ibinx = jj+1				
@@ -122,7 +123,7 @@ class SurfacePlot:
             ibiny = ii+1			
             channel  = event.GetPadeChan(ii)
             pedistal = channel.GetPedistal()
-            wform    = channel.GetWform()
+            wform    = WformView(channel, nsamples)
 
             for jj in xrange(nsamples):
                 ibinx = jj+1			
@@ -1,14 +1,15 @@
-import re, sys, commands, os
+import re, sys, os
 sys.argv.append( '-b' )
 from ROOT import *
+from TBUtils import RemoveTree, MakeDirs
 
 COLUMNS=2
 
 rootFile=TString(sys.argv[1])
 outDir=TString(rootFile)
 outDir=str(outDir.ReplaceAll(".root",""))
-commands.getstatusoutput("rm -rf "+outDir)
-commands.getstatusoutput("mkdir -p "+outDir)
+RemoveTree(outDir)
+MakeDirs(outDir)
 titles=[]
 fi = TFile(rootFile.Data(),"READ")
 html=os.path.join(outDir,"index.html")
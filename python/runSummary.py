@@ -34,9 +34,8 @@ def getTree(filename):
 
 
 def main():
-    if os.path.exists("doc/etc"):
-        os.system('rm -rf doc/etc')
-    os.system('mkdir doc/etc')
+    RemoveTree("doc/etc")
+    MakeDirs("doc/etc")
 
     try:
         filename = sys.argv[1]
@@ -139,7 +138,8 @@ def main():
     summaryFile.close()
 
     os.system('pdflatex -output-directory=doc/etc doc/etc/summary_'+filename[filename.rfind('/')+1:].replace('.root','.tex')+" > doc/etc/texlog.txt")
-    os.system('mv doc/etc/summary*.pdf data')
+    for pdf in FindFiles("doc/etc","summary*.pdf"):
+        AtomicRename(pdf,os.path.join("data",os.path.basename(pdf)))
     #os.system('open data/summary_'+filename[filename.rfind('/')+1:].replace('.root','.pdf'))
 
 
@@ -1,10 +1,10 @@
 #!/usr/bin/env python
 # Run RECO tools
 # this is just a wrapper for the ROOT C++ code
-# Usage: python runTBReco.py [-o output directory] input_file.root 
+# Usage: python runTBReco.py [-o output directory] [-j N] [-t] input_file.root 
 # Created 4/20/2014 B.Hirosky: Initial release
 
-import sys, os, getopt, glob, commands
+import sys, os, getopt, glob
 from ROOT import *
 from TBUtils import *
 
@@ -14,6 +14,9 @@ def usage():
     print "       -r             : Recursively process input_path"
     print "       -o DIR         : Output dir, instead of default = location of input file" 
     print "       -n number      : max # of events to RECO"
+    print "       -j N           : Use N threads for the pulse fits, needs -t"
+    print "       -t             : Use the template pulse fit instead of MINUIT"
+    print "                        (validate w/ rootscript/validatePulseFit.C first)"
     print 
     sys.exit()
 
@@ -21,12 +24,14 @@ def usage():
 ### main ###
 
 try:
-    opts, args = getopt.getopt(sys.argv[1:], "ro:n:")
+    opts, args = getopt.getopt(sys.argv[1:], "ro:n:j:t")
 except getopt.GetoptError as err: usage()
 
 
 outDir=""
 recurse=False
+nThreads=1
+templateFit=False
 for o, a in opts:
     if o == "-r":
         recurse=True
@@ -36,6 +41,10 @@ for o, a in opts:
     elif o == "-n": 
         nMax=a
         print "Process only up to",nMax,"events"
+    elif o == "-j":
+        nThreads=int(a)
+    elif o == "-t":
+        templateFit=True
 
 
 if len(args)<1:
@@ -47,6 +56,8 @@ if not os.path.isdir(runDat):
 print "Processing file:",runDat
 
 LoadLibs("TBLIB","libTB.so")
+if templateFit: PadeChannel.SetTemplateFit(True)
+elif nThreads>1: print "-j N needs -t, the MINUIT pulse fits run in 1 thread"
 gSystem.SetIncludePath("-I\"$TBHOME/include\"")
 
 
@@ -55,15 +66,15 @@ gROOT.ProcessLine(".L rootscript/runTBReco.C+")
 
 fileList=[]
 if recurse:
-    fileList.extend(glob.glob(runDat+'/rec_capture_*[0-9]*root'))
+    fileList.extend(FindFiles(runDat,'rec_capture_*[0-9]*root'))
 else:
     fileList.extend(glob.glob(runDat))
     
 for file in fileList:
-    outFile=runTBReco(file,"",outDir)    
+    outFile=runTBReco(file,"",outDir,nThreads)    
     print "finished",outFile
     # for convinence when working interactively
-    commands.getoutput(ccat('ln -sf',outFile,' latest_reco.root'))
+    UpdateSymlink(outFile,'latest_reco.root')
 
 #hit_continue('Hit any key to exit')
 
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+# Pre-flight scan of PADE and WC files, before any conversion
+# Only the header records are read: spill and board headers of the PADE files,
+# SPILL/SDATE/STIME/EVENT records of the WC files.  Files are scanned in parallel.
+# The manifest (JSON) lists for each file the # of spills, the events per board,
+# the max # of events in a spill and the count of each error class found.
+# Files w/o a usable spill are marked "bad", TBTreeMaker --manifest skips them
+# Usage: python scanFiles.py [OPTION] FILE|DIR ...
+
+import sys, os, getopt, time, json
+from multiprocessing import Pool, cpu_count
+from TBUtils import *
+from TBTreeMaker import MAXPERSPILL
+
+def usage():
+    print
+    print "Usage: python scanFiles.py [OPTION] FILE|DIR ..."
+    print "      Scan PADE (rec_capture_*.txt[.bz2]) and WC (t1041_*.dat[.bz2]) files"
+    print "      -r             : Scan the subdirectories of DIR too"
+    print "      -o FILE        : Manifest file [manifest.json]"
+    print "      -j N           : Scan N files in parallel [# of cpus]"
+    print "      -v             : Print the error classes of each file"
+    print
+    sys.exit()
+
+
+# lines of a text file containing one of the keys, in file order
+# the file is read in chunks and searched w/ find, other lines are not split
+def headerLines(f, keys, chunksize=1<<24):
+    while 1:
+        chunk=f.read(chunksize)
+        if not chunk: break
+        chunk=chunk+f.readline()   # end chunk on a line boundary
+        found={}
+        for key in keys:
+            i=chunk.find(key)
+            while i>=0:
+                start=chunk.rfind("\n",0,i)+1
+                end=chunk.find("\n",i)
+                if end<0: end=len(chunk)
+                found[start]=chunk[start:end].rstrip()
+                i=chunk.find(key,end)
+        for start in sorted(found): yield found[start]
+
+
+def newScan(filename, fileType):
+    return {'file':filename, 'type':fileType, 'size':os.path.getsize(filename), 'spills':0,
+            'goodSpills':0, 'events':0, 'maxEvents':0, 'boards':{}, 'errors':{}, 'status':'ok'}
+
+def error(scan, errorClass):
+    scan['errors'][errorClass]=scan['errors'].get(errorClass,0)+1
+
+
+# spill and board headers of a PADE file, w/ the checks made by TBTreeMaker
+def scanPade(padeDat):
+    scan=newScan(padeDat,"PADE")
+    scan['fake']=False
+    spillBoards=None   # board: events in the current spill
+    f=TBOpen(padeDat)
+    for line in headerLines(f,["starting spill","spill status","fake"]):
+        if "fake" in line:    # as in filler, fake spills follow the "fake" line
+            scan['fake']=True
+            continue
+        if "starting spill" in line:
+            endPadeSpill(scan,spillBoards)
+            spillBoards={}
+            scan['spills']=scan['spills']+1
+            if line.endswith("time =") or line.endswith("time = 0") or line.endswith("time unknown"):
+                error(scan,"WC time stamp missing")
+            try:
+                spill=ParsePadeSpillHeader(line)
+            except (ValueError, IndexError):
+                error(scan,"bad spill header")
+                continue
+            if spill['status']==-1: error(scan,"spill header w/ 18 fields")
+            elif spill['status']==-2: error(scan,"spill header w/ 14 fields")
+            if scan['fake'] or spill['status']>=0: scan['goodSpills']=scan['goodSpills']+1
+            continue
+        # "spill status", board header
+        if spillBoards==None:
+            error(scan,"board header before 1st spill header")
+            continue
+        try:
+            (master,boardID,status,trgStatus,events,memReg,trigPtr,pTemp,sTemp)=ParsePadeBoardHeader(line)
+        except (ValueError, IndexError):
+            error(scan,"bad board header")
+            continue
+        if events>MAXPERSPILL: error(scan,"event overflow (>%d events)" % MAXPERSPILL)
+        spillBoards[boardID]=events
+        scan['boards'][str(boardID)]=scan['boards'].get(str(boardID),0)+events
+    f.close()
+    endPadeSpill(scan,spillBoards)
+    return scan
+
+def endPadeSpill(scan, spillBoards):
+    if not spillBoards:
+        if spillBoards!=None: error(scan,"spill w/o board headers")
+        return
+    events=spillBoards.values()
+    if len(set(events))>1: error(scan,"board event counts differ")
+    scan['events']=scan['events']+max(events)
+    scan['maxEvents']=max(scan['maxEvents'],max(events))
+
+
+# spill records of a WC file, as read by wcdbGenerator
+def scanWC(wcFile):
+    scan=newScan(wcFile,"WC")
+    spill=None
+    f=TBOpen(wcFile)
+    for line in headerLines(f,["SPILL","SDATE","STIME","EVENT"]):
+        data=line.split()
+        if not data: continue
+        if data[0]=="SPILL":
+            endWCSpill(scan,spill)
+            spill={'date':None, 'time':None, 'events':0}
+            scan['spills']=scan['spills']+1
+        elif spill==None:
+            error(scan,"record before 1st SPILL")
+        elif data[0]=="SDATE" and len(data)==4: spill['date']="-".join(data[1:])
+        elif data[0]=="STIME" and len(data)==4: spill['time']=":".join(data[1:])
+        elif data[0]=="EVENT": spill['events']=spill['events']+1
+        elif data[0] in ("SDATE","STIME"): error(scan,"bad %s record" % data[0])
+    f.close()
+    endWCSpill(scan,spill)
+    return scan
+
+def endWCSpill(scan, spill):
+    if spill==None: return
+    if spill['date']==None or spill['time']==None:
+        error(scan,"SDATE/STIME missing")
+        return
+    try:
+        FastMktime(spill['date'],spill['time'],"dmy")
+    except ValueError:
+        error(scan,"bad time stamp")
+        return
+    if spill['events']==0: error(scan,"spill w/o events")
+    scan['goodSpills']=scan['goodSpills']+1
+    scan['events']=scan['events']+spill['events']
+    scan['maxEvents']=max(scan['maxEvents'],spill['events'])
+
+
+# a complete bz2 file ends w/ the end of stream marker (48 bit magic, 32 bit crc, padding)
+def bz2Complete(filename):
+    with open(filename,"rb") as f:
+        f.seek(max(0,os.path.getsize(filename)-16))
+        return len(FindBitPattern(f.read(),BZ2_EOS_MAGIC))>0
+
+
+# scan one file, runs in a pool worker
+def scanFile(filename):
+    start=time.time()
+    try:
+        if os.path.basename(filename).startswith("t1041_"): scan=scanWC(filename)
+        else: scan=scanPade(filename)
+        if filename.endswith(".bz2") and not bz2Complete(filename): error(scan,"truncated bz2 file")
+        if scan['spills']==0: error(scan,"no spills")
+    except (IOError, OSError, EOFError) as e:   # unreadable or damaged (bz2) file
+        scan={'file':filename, 'errors':{"read error":1}, 'message':str(e)}
+    if scan.get('goodSpills',0)==0: scan['status']='bad'
+    scan['seconds']=time.time()-start
+    return scan
+
+
+def inputFiles(paths, recurse):
+    files=[]
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend([f for f in FindFiles(path,"rec_capture_*.txt*",recurse)
+                          if f.endswith(".txt") or f.endswith(".txt.bz2")])
+            files.extend([f for f in FindFiles(path,"t1041_*.dat*",recurse)
+                          if f.endswith(".dat") or f.endswith(".dat.bz2")])
+        elif os.path.isfile(path): files.append(path)
+        else: print "No such file or directory:",path
+    return [os.path.abspath(f) for f in files]
+
+
+if __name__ == '__main__':
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "ro:j:vh")
+    except getopt.GetoptError as err: usage()
+
+    recurse=False
+    manifestFile="manifest.json"
+    nJobs=cpu_count()
+    verbose=False
+    for o, a in opts:
+        if o == "-r": recurse=True
+        elif o == "-o": manifestFile=a
+        elif o == "-j": nJobs=int(a)
+        elif o == "-v": verbose=True
+        elif o == "-h": usage()
+    if len(args)==0: usage()
+
+    files=inputFiles(args,recurse)
+    print "Scanning",len(files),"files w/",nJobs,"parallel jobs"
+    start=time.time()
+    pool=Pool(max(1,nJobs))
+    scans={}
+    for scan in pool.imap_unordered(scanFile,files):
+        scans[scan['file']]=scan
+        print "%-4s %-60s %6d spills %8d events %5d max/spill %4d errors" % (
+            scan['status'],os.path.basename(scan['file']),scan.get('spills',0),scan.get('events',0),
+            scan.get('maxEvents',0),sum(scan['errors'].values()))
+        if verbose:
+            for errorClass in sorted(scan['errors']): print "      (%5d) %s" % (scan['errors'][errorClass],errorClass)
+    pool.close()
+    pool.join()
+
+    manifest={'created':time.time(), 'maxPerSpill':MAXPERSPILL, 'files':scans}
+    with open(manifestFile+"_tmp","w") as f:
+        json.dump(manifest,f,indent=1,sort_keys=True)
+    AtomicRename(manifestFile+"_tmp",manifestFile)
+    nBad=len([f for f in scans if scans[f]['status']=='bad'])
+    print "Scanned",len(scans),"files in %.1f s," % (time.time()-start),nBad,"bad, manifest:",manifestFile
@@ -0,0 +1,53 @@
+# check that a multi-stream bz2 file (eg. from pbzip2) reads the same in all modes:
+# TBOpen as a stream and w/ the block index, and PrefetchReader w/ 1 and 4 threads
+
+import tempfile
+import TBUtils
+from TBUtils import *
+
+def check(name, text, expected):
+    if text!=expected:
+        print "FAIL",name,len(text),"of",len(expected),"bytes"
+        return False
+    print "ok  ",name
+    return True
+
+def readLines(f):
+    lines=[]
+    while 1:
+        line=f.readline()
+        if not line: break
+        lines.append(line)
+    f.close()
+    return "".join(lines)
+
+# 3 streams w/ different block sizes, lines span the stream boundaries
+lines=["%d %s\n" % (i," ".join(["%03x" % ((i*k)&0xfff) for k in range(40)])) for i in range(20000)]
+text="".join(lines)
+parts=[text[:300001],text[300001:900017],text[900017:]]
+streams=[bz2.compress(parts[0],9),bz2.compress(parts[1],1),bz2.compress(parts[2],5)]
+fd,padeDat=tempfile.mkstemp(suffix=".txt.bz2")
+os.write(fd,"".join(streams))
+os.close(fd)
+
+ok=True
+ok=check("stream read",TBOpen(padeDat).read(),text) and ok
+ok=check("stream readline",readLines(TBOpen(padeDat)),text) and ok
+chunk=TBUtils.BZ2_CHUNK
+for size in (7,len(streams[0])):   # a stream ends inside and at the end of a read
+    TBUtils.BZ2_CHUNK=size
+    ok=check("stream read, %d byte reads" % size,TBOpen(padeDat).read(),text) and ok
+TBUtils.BZ2_CHUNK=chunk
+index=BZ2BlockIndex(padeDat,cache=False,build=False)
+ok=check("block mode read",TBOpen(padeDat,index).read(),text) and ok
+f=TBOpen(padeDat)
+f.readline()
+f.seek(len(text)-len(lines[-1]))   # switches to block mode
+ok=check("seek to the last line",f.readline(),lines[-1]) and ok
+f.close()
+for threads in (1,4):
+    ok=check("PrefetchReader w/ %d threads" % threads,
+             readLines(PrefetchReader(padeDat,threads,chunksize=1<<16)),text) and ok
+
+os.remove(padeDat)
+if not ok: sys.exit(1)
@@ -0,0 +1,36 @@
+# check DecodeADC/ParsePadeBlock against a plain int(word,16) parse of the ADC words
+# the fast (block unhexlify) path must agree w/ the slow path, also for malformed lines
+
+from TBUtils import *
+
+def slowDecode(words):
+    return [int(w,16) for w in words]
+
+def check(name, words):
+    adc=list(DecodeADC(words))
+    if adc!=slowDecode(words):
+        print "FAIL",name,words,adc,slowDecode(words)
+        return False
+    print "ok  ",name
+    return True
+
+ok=True
+ok=check("3 digit words",["000","fff","123","a5b"]) and ok
+ok=check("short + long word",["12","1234"]) and ok        # total length is 3 digits/word
+ok=check("long + short words",["1234","1","2"]) and ok
+ok=check("empty block",[]) and ok
+try:
+    DecodeADC(["12x","000"])
+    print "FAIL non hex word decoded"
+    ok=False
+except ValueError: print "ok   non hex word rejected"
+
+# a PADE line w/ a 2 digit and a 4 digit sample, ndata=2
+padeline="1 0 0 0 0 0 0 0 0 0 12 1234"
+headers,adc=ParsePadeBlock([padeline],2)
+if list(adc)!=[0x12,0x1234]:
+    print "FAIL malformed PADE line",list(adc)
+    ok=False
+else: print "ok   malformed PADE line"
+
+if not ok: sys.exit(1)
@@ -1,26 +1,91 @@
 import getopt,sys
-import bz2
 import re
 import glob
 import os
 import os.path
 from operator import itemgetter
+from multiprocessing import Pool, cpu_count
 import time
 from TBUtils import *
 
 logger=Logger(1)  # instantiate a logger, w/ 1 repetition of messages
 
 
-#generate a set of previously read files
-def findPrevReadFiles(handle):
-    files = set()
-    for line in handle:
+# read the DB entries, returns a dictionary {WC file : [(unixtime, DB line)]}
+def readDB(dbfile):
+    entries = {}
+    for line in open(dbfile, 'r'):
         l = re.split(' +', line.strip())
-        files.add(l[-2])
-    return files
+        if len(l) < 5: continue
+        entries.setdefault(l[-2], []).append((float(l[0]), line.rstrip("\r\n")))
+    return entries
 
 
-def generateSpillDB(wcHandle, dbHandle, filename):
+# fingerprints of the indexed WC files, kept in [dbfile].files
+# one line per file: path size mtime crc32 (see FileFingerprint)
+def readFingerprints(dbfile):
+    fingerprints = {}
+    try:
+        for line in open(dbfile+".files", 'r'):
+            l = line.split()
+            if len(l) != 4: continue
+            fingerprints[l[0]] = (int(l[1]), float(l[2]), int(l[3]))
+    except IOError:
+        pass
+    return fingerprints
+
+
+# write the DB sorted by spill time, w/ duplicate entries removed
+# the sort order is required by the binary searches in TBUtils (wcLookup, look)
+# files are written to *_tmp and renamed, readers never see a partial DB
+def writeDB(dbfile, entries, fingerprints):
+    lines = set()
+    for filename in entries: lines.update(entries[filename])
+    lines = sorted(lines, key=lambda entry: (entry[0], entry[1]))
+    with open(dbfile+"_tmp", 'w') as dbHandle:
+        for (unixtime, line) in lines: dbHandle.write(line+"\r\n")
+    with open(dbfile+".files_tmp", 'w') as fpHandle:
+        for filename in sorted(fingerprints):
+            size, mtime, crc = fingerprints[filename]
+            fpHandle.write("%s %d %r %d\n" % (filename, size, mtime, crc))
+    os.rename(dbfile+"_tmp", dbfile)
+    os.rename(dbfile+".files_tmp", dbfile+".files")
+    return len(lines)
+
+
+# index one WC file, runs in a pool worker
+# returns (filename, fingerprint, [(unixtime, DB line)], events), the lists are None on errors
+# events=[(unixtime, spill offset, [(WC event, offset, nhits)])] for the event DB (WCEventDB)
+def indexFile(filename):
+    try:
+        fingerprint = FileFingerprint(filename)
+        # bz2 files are read in block mode, building (and caching) the block index
+        # in the same pass, WC event lookups then seek w/o decompressing the file
+        index = None
+        if filename.endswith(".bz2"): index = BZ2BlockIndex(filename, build=False)
+        wcHandle = TBOpen(filename, index)
+        logger.Info("Processing %s" % filename)
+        spills = readSpills(wcHandle)
+        wcHandle.close()
+    except (IOError, OSError) as e:   # eg. the file vanished or is unreadable
+        logger.Warn("Unable to open %s, %s" % (filename, e))
+        return (filename, None, None, None)
+    except (TypeError, ValueError) as e:   # incomplete spill record
+        logger.Warn("Bad File %s, %s...skipping" % (filename, e))
+        return (filename, fingerprint, None, None)
+    if spills is None: return (filename, fingerprint, None, None)
+    return (filename, fingerprint, 
+            [(spill['unixtime'], spillLine(spill, filename)) for spill in spills],
+            [(spill['unixtime'], spill['pos'], spill['events']) for spill in spills])
+
+
+def spillLine(spill, filename):
+    return "%s    %s    %s    %s    %s" % (spill['unixtime'], spill['date'], spill['time'], 
+                                         os.path.abspath(filename), spill['pos'])
+
+
+# returns a list of spill dictionaries, None for a bad file
+def readSpills(wcHandle):
     logger.Info("Generating Spill DB")
     currentSpill = None
     spills = []
@@ -36,8 +101,7 @@ def generateSpillDB(wcHandle, dbHandle, filename):
 
         if data[0] == 'SPILL':
             if currentSpill:
-                tstring = time.strptime(' '.join([currentSpill['date'], currentSpill['time']]) , "%d-%m-%y %H:%M:%S")
-                currentSpill['unixtime'] = time.mktime(tstring)
+                currentSpill['unixtime'] = FastMktime(currentSpill['date'], currentSpill['time'], "dmy")
 
                 spills.append(currentSpill)
                 print "New Spill position: %s" % (pos - len(line))
@@ -46,6 +110,7 @@ def generateSpillDB(wcHandle, dbHandle, filename):
                     'unixtime':None,
                     'date': None,
                     'time': None,
+                    'events': [],   # [WC event, offset after EVENT line, hits]
                     }
         elif data[0] == 'SDATE':
             data = re.split(' +', line.strip())
@@ -66,20 +131,20 @@ def generateSpillDB(wcHandle, dbHandle, filename):
         elif data[0] == 'EVENT':
             if currentSpill['date'] is None:
                 logger.Warn('Bad Data File no SDATE/TIME...skipping')
-                return
+                return None
+            currentSpill['events'].append((int(data[2]), pos, 0))
+        elif data[0] == 'Channel' and currentSpill and currentSpill['events']:
+            event, offset, nhits = currentSpill['events'][-1]
+            currentSpill['events'][-1] = (event, offset, nhits+1)
 
         if (pos > 0) and currentSpill == None:
             logger.Warn("Bad File...skipping")
-            return
+            return None
 
     if currentSpill:
-        tstring = time.strptime(' '.join([currentSpill['date'], currentSpill['time']]) , "%d-%m-%y %H:%M:%S")
-        currentSpill['unixtime'] = time.mktime(tstring)
+        currentSpill['unixtime'] = FastMktime(currentSpill['date'], currentSpill['time'], "dmy")
         spills.append(currentSpill)
-
-    for spill in spills:
-        outputLine = "%s    %s    %s    %s    %s\r\n" % (spill['unixtime'], spill['date'], spill['time'], os.path.abspath(filename), spill['pos'])
-        dbHandle.write(outputLine)
+    return spills
 
 def usage():
     print
@@ -88,17 +153,22 @@ def usage():
     print "                       Overrides all files given on command line list"
     print "      -o DIR         : Output dir, instead of default = PWD"
     print "      -f             : force regenerating the database"
+    print "      -j N           : Index files w/ N parallel jobs [# of cpus]"
+    print
+    print "Only new or changed WC files (size, mtime, checksum in [DB].files) are indexed"
+    print "The event level index is written to [DB]_events.sqlite"
     print
     sys.exit()
 
 def main():
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "d:o:f")
+        opts, args = getopt.getopt(sys.argv[1:], "d:o:fj:")
     except getopt.GetoptError as err: usage()
 
     force=False
     location="."  # location of input files
     dbfile="wcdb.txt"
+    nJobs=cpu_count()
     for o, a in opts:
         if o == "-d":
             location=a
@@ -107,26 +177,31 @@ def main():
             dbfile=a
             print "Writing WC data in:",dbfile
         elif o == "-f": force=True
+        elif o == "-j": nJobs=int(a)
 
 
-    dbHandle = None
-    prevReadFiles = None
-    if force:
-        dbHandle = open(dbfile, 'w')
-    else:
+    entries = {}
+    fingerprints = {}
+    if not force:
         try:
-            handle = open(dbfile, 'r')
-            prevReadFiles = findPrevReadFiles(handle)
-            dbHandle = open(dbfile, 'a')
+            entries = readDB(dbfile)
+            fingerprints = readFingerprints(dbfile)
         except IOError:
             print "Couldn't open db file %s, regenerating" % dbfile
-            dbHandle = open(dbfile, 'w')
+
+    eventDB = None
+    eventFiles = set()
+    if sqlite3:
+        if force and os.path.isfile(WCEventDBName(dbfile)): os.remove(WCEventDBName(dbfile))
+        eventDB = WCEventDB(dbfile)
+        eventFiles = eventDB.Files()
+    else: logger.Warn("sqlite3 not available, no event level index is written")
 
     if os.path.isdir(location):
         absPath =  os.path.abspath(location)
         # joinedPath = os.path.join(absPath, location)
         # files = glob.glob(joinedPath)
-        files = glob.glob(absPath+"/t1041*dat*")
+        files = FindFiles(absPath,"t1041*dat*")
         print location,absPath,files
     elif os.path.isfile(location):
         files=[]
@@ -135,27 +210,44 @@ def main():
     #Generate a list of tuples containing the filename and file modification time
     sortedFiles = []
     for f in files:
+        if not "t1041_" in f: continue  # not a WC file
+        if not (f.endswith(".dat.bz2") or f.endswith(".dat")): continue
         sortedFiles.append((f,os.path.getmtime(f)))
 
     #Sort the files by the file modification time
     sortedFiles = sorted(sortedFiles, key=itemgetter(1))
+
+    # new or changed files, a rewritten or truncated file is indexed again
+    newFiles = []
     for filename,mtime in sortedFiles:
-        if force or not prevReadFiles or (prevReadFiles and filename not in prevReadFiles):
-            if not "t1041_" in filename: continue  # not a WC file
-            if filename.endswith(".dat.bz2"):
-                try:
-                    wcHandle = bz2.BZ2File(filename, "r")
-                    logger.Info("Processing %s" % filename)
-                    generateSpillDB(wcHandle, dbHandle, filename)
-                except IOError as e:
-                    logger.Warn("Unable to open %s, %s" % (filename, e))
-            elif filename.endswith(".dat"):
-                try:
-                    wcHandle = open(filename, "r")
-                    logger.Info("Processing %s" % filename)
-                    generateSpillDB(wcHandle, dbHandle, filename)
-                except IOError as e:
-                    logger.Warn("Unable to open %s, %s" % (filename, e))
+        if filename in fingerprints and (not eventDB or filename in eventFiles):
+            try:
+                if FileFingerprint(filename) == fingerprints[filename]: continue
+            except (IOError, OSError): pass
+        newFiles.append(filename)
+    logger.Info("Indexing %d of %d WC files w/ %d jobs" % (len(newFiles), len(sortedFiles), nJobs))
+
+    if nJobs > 1 and len(newFiles) > 1:
+        pool = Pool(nJobs)
+        results = pool.map(indexFile, newFiles)
+        pool.close()
+        pool.join()
+    else: results = map(indexFile, newFiles)
+
+    for (filename, fingerprint, lines, events) in results:
+        entries.pop(filename, None)
+        fingerprints.pop(filename, None)
+        if eventDB: eventDB.Remove(filename)
+        if fingerprint is None: continue   # not readable, try again next time
+        fingerprints[filename] = fingerprint
+        if lines: entries[filename] = lines
+        if eventDB and events: eventDB.Add(filename, events)
+    if eventDB:
+        eventDB.Commit()
+        eventDB.Close()
+
+    nlines = writeDB(dbfile, entries, fingerprints)
+    logger.Info("Wrote %d spills from %d files to %s" % (nlines, len(entries), dbfile))
 
 
 
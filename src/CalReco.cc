@@ -1,6 +1,8 @@
 #include "CalReco.h"
 #include "TBRecHit.h"
 #include "TBEvent.h"
+#include "WaveReco.h"
+#include <pthread.h>
 #include <vector>
 #include <iostream>
 
@@ -9,6 +11,93 @@ using std::cout;
 using std::endl;
 
 
+// events [first,last) of a block, each w/ its own WaveReco
+struct RecoRange {
+  WaveReco **recos;
+  int first;
+  int last;
+};
+
+static void* ReconstructRange(void *arg){
+  RecoRange *range=(RecoRange*)arg;
+  for (int k=range->first; k<range->last; k++) range->recos[k]->Reconstruct();
+  return 0;
+}
+
+// reconstruct the first n events of the block, in nThreads threads
+static void ReconstructBlock(vector<WaveReco*> &recos, int n, int nThreads){
+  if (nThreads<=1 || n<=1){
+    for (int k=0; k<n; k++) recos[k]->Reconstruct();
+    return;
+  }
+  vector<pthread_t> threads(nThreads);
+  vector<RecoRange> ranges(nThreads);
+  vector<bool> started(nThreads,false);
+  for (int t=0; t<nThreads; t++){
+    ranges[t].recos=&recos[0];
+    ranges[t].first=n*t/nThreads;
+    ranges[t].last=n*(t+1)/nThreads;
+    started[t] = pthread_create(&threads[t],0,ReconstructRange,&ranges[t])==0;
+    if (!started[t]) ReconstructRange(&ranges[t]);  // run it here instead
+  }
+  for (int t=0; t<nThreads; t++) if (started[t]) pthread_join(threads[t],0);
+}
+
+// Copy the hits of one event to rechits
+// Special cases  
+// April 2014
+//    Replace dead channel idx= ???
+// Summer 2013: 
+//    Replace cut/dead channels(idx=51,60/29) w/ copy of opposing channel 
+static void AddHits(const WaveReco &reco, TBEvent::TBRun period, const TBEvent *dump, 
+		    vector<TBRecHit> &rechits){
+  bool tbrun1 = period==TBEvent::TBRun1;
+  bool tbrun2 = !tbrun1 && period<=TBEvent::TBRun2c;
+  const vector<TBRecHit> &hits=reco.Hits();
+  for (Int_t nch=0; nch<reco.NRows(); nch++){
+    int idx=hits[nch].ChannelIndex();
+    bool laser=reco.LaserData(nch);
+
+    if ( tbrun2 ) {
+      if ( idx==29 ) continue;  // dead channel
+      if ( (idx==51 || idx==60)
+	   && !laser ) continue; // mirror for beam data
+    }
+
+    if ( tbrun1 && idx==123 ) continue; // dead channel
+      
+    TBRecHit hit=hits[nch];
+    if ( (hit.Status() & TBRecHit::kZSP) == 0 ) {
+      if ( (idx==51 || idx==60) && laser ) 
+	hit.AddStatus(TBRecHit::kMonitor);
+      rechits.push_back(hit);  // only save hits over ZSP
+
+      if (dump) {
+	dump->GetPadeChan(nch).Dump();
+	cout<<hit<<endl;
+      }
+
+    }
+    else continue;  // no hit to add
+
+    if ( tbrun2 ) {
+      if ( idx==(29+64) 
+	   || ( ( idx==(51+64) || idx==(60+64) )
+		&& !laser ) ){  // do not mirror laser data
+	TBRecHit mirror(hit,idx-64,TBRecHit::kMirrored);
+	rechits.push_back(mirror);
+      }
+    }
+
+    if ( tbrun1 && idx==(123-64) ){
+      TBRecHit mirror(hit,idx+64,TBRecHit::kMirrored);
+      rechits.push_back(mirror);
+    }
+
+  }
+}
+
+
 int CalReco::Process(TTree *rawTree, TTree *recTree){
   TBEvent *event = new TBEvent();
   TBSpill *tbspill=new TBSpill();
@@ -21,69 +110,46 @@ int CalReco::Process(TTree *rawTree, TTree *recTree){
   cout << "Adding branch: tbrechits"<< endl;
   TBranch *brp=recTree->Branch("tbrechits","std::vector<TBRecHit>",&rechits);
 
-
-  TBRecHit hit;
+  // one WaveReco per event of a block, each used by one thread only
+  int nThreads=TMath::Max(_nThreads,1);
+  if (nThreads>1 && !PadeChannel::TemplateFit()){
+    cout << "CalReco: MINUIT pulse fits are not thread-safe, using 1 thread" << endl;
+    nThreads=1;
+  }
+  int blockSize=nThreads*EVENTS_PER_THREAD;
+  if (nThreads==1) blockSize=1;
+  vector<WaveReco*> recos(blockSize);
+  vector<TBEvent::TBRun> periods(blockSize);
+  for (int k=0; k<blockSize; k++) recos[k]=new WaveReco(_nSigmaCut);
+  TBEvent first;   // channels of event 0 are dumped
+  if (nThreads>1) cout << "CalReco: Using " << nThreads << " threads" << endl;
 
   // loop over the raw data tree
   int nEvents=rawTree->GetEntries();
-  for (int i=0; i<nEvents; i++){
-    if ( i % TMath::Max(1,(nEvents/25)) == 0) 
-      cout << "CalReco: Processing event " << i << " / " << nEvents << endl;
-    rawTree->GetEntry(i);
-    rechits->clear();  
-
-    // Special cases  
-    // April 2014
-    //    Replace dead channel idx= ???
-    // Summer 2013: 
-    //    Replace cut/dead channels(idx=51,60/29) w/ copy of opposing channel 
-    bool tbrun1 = event->GetRunPeriod()==TBEvent::TBRun1;
-    bool tbrun2 = !tbrun1 && event->GetRunPeriod()<=TBEvent::TBRun2c;
-    for (Int_t nch=0; nch<event->NPadeChan(); nch++){
-      PadeChannel pc=event->GetPadeChan(nch);
-      int idx=pc.GetChannelIndex();
-
-      if ( tbrun2 ) {
-	if ( idx==29 ) continue;  // dead channel
-	if ( (idx==51 || idx==60)
-	     && !(pc.LaserData()) ) continue; // mirror for beam data
-      }
-
-      if ( tbrun1 && idx==123 ) continue; // dead channel
-      
-      hit.Init(&pc, _nSigmaCut);
-      if ( (hit.Status() & TBRecHit::kZSP) == 0 ) {
-	if ( (idx==51 || idx==60) && pc.LaserData() ) 
-	  hit.AddStatus(TBRecHit::kMonitor);
-	rechits->push_back(hit);  // only save hits over ZSP
-
-	if (i==0) {
-	  pc.Dump();
-	  cout<<hit<<endl;
-	}
-
-      }
-      else continue;  // no hit to add
-
-      if ( tbrun2 ) {
-	if ( idx==(29+64) 
-	     || ( ( idx==(51+64) || idx==(60+64) )
-		  && !(pc.LaserData()) ) ){  // do not mirror laser data
-	  TBRecHit mirror(hit,idx-64,TBRecHit::kMirrored);
-	  rechits->push_back(mirror);
-	}
-      }
+  for (int i0=0; i0<nEvents; i0+=blockSize){
+    int n=TMath::Min(blockSize,nEvents-i0);
+
+    // read a block, the Mapper is only used in the main thread
+    for (int k=0; k<n; k++){
+      int i=i0+k;
+      if ( i % TMath::Max(1,(nEvents/25)) == 0) 
+	cout << "CalReco: Processing event " << i << " / " << nEvents << endl;
+      rawTree->GetEntry(i);
+      recos[k]->Load(event);
+      periods[k]=event->GetRunPeriod();
+      if (i==0) first=*event;
+    }
 
-      if ( tbrun1 && idx==(123-64) ){
-	TBRecHit mirror(hit,idx+64,TBRecHit::kMirrored);
-	rechits->push_back(mirror);
-      }
+    ReconstructBlock(recos,n,nThreads);
 
+    // fill in event order
+    for (int k=0; k<n; k++){
+      rechits->clear();  
+      AddHits(*recos[k],periods[k],i0+k==0 ? &first : 0,*rechits);
+      brp->Fill();
     }
-    brp->Fill();
-
   }
+  for (int k=0; k<blockSize; k++) delete recos[k];
   delete rechits;
   return 0;
 }
-
@@ -2,6 +2,7 @@
 #include "calConstants.h"
 #include "Mapper.h"
 #include "TBEvent.h"
+#include "PulseFitter.h"
 
 void PadeChannel::Reset(){
   _ts=0;
@@ -40,10 +41,6 @@ void PadeChannel::Fill(ULong64_t ts, UShort_t transfer_size,
   _status=0;
   if (isLaser) _status|=kLaser;
   
-  // range to search for signal peaks
-  int tmin=15;
-  int tmax=40;
-  
   // This handles the start of testbeam2 data where the first
   // 32 waveform samples are not valid wave data.  No porch was present in April 2014
   if (_ts>TBEvent::END_TBEAM1 && _ts<TBEvent::START_PORCH15) { // shift wform array by 32 counts
@@ -59,23 +56,15 @@ void PadeChannel::Fill(ULong64_t ts, UShort_t transfer_size,
     _status|=kPorch15;
   }
 
-  // loop over samples
-  for (int i=0; i<N_PADE_DATA; i++) {  
-    _wform[i]=wform[i];
-    // max/min from start of data (not samples)
-    if (i<=tmin || i>tmax) continue; 
-    if (_wform[i]>_max) {
-      _max=_wform[i];
-      _peak=i;  // sample number for peak
-    }
-  }
+  for (int i=0; i<N_PADE_DATA; i++) _wform[i]=wform[i];
+  GetMax(_wform,_max,_peak);
   Double_t p,s;
   GetPedestal(p,s);
   _ped=p;
   _pedsigma=s;
 }
 
-void PadeChannel::GetHist(TH1F *h){
+void PadeChannel::GetHist(TH1F *h) const{
   TString ti;
   ti.Form("Event %d : Board %d, channel %d;Sample;ADC Counts",
 	  _eventnum, GetBoardID(),GetChannelNum());
@@ -91,7 +80,7 @@ void PadeChannel::GetHist(TH1F *h){
 
 /////
 
-TH1F* PadeChannel::MakeHist(){
+TH1F* PadeChannel::MakeHist() const{
   TH1F* h = new TH1F();
   GetHist(h);
   return h;
@@ -100,65 +89,95 @@ TH1F* PadeChannel::MakeHist(){
 
 
 
-void PadeChannel::GetXYZ(double &x, double &y, double &z){
+void PadeChannel::GetXYZ(double &x, double &y, double &z) const{
   Mapper *mapper=Mapper::Instance(_ts);
   mapper->ChannelXYZ(GetChannelID(),x,y,z);
 }
 
 // trivial pedistal estimation
-void PadeChannel::GetPedestal(double &ped, double &stdev){
+void PadeChannel::GetPedestal(double &ped, double &stdev) const{
+  GetPedestal(_wform,ped,stdev);
+}
+
+void PadeChannel::GetPedestal(const UShort_t *wform, double &ped, double &stdev){
   const int nsamples=10;
   double sum=0;
   double sum2=0;
-  for (int i=0;i<PADE_PED_SAMPLES;i++) {sum+=_wform[i]; sum2+=_wform[i]*_wform[i];}
+  for (int i=0;i<PADE_PED_SAMPLES;i++) {sum+=wform[i]; sum2+=wform[i]*wform[i];}
   ped=sum/PADE_PED_SAMPLES;
   double var =  1.0/(nsamples-1) * (sum2-sum*sum/PADE_PED_SAMPLES);
   stdev = TMath::Sqrt(var);
 }
 
+void PadeChannel::GetMax(const UShort_t *wform, UInt_t &max, Int_t &peak){
+  // range to search for signal peaks
+  const int tmin=15;
+  const int tmax=40;
+  max=0;
+  peak=0;
+  // max/min from start of data (not samples)
+  for (int i=tmin+1; i<=tmax; i++) {
+    if (wform[i]>max) {
+      max=wform[i];
+      peak=i;  // sample number for peak
+    }
+  }
+}
+
 
-Int_t PadeChannel::GetChannelIndex(){
+Int_t PadeChannel::GetChannelIndex() const{
   Mapper *mapper=Mapper::Instance(_ts);
   return mapper->ChannelID2ChannelIndex(GetChannelID());
 }
 
-PulseFit PadeChannel::FitPulse(PadeChannel *pc){ 
-  static bool first=true; 
-  static TF1 *funcB1;
-  static TF1 *funcB2;
-  static TF1 *funcL1;
-  static TF1 *funcL2;
+// pulse shapes of each epoch for beam (regular, odd channels) and laser data (regular, odd channels)
+static const int PULSE_SHAPES[PadeChannel::N_SHAPE_EPOCHS][PadeChannel::kNShapeClasses]={
+  {kPulseShapeA, kPulseShapeA, kLaserShapeA, kLaserShapeA},  // <= PULSESHAPE_T1
+  {kPulseShapeB, kPulseShapeC, kLaserShapeB, kLaserShapeB},  // <= PULSESHAPE_T2
+  {kPulseShapeB, kPulseShapeB, kLaserShapeB, kLaserShapeB},  // <= PULSESHAPE_T3
+  {kPulseShapeB, kPulseShapeD, kLaserShapeB, kLaserShapeB},  // <= PULSESHAPE_T4
+  {kPulseShapeB, kPulseShapeB, kLaserShapeB, kLaserShapeB}   // after PULSESHAPE_T4
+};
+
+Int_t PadeChannel::ShapeEpoch(ULong64_t ts){
+  if(ts<=TBEvent::PULSESHAPE_T1) return 0;
+  if(ts<=TBEvent::PULSESHAPE_T2) return 1;
+  if(ts<=TBEvent::PULSESHAPE_T3) return 2;
+  if(ts<=TBEvent::PULSESHAPE_T4) return 3;
+  return 4;
+}
+
+// channels 2,3,6,7 of board 3 have a different pulse shape
+Int_t PadeChannel::ShapeClass(Int_t channelIndex, Bool_t laser){
+  int brd = channelIndex / 32;
+  int chn = (channelIndex % 32) / 4;
+  bool odd = brd==3 && (chn==2 || chn==3 || chn==6 || chn==7);
+  if (laser) return odd ? kShapeLaserOdd : kShapeLaser;
+  return odd ? kShapeOdd : kShapeRegular;
+}
+
+Int_t PadeChannel::PulseShape(ULong64_t ts, Int_t channelIndex, Bool_t laser){
+  return PULSE_SHAPES[ShapeEpoch(ts)][ShapeClass(channelIndex,laser)];
+}
+
+// MINUIT unless the template fit is switched on, see SetTemplateFit
+PulseFit PadeChannel::FitPulse(const PadeChannel *pc){
+  if (_templateFit) return FitPulseTemplate(pc);
+  return FitPulseMinuit(pc);
+}
+
+// the templates are prebuilt, a PulseFitter per call is cheap and keeps the fit reentrant
+// the overlay TF1s are shared, see PadeChannel.h
+PulseFit PadeChannel::FitPulseTemplate(const PadeChannel *pc){
+  static bool first=true;
+  static TF1 *funcs[kNPulseShapes];
   if (first){
-    if(pc->GetTimeStamp()<=TBEvent::PULSESHAPE_T1){
-      funcB1 = new TF1("funcB1", funcPulseA, 0.0, 120.0, 3);
-      funcB2 = new TF1("funcB2", funcPulseA, 0.0, 120.0, 3);
-      funcL1 = new TF1("funcL1", funcPulseLaserA, 0.0, 120.0, 3);
-      funcL2 = new TF1("funcL2", funcPulseLaserA, 0.0, 120.0, 3);
-    }else if(pc->GetTimeStamp()<=TBEvent::PULSESHAPE_T2){
-      funcB1 = new TF1("funcB1", funcPulseB, 0.0, 120.0, 3);
-      funcB2 = new TF1("funcB2", funcPulseC, 0.0, 120.0, 3);
-      funcL1 = new TF1("funcL1", funcPulseLaserB, 0.0, 120.0, 3);
-      funcL2 = new TF1("funcL2", funcPulseLaserB, 0.0, 120.0, 3);
-    }else if(pc->GetTimeStamp()<=TBEvent::PULSESHAPE_T3){
-      funcB1 = new TF1("funcB1", funcPulseB, 0.0, 120.0, 3);
-      funcB2 = new TF1("funcB2", funcPulseB, 0.0, 120.0, 3);
-      funcL1 = new TF1("funcL1", funcPulseLaserB, 0.0, 120.0, 3);
-      funcL2 = new TF1("funcL2", funcPulseLaserB, 0.0, 120.0, 3);
-    }else if(pc->GetTimeStamp()<=TBEvent::PULSESHAPE_T4){
-      funcB1 = new TF1("funcB1", funcPulseB, 0.0, 120.0, 3);
-      funcB2 = new TF1("funcB2", funcPulseD, 0.0, 120.0, 3);
-      funcL1 = new TF1("funcL1", funcPulseLaserB, 0.0, 120.0, 3);
-      funcL2 = new TF1("funcL2", funcPulseLaserB, 0.0, 120.0, 3);
-    }else{
-      funcB1 = new TF1("funcB1", funcPulseB, 0.0, 120.0, 3);
-      funcB2 = new TF1("funcB2", funcPulseB, 0.0, 120.0, 3);
-      funcL1 = new TF1("funcL1", funcPulseLaserB, 0.0, 120.0, 3);
-      funcL2 = new TF1("funcL2", funcPulseLaserB, 0.0, 120.0, 3);
+    TString name;
+    for (int i=0; i<kNPulseShapes; i++){
+      name.Form("funcPulseTemplate%d",i);
+      funcs[i] = new TF1(name, GetPulseShapeFunc(i), 0.0, 120.0, 3);
+      funcs[i]->SetNpx(10*N_PADE_SAMPLES);
     }
-    funcB1->SetNpx(10*N_PADE_SAMPLES);
-    funcB2->SetNpx(10*N_PADE_SAMPLES);
-    funcL1->SetNpx(10*N_PADE_SAMPLES);
-    funcL2->SetNpx(10*N_PADE_SAMPLES);
     first=false;
   }
   PulseFit result;
@@ -169,20 +188,58 @@ PulseFit PadeChannel::FitPulse(PadeChannel *pc){
   result.status     = -1;
   if (!pc) return result;
 
-  bool chanOdd = false;
-  int brd = pc->GetChannelIndex() / 32;
-  int chn = (pc->GetChannelIndex() % 32) / 4;
-  if(brd==3 && (chn==2 || chn==3 || chn==6 || chn==7)) chanOdd = true;
+  int shape=PulseShape(pc->GetTimeStamp(),pc->GetChannelIndex(),pc->LaserData());
+  PulseFitter fitter(PulseTemplate::Get(shape));
+  pc->GetPedestal(result.pedestal,result.noise);
+  fitter.Fit(pc->GetWform(),N_PADE_SAMPLES,result);
 
-  TF1 *func;
-  if(chanOdd){
-    pc->LaserData() ? func=funcL2 : func=funcB2;
-  }else{
-    pc->LaserData() ? func=funcL1 : func=funcB1;
-  }
+  // function for overlays on GetHist, par[0] is the pedestal of the peak
+  // fit as for the MINUIT fit, not result.pedestal
+  TF1 *func=funcs[shape];
+  func->SetParameters( fitter.PeakPedestal(), result.aMaxValue, result.tRiseValue );
+  result.func = *func;
+  return result;
+}
+
+
+// Original fit w/ TH1::Fit/MINUIT
+PulseFit PadeChannel::FitPulseMinuit(const PadeChannel *pc){ 
+  PulseFit result;
+  result.aMaxValue  = 0.;
+  result.aMaxError  = 0.;
+  result.tRiseValue = 0.;
+  result.tRiseError = 0.;
+  result.status     = -1;
+  if (!pc) return result;
   pc->GetPedestal(result.pedestal,result.noise);
-  UShort_t* a=pc->GetWform();
-  for(int i=5; i<80; i++){
+  FitPulseMinuit(pc->GetWform(),N_PADE_SAMPLES,
+		 PulseShape(pc->GetTimeStamp(),pc->GetChannelIndex(),pc->LaserData()),result);
+  return result;
+}
+
+// TH1::Fit and the TF1s are shared, call from one thread only
+void PadeChannel::FitPulseMinuit(const UShort_t *a, Int_t nsamples, Int_t shape, PulseFit &result){ 
+  static bool first=true; 
+  static TF1 *funcs[kNPulseShapes];
+  if (first){
+    TString name;
+    for (int i=0; i<kNPulseShapes; i++){
+      name.Form("funcPulseMinuit%d",i);
+      funcs[i] = new TF1(name, GetPulseShapeFunc(i), 0.0, 120.0, 3);
+      funcs[i]->SetNpx(10*N_PADE_SAMPLES);
+    }
+    first=false;
+  }
+  result.aMaxValue  = 0.;
+  result.aMaxError  = 0.;
+  result.tRiseValue = 0.;
+  result.tRiseError = 0.;
+  result.status     = -1;
+  if (!a) return;
+  nsamples=TMath::Min(nsamples,(Int_t)N_PADE_DATA);
+
+  TF1 *func=funcs[shape];
+  for(int i=5; i<TMath::Min(nsamples,80); i++){
     if(fabs(a[i] - result.pedestal) >= fabs(result.aMaxValue)){
       result.aMaxValue  = a[i] - result.pedestal;
       result.tRiseValue = i - 1.0;
@@ -202,12 +259,9 @@ PulseFit PadeChannel::FitPulse(PadeChannel *pc){
   // The difference will be for events without visible signal that we don't care anyways
 
   TH1F h;
-  pc->GetHist(&h);
-  if(chanOdd){
-    pc->LaserData() ? result.status = h.Fit("funcL2", "BQW") : result.status = h.Fit("funcB2", "BQW");
-  }else{
-    pc->LaserData() ? result.status = h.Fit("funcL1", "BQW") : result.status = h.Fit("funcB1", "BQW");
-  }
+  h.SetBins(nsamples,-0.5,nsamples-0.5);
+  for (int i=0; i<nsamples; i++) h.SetBinContent(i+1,a[i]);
+  result.status = h.Fit(func, "BQW");
   result.aMaxValue  = func->GetParameter(1);
   result.aMaxError  = func->GetParError(1);
   result.tRiseValue = func->GetParameter(2);
@@ -223,17 +277,7 @@ PulseFit PadeChannel::FitPulse(PadeChannel *pc){
   //  func->FixParameter(0, result.pedestal);
   //  func->FixParameter(1, result.aMaxValue);
   //  func->FixParameter(2, result.tRiseValue);
-  if(chanOdd){
-    if (pc->LaserData())
-      h.Fit("funcL2", "BQW", "", result.tRiseValue - 10.0, result.tRiseValue + 4.0 );
-    else
-      h.Fit("funcB2", "BQW", "", result.tRiseValue - 10.0, result.tRiseValue + 4.0 );
-  }else{
-    if (pc->LaserData())
-      h.Fit("funcL1", "BQW", "", result.tRiseValue - 10.0, result.tRiseValue + 4.0 );
-    else
-      h.Fit("funcB1", "BQW", "", result.tRiseValue - 10.0, result.tRiseValue + 4.0 );
-  }
+  h.Fit(func, "BQW", "", result.tRiseValue - 10.0, result.tRiseValue + 4.0 );
   result.aMaxValue  = func->GetParameter(1);
   result.aMaxError  = func->GetParError(1);
   result.tRiseValue = func->GetParameter(2);
@@ -248,7 +292,7 @@ PulseFit PadeChannel::FitPulse(PadeChannel *pc){
   double sum0 = 0.;
   double sum1 = 0.;
   double sum2 = 0.;
-  for(int i=0; i<(result.tRiseValue - 2.5); i++){
+  for(int i=0; i<(result.tRiseValue - 2.5) && i<nsamples; i++){
     sum0 += 1.0;
     sum1 += a[i];
     sum2 += a[i] * a[i];
@@ -262,13 +306,11 @@ PulseFit PadeChannel::FitPulse(PadeChannel *pc){
     result.chi2       /= rms * rms;
     result.chi2Peak   /= rms * rms;
   }
-
-  return result;
 }
 
 
 
-TF1 PadeChannel::FitPulseFunc(PadeChannel *pc){ 
+TF1 PadeChannel::FitPulseFunc(const PadeChannel *pc){ 
   PulseFit fit = PadeChannel::FitPulse(pc);
   return fit.func;
   
@@ -277,7 +319,7 @@ TF1 PadeChannel::FitPulseFunc(PadeChannel *pc){
 
 // WARNING: not really calibrated!  Just PED subtracted
 // kept around for compatibility w/ event display
-float PadeChannel::GetMaxCalib(){
+float PadeChannel::GetMaxCalib() const{
   return (_max-GetPedestal());
 }
 
@@ -293,3 +335,4 @@ int PadeChannel::GetPorch(ULong64_t ts) const{
 void PadeChannel::SetAsLaser() {_status|=kLaser;}
 
 Int_t PadeChannel::N_PADE_SAMPLES=PadeChannel::N_PADE_DATA;
+Bool_t PadeChannel::_templateFit=kFALSE;
@@ -0,0 +1,262 @@
+#include "PulseFitter.h"
+#include "TMath.h"
+
+// parameter limits and fit ranges of PadeChannel::FitPulseMinuit
+static const double PED_MIN=1.e+0;
+static const double PED_MAX=1.e+4;
+static const double AMP_MAX=1.e+4;
+static const double TRISE_MIN=5.e+0;
+static const double TRISE_MAX=8.e+1;
+static const double PEAK_TRISE_RANGE=1.0;  // +- range of tRise in peak region fit
+static const double PEAK_BEFORE=10.0;      // peak region is [tRise-10,tRise+4]
+static const double PEAK_AFTER=4.0;
+
+const double PulseFitter::SCAN_STEP=0.5;
+const double PulseFitter::NEWTON_STEP=1.0/16;
+const double PulseFitter::TOLERANCE=1.e-3;
+
+
+PulseTemplate::PulseTemplate(int shape, int nstep) :
+  _shape(shape), _xmin(0), _xmax(0), _scale(nstep){
+  const double *x, *y;
+  int n=GetPulseShapeTable(shape,x,y);
+  if (n<2) return;   // unknown shape, == 0
+  _x.assign(x,x+n);
+  _y.assign(y,y+n);
+  _slope.resize(n-1);
+  for (int i=0; i<n-1; i++) _slope[i]=(y[i+1]-y[i])/(x[i+1]-x[i]);
+  _xmin=x[0];
+  _xmax=x[n-1];
+  int npts=(int)((_xmax-_xmin)*_scale)+1;
+  _seg.resize(npts);
+  int j=0;
+  for (int i=0; i<npts; i++){
+    double xi=_xmin+i/_scale;
+    while ( j<n-2 && x[j+1]<=xi ) j++;
+    _seg[i]=j;
+  }
+}
+
+const PulseTemplate* PulseTemplate::Get(int shape){
+  static bool first=true;
+  static PulseTemplate *templates[kNPulseShapes];
+  if (first){
+    for (int i=0; i<kNPulseShapes; i++) templates[i]=new PulseTemplate(i);
+    first=false;
+  }
+  if (shape<0 || shape>=kNPulseShapes) return 0;
+  return templates[shape];
+}
+
+// build the templates when the library is loaded, Get is then safe in threads
+static const PulseTemplate *gTemplateA=PulseTemplate::Get(kPulseShapeA);
+
+// samples in the fit range [xmin,xmax], selected as TH1::Fit selects the bins of
+// PadeChannel::GetHist (nsamples bins of width 1 from -0.5): the bins containing
+// xmin and xmax (TAxis::FindFixBin, under/overflow to the first/last bin), minus
+// an edge bin whose centre is outside the range
+static void FitRange(double xmin, double xmax, int nsamples, int &first, int &last){
+  const double axmin=-0.5;
+  const double axmax=nsamples-0.5;
+  const double width=(axmax-axmin)/nsamples;
+  first=0;
+  last=nsamples-1;
+  if (xmin>=axmin) first=TMath::Min((int)(nsamples*(xmin-axmin)/(axmax-axmin)),nsamples-1);
+  if (xmax<axmax) last=TMath::Max((int)(nsamples*(xmax-axmin)/(axmax-axmin)),0);
+  if (axmin+(first+0.5)*width<xmin) first++;
+  if (axmin+(last+0.5)*width>xmax) last--;
+}
+
+
+// chi2 at fixed tRise, w/ pedestal and amplitude from the linear least squares solution
+double PulseFitter::Chi2(double t, double &ped, double &amp) const{
+  double ss=0;
+  double sss=0;
+  double sys=0;
+  for (int i=_first; i<=_last; i++){
+    double s=_w[i]*_shape->Eval(i-t);
+    ss+=s;
+    sss+=s*s;
+    sys+=s*_y[i];
+  }
+  double det=_sw*sss-ss*ss;
+  if (det>0){
+    ped=(_sy*sss-ss*sys)/det;
+    amp=(_sw*sys-ss*_sy)/det;
+  }
+  else {  // no pulse in range
+    ped=_sy/_sw;
+    amp=0;
+  }
+  // solution outside the limits: fix the parameter at its limit, solve for the other one
+  if (ped<PED_MIN || ped>PED_MAX){
+    ped=TMath::Min(TMath::Max(ped,PED_MIN),PED_MAX);
+    if (sss>0) amp=(sys-ped*ss)/sss;
+  }
+  if (amp<-AMP_MAX || amp>AMP_MAX){
+    amp=TMath::Min(TMath::Max(amp,-AMP_MAX),AMP_MAX);
+    ped=TMath::Min(TMath::Max((_sy-amp*ss)/_sw,PED_MIN),PED_MAX);
+  }
+  double chi2=_syy-2*ped*_sy-2*amp*sys+ped*ped*_sw+2*ped*amp*ss+amp*amp*sss;
+  return TMath::Max(chi2,0.);
+}
+
+
+// fit of samples [first,last], tRise in [tmin,tmax], returns status (0 or 4)
+int PulseFitter::Minimize(int first, int last, double tmin, double tmax,
+			  double &ped, double &amp, double &t, double &ampErr, double &tErr,
+			  double &chi2, double &ndof){
+  _first=TMath::Max(first,0);
+  _last=last;
+  _sw=0;
+  _sy=0;
+  _syy=0;
+  for (int i=_first; i<=_last; i++){
+    _sw+=_w[i];
+    _sy+=_y[i];
+    _syy+=_y[i]*_y[i];
+  }
+  ampErr=0;
+  tErr=0;
+  ndof=_sw-3;
+  if (_sw<3) {   // nothing to fit
+    chi2=0;
+    return 4;
+  }
+
+  // scan chi2(tRise)
+  int nscan=(int)((tmax-tmin)/SCAN_STEP+0.5);
+  double step=0;
+  if (nscan>0) step=(tmax-tmin)/nscan;
+  chi2=-1;
+  for (int k=0; k<=nscan; k++){
+    double p,a;
+    double tk=tmin+k*step;
+    double c=Chi2(tk,p,a);
+    if (chi2<0 || c<chi2){
+      chi2=c;
+      ped=p;
+      amp=a;
+      t=tk;
+    }
+  }
+
+  // Newton steps inside the scan interval around the minimum
+  double lo=TMath::Max(tmin,t-step);
+  double hi=TMath::Min(tmax,t+step);
+  int status=0;
+  if (hi>lo) {
+    status=4;
+    for (int iter=0; iter<MAX_ITER; iter++){
+      double p,a;
+      double cm=Chi2(t-NEWTON_STEP,p,a);
+      double cp=Chi2(t+NEWTON_STEP,p,a);
+      double d1=(cp-cm)/(2*NEWTON_STEP);
+      double d2=(cp-2*chi2+cm)/(NEWTON_STEP*NEWTON_STEP);
+      double tn;
+      if (d2>0) tn=t-d1/d2;
+      else tn = d1>0 ? lo : hi;  // no curvature, go downhill
+      tn=TMath::Min(TMath::Max(tn,lo),hi);
+      double cn=Chi2(tn,p,a);
+      while ( cn>chi2 && TMath::Abs(tn-t)>TOLERANCE ){
+	tn=0.5*(t+tn);
+	cn=Chi2(tn,p,a);
+      }
+      if (cn>chi2) {  // no lower chi2 next to t
+	status=0;
+	break;
+      }
+      bool done=TMath::Abs(tn-t)<TOLERANCE;
+      t=tn;
+      chi2=cn;
+      ped=p;
+      amp=a;
+      if (done) {
+	status=0;
+	break;
+      }
+    }
+  }
+
+  // errors from the inverse of J^T J, J = d(model)/d(ped,amp,t)
+  double a00=0, a01=0, a02=0, a11=0, a12=0, a22=0;
+  for (int i=_first; i<=_last; i++){
+    if (_w[i]==0) continue;
+    double s,ds;
+    _shape->Eval(i-t,s,ds);
+    double jt=-amp*ds;
+    a00+=1;
+    a01+=s;
+    a02+=jt;
+    a11+=s*s;
+    a12+=s*jt;
+    a22+=jt*jt;
+  }
+  double c11=a00*a22-a02*a02;
+  double c22=a00*a11-a01*a01;
+  double det=a00*(a11*a22-a12*a12)-a01*(a01*a22-a12*a02)+a02*(a01*a12-a11*a02);
+  if (det>0){
+    ampErr=TMath::Sqrt(TMath::Max(c11/det,0.));
+    tErr=TMath::Sqrt(TMath::Max(c22/det,0.));
+  }
+  return status;
+}
+
+
+int PulseFitter::Fit(const UShort_t *wform, int nsamples, PulseFit &result){
+  result.aMaxValue  = 0.;
+  result.aMaxError  = 0.;
+  result.tRiseValue = 0.;
+  result.tRiseError = 0.;
+  result.chi2       = 0.;
+  result.ndof       = 0.;
+  result.chi2Peak   = 0.;
+  result.ndofPeak   = 0.;
+  result.status     = -1;
+  _pedPeak=result.pedestal;
+  if (!_shape || !wform) return result.status;
+  nsamples=TMath::Min(nsamples,(int)PadeChannel::N_PADE_DATA);
+  for (int i=0; i<nsamples; i++){
+    _y[i]=wform[i];
+    _w[i]= wform[i]!=0;   // TH1::Fit skips empty bins
+  }
+
+  // full range
+  double ped=result.pedestal;
+  double amp=0;
+  double t=0;
+  result.status=Minimize(0,nsamples-1,TRISE_MIN,TRISE_MAX,ped,amp,t,
+			 result.aMaxError,result.tRiseError,result.chi2,result.ndof);
+  result.aMaxValue  = amp;
+  result.tRiseValue = t;
+
+  // samples around the peak only
+  int first, last;
+  FitRange(t-PEAK_BEFORE,t+PEAK_AFTER,nsamples,first,last);
+  Minimize(first,last,t-PEAK_TRISE_RANGE,t+PEAK_TRISE_RANGE,ped,amp,t,
+	   result.aMaxError,result.tRiseError,result.chi2Peak,result.ndofPeak);
+  result.aMaxValue  = amp;
+  result.tRiseValue = t;
+  _pedPeak=ped;
+
+  // Calculate noise using all available samples before the
+  // signal, scale errors and chisquare as in FitPulseMinuit.
+  double sum0 = 0.;
+  double sum1 = 0.;
+  double sum2 = 0.;
+  for(int i=0; i<(result.tRiseValue - 2.5); i++){
+    sum0 += 1.0;
+    sum1 += _y[i];
+    sum2 += _y[i] * _y[i];
+  }
+  if( sum0 > 1.5 ){
+    double avg = sum1 / sum0;
+    double rms = TMath::Sqrt( sum2 / sum0 - avg * avg );
+    result.noise = rms;
+    result.aMaxError  *= rms;
+    result.tRiseError *= rms;
+    result.chi2       /= rms * rms;
+    result.chi2Peak   /= rms * rms;
+  }
+  return result.status;
+}
@@ -42,6 +42,17 @@ void TBEvent::AddWCHit(UChar_t num, UChar_t wire, UShort_t count){
 // return X hits in a WC (if min/max given, use these to calculate in-time hits)
 vector<WCChannel> TBEvent::GetWChitsX(Int_t nwc, Int_t *min, Int_t* max) const{
   vector<WCChannel> hits;
+  GetWChitsX(nwc,hits,min,max);
+  return hits;
+}
+vector<WCChannel> TBEvent::GetWChitsY(Int_t nwc, Int_t *min, Int_t* max) const{
+  vector<WCChannel> hits;
+  GetWChitsY(nwc,hits,min,max);
+  return hits;
+}
+
+void TBEvent::GetWChitsX(Int_t nwc, vector<WCChannel> &hits, Int_t *min, Int_t* max) const{
+  hits.clear();
   for (unsigned i=0;i<wc.size(); i++){
     Int_t tdc=wc[i].GetTDCNum();
     bool keep = tdc2WC(tdc)==nwc && (tdc-1)%4<2;   // match to chamber
@@ -51,10 +62,9 @@ vector<WCChannel> TBEvent::GetWChitsX(Int_t nwc, Int_t *min, Int_t* max) const{
     }
     if (keep) hits.push_back(wc[i]);
   }
-  return hits;
 }
-vector<WCChannel> TBEvent::GetWChitsY(Int_t nwc, Int_t *min, Int_t* max) const{
-  vector<WCChannel> hits;
+void TBEvent::GetWChitsY(Int_t nwc, vector<WCChannel> &hits, Int_t *min, Int_t* max) const{
+  hits.clear();
   for (unsigned i=0;i<wc.size(); i++){
     Int_t tdc=wc[i].GetTDCNum();
     bool keep = tdc2WC(tdc)==nwc && (tdc-1)%4>1;   // match to chamber
@@ -64,7 +74,6 @@ vector<WCChannel> TBEvent::GetWChitsY(Int_t nwc, Int_t *min, Int_t* max) const{
     }
     if (keep) hits.push_back(wc[i]);  
   }
-  return hits;
 }
 
 
@@ -116,13 +125,13 @@ void TBSpill::Dump() const {
 }
 
 // warning: assume we only deal w/ WC1 and WC2! _tdcnum<=4
-float WCChannel::GetX(){
+float WCChannel::GetX() const{
   if (_tdcNumber==2 || _tdcNumber==6) return (0.5+_tdcWire);
   else if (_tdcNumber==1 || _tdcNumber==5) return -63.5+_tdcWire;
   return -999;  // not an x hit
 }
 
-float WCChannel::GetY(){
+float WCChannel::GetY() const{
   if (_tdcNumber==4 || _tdcNumber==8) return -1.0*(0.5+_tdcWire);
   else if(_tdcNumber==3 || _tdcNumber==7) return 63.5-_tdcWire;
   return -999;  // not a y hit
@@ -20,7 +20,7 @@ static const Int_t CUTAMP_PLV_MIDHIGH300 = 1200;  static const Int_t CUTChi2_PLV
 static const Int_t CUTAMP_PLV_MIDHIGH500 = 1800;  static const Int_t CUTChi2_PLV_MIDHIGH500 = 2000;
 
 
-TBRecHit::TBRecHit(PadeChannel *pc, Float_t zsp, UInt_t options){
+TBRecHit::TBRecHit(const PadeChannel *pc, Float_t zsp, UInt_t options){
   nzsp=zsp;
   if (options&kNoFit) {
     status|=kNoFit;
@@ -39,7 +39,7 @@ TBRecHit::TBRecHit(const TBRecHit &hit, UShort_t idx, UInt_t newstatus) :
   if (idx<=127) channelIndex=idx;
 }
 
-void TBRecHit::Init(PadeChannel *pc,  Float_t zsp){
+void TBRecHit::Init(const PadeChannel *pc,  Float_t zsp){
   channelIndex=-1;
   maxADC=-1;
   pedestal=-999;
@@ -89,12 +89,25 @@ void TBRecHit::GetModuleFiber(int &moduleID, int &fiberID) const{
   mapper->ChannelIndex2ModuleFiber(channelIndex,moduleID,fiberID); // result independent of run epoch
 }
 
-void TBRecHit::FitPulse(PadeChannel *pc){
-  if ( TMath::Abs(maxADC-pedestal) / (noise+0.001) < nzsp ) { // avoid div by 0
+void TBRecHit::Set(UShort_t idx, ULong64_t timestamp, UShort_t max, Float_t ped, Float_t sig, Float_t zsp){
+  Init(0,zsp);
+  channelIndex=idx;
+  ts=timestamp;
+  maxADC=max;
+  pedestal=ped;
+  noise=sig;
+  if ( BelowZSP(maxADC,pedestal,noise,nzsp) ) status|=kZSP;
+}
+
+void TBRecHit::FitPulse(const PadeChannel *pc){
+  if ( BelowZSP(maxADC,pedestal,noise,nzsp) ) {
     status|=kZSP;
     return;
   }
-  PulseFit fit=PadeChannel::FitPulse(pc);
+  SetFit(PadeChannel::FitPulse(pc));
+}
+
+void TBRecHit::SetFit(const PulseFit &fit){
   pedestal=fit.pedestal;
   noise=fit.noise;
   aMaxValue=fit.aMaxValue;
@@ -103,6 +116,9 @@ void TBRecHit::FitPulse(PadeChannel *pc){
   tRiseError=fit.tRiseError;
   chi2=fit.chi2Peak;
   ndof=fit.ndofPeak;
+  // fit.status, MINUIT: status of TH1::Fit, >0 failed or not converged
+  // template fit (PulseFitter): 0 ok, 4 too few non-zero samples, -1 no template
+  // -1 (no fit done) is not flagged, as for MINUIT
   if (fit.status>0) status|=kPoorFit;
 }
 
@@ -130,7 +146,7 @@ void TBRecHit::Calibrate(vector<TBRecHit> *rechits, float *calconstants){
 
 
 
-Bool_t TBRecHit::GoodPulse(PadeChannel* pc, UShort_t pga, UShort_t lna, ULong_t vga) {
+Bool_t TBRecHit::GoodPulse(const PadeChannel* pc, UShort_t pga, UShort_t lna, ULong_t vga) {
 
   bool isGood_ = true;
   double max = 9999; double chi2 = 99999; double ndof = 1;
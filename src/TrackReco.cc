@@ -33,10 +33,10 @@ int TrackReco::Process(TTree *rawTree, TTree *recTree){
     rawTree->GetEntry(i);
     tracks->clear();
 
-    hitsX1=event->GetWChitsX(1,tLow_,tHigh_);   // fetch x,y hits in chambers 1 and 2
-    hitsY1=event->GetWChitsY(1,tLow_,tHigh_);   // only selecting in-time hits
-    hitsX2=event->GetWChitsX(2,tLow_,tHigh_);
-    hitsY2=event->GetWChitsY(2,tLow_,tHigh_);
+    event->GetWChitsX(1,hitsX1,tLow_,tHigh_);   // fetch x,y hits in chambers 1 and 2
+    event->GetWChitsY(1,hitsY1,tLow_,tHigh_);   // only selecting in-time hits
+    event->GetWChitsX(2,hitsX2,tLow_,tHigh_);
+    event->GetWChitsY(2,hitsY2,tLow_,tHigh_);
 
     for(unsigned h1=0; h1<hitsX1.size(); ++h1){ // loop over X1 
       for(unsigned h2=0; h2<hitsY1.size(); ++h2){ // loop over Y1
@@ -141,10 +141,10 @@ void WCPlanes::Draw(TBEvent* event, TBSpill* spill, std::vector<TBRecHit>* rechi
   util.y2hit = 64;
   GetWCMeans("meanfile.txt", tLow, mean, tHigh);
 
-  hitsX1=event->GetWChitsX(1,tLow,tHigh);   // fetch x,y hits in chambers 1 and 2
-  hitsY1=event->GetWChitsY(1,tLow,tHigh);   // only selecting in-time hits
-  hitsX2=event->GetWChitsX(2,tLow,tHigh);
-  hitsY2=event->GetWChitsY(2,tLow,tHigh);
+  event->GetWChitsX(1,hitsX1,tLow,tHigh);   // fetch x,y hits in chambers 1 and 2
+  event->GetWChitsY(1,hitsY1,tLow,tHigh);   // only selecting in-time hits
+  event->GetWChitsX(2,hitsX2,tLow,tHigh);
+  event->GetWChitsY(2,hitsY2,tLow,tHigh);
   
   cout << "length of tracks is"<< tracks->size()<<endl;
   if (util.showRecTracks)
@@ -0,0 +1,123 @@
+#include "WaveReco.h"
+#include <string.h>
+#include <iostream>
+
+using std::cerr;
+using std::endl;
+
+const int WaveReco::MIN_SAMPLES;
+
+
+int WaveReco::Reconstruct(const TBEvent *event){
+  Load(event);
+  return Reconstruct();
+}
+
+int WaveReco::Load(const TBEvent *event){
+  const int stride=PadeChannel::N_PADE_DATA;
+  int nrows=event->NPadeChan();
+  _samples.resize(nrows*stride);
+  _index.resize(nrows);
+  _laser.resize(nrows);
+  _ts.resize(nrows);
+  for (int i=0; i<nrows; i++){
+    const PadeChannel &pc=event->GetPadeChan(i);
+    memcpy(&_samples[i*stride],pc.GetWform(),stride*sizeof(UShort_t));
+    _index[i]=pc.GetChannelIndex();
+    _laser[i]=pc.LaserData();
+    _ts[i]=pc.GetTimeStamp();
+  }
+  Resize(nrows);
+  return nrows;
+}
+
+int WaveReco::Reconstruct(){
+  int nrows=_index.size();
+  if (nrows==0) return ReconstructRows(0,0,PadeChannel::N_PADE_SAMPLES,PadeChannel::N_PADE_DATA);
+  return ReconstructRows(&_samples[0],nrows,PadeChannel::N_PADE_SAMPLES,PadeChannel::N_PADE_DATA);
+}
+
+int WaveReco::Reconstruct(const UShort_t *samples, int nrows, int nsamples, int stride,
+			  const Int_t *channelIndex, const Int_t *laser, ULong64_t ts){
+  if (nsamples<MIN_SAMPLES || stride<nsamples){
+    cerr << "WaveReco: need " << MIN_SAMPLES << " <= nsamples <= stride, got nsamples="
+	 << nsamples << " stride=" << stride << endl;
+    Resize(0);
+    _index.clear();
+    _laser.clear();
+    _ts.clear();
+    return -1;
+  }
+  _index.assign(channelIndex,channelIndex+nrows);
+  _laser.assign(laser,laser+nrows);
+  _ts.assign(nrows,ts);
+  Resize(nrows);
+  return ReconstructRows(samples,nrows,nsamples,stride);
+}
+
+// allocate outside of ReconstructRows, which may run in a thread
+void WaveReco::Resize(int nrows){
+  _ped.resize(nrows);
+  _noise.resize(nrows);
+  _max.resize(nrows);
+  _peak.resize(nrows);
+  _hits.resize(nrows);
+}
+
+// rows w/ _index, _laser, _ts set
+int WaveReco::ReconstructRows(const UShort_t *samples, int nrows, int nsamples, int stride){
+  // sample statistics, as in PadeChannel::Fill
+  for (int i=0; i<nrows; i++){
+    const UShort_t *wform=samples+i*stride;
+    PadeChannel::GetPedestal(wform,_ped[i],_noise[i]);
+    PadeChannel::GetMax(wform,_max[i],_peak[i]);
+  }
+
+  // zero suppression and pulse fits, as in TBRecHit::Init
+  int nhits=0;
+  for (int i=0; i<nrows; i++){
+    TBRecHit &hit=_hits[i];
+    hit.Set(_index[i],_ts[i],_max[i],_ped[i],_noise[i],_nSigmaCut);
+    if (hit.Status() & TBRecHit::kZSP) continue;
+    int shape=PadeChannel::PulseShape(_ts[i],_index[i],_laser[i]);
+    _fit.pedestal=_ped[i];
+    _fit.noise=_noise[i];
+    if (PadeChannel::TemplateFit()){
+      _fitter.SetShape(PulseTemplate::Get(shape));
+      _fitter.Fit(samples+i*stride,nsamples,_fit);
+    }
+    else PadeChannel::FitPulseMinuit(samples+i*stride,nsamples,shape,_fit);
+    hit.SetFit(_fit);
+    nhits++;
+  }
+  return nhits;
+}
+
+void WaveReco::GetTable(Float_t *out) const{
+  for (unsigned i=0; i<_hits.size(); i++){
+    const TBRecHit &hit=_hits[i];
+    Float_t *row=out+i*kNColumns;
+    row[kPedestal]=hit.Pedestal();
+    row[kNoise]=hit.NoiseRMS();
+    row[kMaxADC]=hit.MaxADC();
+    row[kPeak]=_peak[i];
+    row[kAMax]=hit.AMax();
+    row[kAMaxError]=hit.AMaxError();
+    row[kTRise]=hit.TRise();
+    row[kTRiseError]=hit.TRiseError();
+    row[kChi2]=hit.Chi2();
+    row[kNdof]=hit.Ndof();
+    row[kStatus]=hit.Status();
+  }
+}
+
+int WaveReco::Process(const TBEvent *event, vector<TBRecHit> &rechits){
+  Reconstruct(event);
+  int nhits=0;
+  for (unsigned i=0; i<_hits.size(); i++){
+    if (_hits[i].Status() & TBRecHit::kZSP) continue;
+    rechits.push_back(_hits[i]);
+    nhits++;
+  }
+  return nhits;
+}
@@ -114,6 +114,27 @@ double funcPulseLaserB(double *x, double *par){
   return par[0] + par[1] * pulseItp->Eval( x[0] - par[2] );
 }
 		
+int GetPulseShapeTable(int shape, const double *&x, const double *&y){
+  switch (shape) {
+  case kPulseShapeA: x=PulseShapeAx; y=PulseShapeAy; return NPointsPulseShapeA;
+  case kPulseShapeB: x=PulseShapeBx; y=PulseShapeBy; return NPointsPulseShapeB;
+  case kPulseShapeC: x=PulseShapeCx; y=PulseShapeCy; return NPointsPulseShapeC;
+  case kPulseShapeD: x=PulseShapeDx; y=PulseShapeDy; return NPointsPulseShapeD;
+  case kLaserShapeA: x=LaserPulseShapeAx; y=LaserPulseShapeAy; return NPointsLaserShapeA;
+  case kLaserShapeB: x=LaserPulseShapeBx; y=LaserPulseShapeBy; return NPointsLaserShapeB;
+  }
+  x=0;
+  y=0;
+  return 0;
+}
+
+PulseShapeFunc GetPulseShapeFunc(int shape){
+  static const PulseShapeFunc funcs[kNPulseShapes]={
+    funcPulseA, funcPulseB, funcPulseC, funcPulseD, funcPulseLaserA, funcPulseLaserB};
+  if (shape<0 || shape>=kNPulseShapes) return 0;
+  return funcs[shape];
+}
+
 std::ostream& operator<<(std::ostream& s, const PulseFit& f){
   return s<<"FIT RESULT==> pedestal: "<< f.pedestal << " noise: " <<  f.noise 
 	  << " AMax: " << f.aMaxValue << " TRise: " << f.tRiseValue << "\n"